@@ -0,0 +1,105 @@
+# ===========================================================================
+#                            Benchmark: Body Reader
+# ===========================================================================
+# Compares the BodyBuffer reader of the DefaultScraper against the former
+# loop over iter_content(1024) which appended every chunk to a list and
+# joined them at the end. A local HTTP server sends pages of several sizes,
+# with and without a Content-Length header. Run from the scraping_threaded
+# directory:
+#
+#   python -m benchmarks.body_reader
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from scraper.default import DefaultScraper
+from schemas.results import ScrapingResult
+from threading import Thread
+from time import perf_counter
+import requests
+import logging
+import click
+import time
+
+
+class PageHandler(BaseHTTPRequestHandler):
+    """Serves /<size>/<length|chunked> with a body of `size` bytes"""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        _, size, mode = self.path.split("/")
+        body = (b"<p>" + b"x" * 96 + b"</p>\n") * (int(size) // 104)
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        if mode == "length":
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for i in range(0, len(body), 65_536):
+                part = body[i:i + 65_536]
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(part), part))
+            self.wfile.write(b"0\r\n\r\n")
+
+    def log_message(self, *args):
+        pass
+
+
+def legacyGet(session, url, chunk_size=1024, max_download_time=300):
+    """Body reader as it was before the BodyBuffer"""
+
+    request = session.get(url, stream=True, timeout=5)
+    content_size = 0
+    start_time = time.time()
+    chunks = []
+    for chunk in request.iter_content(chunk_size):
+        if time.time() - start_time > max_download_time:
+            raise Exception("Response takes too long to download!")
+        content_size += len(chunk)
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+def throughput(function, url, size, repeat):
+    """Returns MB per second"""
+    start = perf_counter()
+    for _ in range(repeat):
+        function(url)
+    return size * repeat / (perf_counter() - start) / 1e6
+
+
+# fmt: off
+@click.command()
+@click.option("--port", default=8765, help="Port of the local test server")
+@click.option("--repeat", default=10, help="Requests per page size")
+# fmt: on
+def main(port, repeat):
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), PageHandler)
+    Thread(target=server.serve_forever, daemon=True).start()
+
+    session = requests.Session()
+    scraper = DefaultScraper("bench", logging.getLogger("bench"), user_agent="bench")
+
+    click.echo(f"{'size':>10} {'mode':>8} {'before MB/s':>12} {'after MB/s':>12} {'speedup':>8}")
+    for size in [100_000, 1_000_000, 10_000_000, 40_000_000]:
+        for mode in ["length", "chunked"]:
+            url = f"http://127.0.0.1:{port}/{size}/{mode}"
+
+            before = throughput(lambda u: legacyGet(session, u), url, size, repeat)
+            after = throughput(
+                lambda u: scraper.get(ScrapingResult(target_url=u)), url, size, repeat)
+
+            # Both readers have to return the same body
+            expected = legacyGet(session, url)
+            assert scraper.get(ScrapingResult(target_url=url)).content == expected
+
+            click.echo(f"{size:>10} {mode:>8} {before:>12.1f} {after:>12.1f} {after / before:>7.2f}x")
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
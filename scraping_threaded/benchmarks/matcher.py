@@ -0,0 +1,79 @@
+# ===========================================================================
+#                            Benchmark: Phrase Matcher
+# ===========================================================================
+# Compares check_soup_validity against the original chain of substring
+# scans (still in scraping_support_scripts) and checks that both return
+# the same errors. Run from the scraping_threaded directory:
+#
+#   python -m benchmarks.matcher --path articles.json
+#
+# articles.json only holds article metadata, so the sample pages are built
+# from its titles and URLs. Use --html_dir to benchmark real pages instead.
+
+from scraping_support_scripts import scraping_support_functions as legacy
+from bs4 import BeautifulSoup as bs
+from time import perf_counter
+import scraping_support_functions as ss
+import click
+import json
+import os
+
+
+def samplePages(path: str, page_size: int):
+    """Builds lowercase page texts of roughly `page_size` characters"""
+
+    pages, page = [], []
+    with open(path, "r") as file:
+        for line in file:
+            record = json.loads(line)
+            page.append(f"{record.get('title', '')}\n{record.get('url', '')}")
+            if sum(len(p) for p in page) >= page_size:
+                pages.append("\n".join(page).lower())
+                page = []
+    return pages
+
+
+def htmlPages(path: str):
+    """Returns the lowercase soup text of all HTML files in a directory"""
+
+    pages = []
+    for file_name in sorted(os.listdir(path)):
+        with open(os.path.join(path, file_name), "rb") as file:
+            pages.append(bs(file.read(), "html.parser").text.lower())
+    return pages
+
+
+def timeIt(function, pages, repeat):
+    """Returns the seconds per page and the results of the last round"""
+
+    start = perf_counter()
+    for _ in range(repeat):
+        results = [function(page) for page in pages]
+    return (perf_counter() - start) / (repeat * len(pages)), results
+
+
+# fmt: off
+@click.command()
+@click.option("--path", default="articles.json", help="Articles in JSON lines format")
+@click.option("--html_dir", default=None, help="Directory with HTML pages (overrides --path)")
+@click.option("--page_size", default=20_000, help="Characters per sample page")
+@click.option("--repeat", default=5, help="Number of rounds")
+# fmt: on
+def main(path, html_dir, page_size, repeat):
+
+    pages = htmlPages(html_dir) if html_dir else samplePages(path, page_size)
+    click.echo(f"Pages: {len(pages)}, "
+               f"avg. characters: {sum(map(len, pages)) // max(len(pages), 1)}")
+
+    before, expected = timeIt(legacy.check_soup_validity, pages, repeat)
+    after, results = timeIt(ss.check_soup_validity, pages, repeat)
+
+    mismatches = sum(a != b for a, b in zip(expected, results))
+    click.echo(f"Substring scans: {before * 1e3:8.3f} ms/page")
+    click.echo(f"Automaton:       {after * 1e3:8.3f} ms/page")
+    click.echo(f"Speedup:         {before / after:8.2f}x")
+    click.echo(f"Mismatches:      {mismatches:8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+# ===========================================================================
+#                            Benchmark: Parsing
+# ===========================================================================
+# Compares the text extraction of extract_text.py against the original
+# pipeline (still in scraping_support_scripts), which parses a page with
+# BeautifulSoup and again with lxml for every site rule that reads JSON.
+# Reports pages per second and the pages whose output differs. Run from
+# the scraping_threaded directory:
+#
+#   python -m benchmarks.parsing
+#
+# The fixture corpus covers the site rules. Use --html_dir to benchmark
+# real pages instead (file names are used as URLs).
+
+from scraping_support_scripts import scraping_support_functions as legacy
+from bs4 import BeautifulSoup as bs
+from extract_text import extractText
+from time import perf_counter
+import click
+import json
+import os
+
+# The original module uses BeautifulSoup without importing it
+legacy.bs = bs
+
+
+def legacyExtractText(url, response):
+    """Text extraction as it was before the shared Page"""
+
+    soup = bs(response, "html.parser")
+    error = ""
+
+    valid_soup = legacy.check_soup_validity(soup.text.lower())
+    if valid_soup is not True:
+        error = valid_soup
+
+    alt_scraping = legacy.do_alternative_scraping(url, response, soup)
+    if alt_scraping is not None:
+        error = alt_scraping
+
+    paragraphs = soup.find_all('p')
+    stripped_paragraph = [tag.get_text().strip() for tag in paragraphs]
+
+    if len(stripped_paragraph) == 0 or stripped_paragraph == [""]:
+        error = legacy.handle_empty_ptags(url, soup, response)
+
+    return " ".join(stripped_paragraph), error
+
+
+def fixturePages(path: str):
+    """Returns (url, html) of all records in a JSON lines file"""
+    with open(path, "r") as file:
+        return [(r["url"], r["html"]) for r in map(json.loads, file)]
+
+
+def htmlPages(path: str):
+    """Returns (url, html) of all HTML files in a directory"""
+
+    pages = []
+    for file_name in sorted(os.listdir(path)):
+        with open(os.path.join(path, file_name), "r", errors="replace") as file:
+            pages.append((file_name, file.read()))
+    return pages
+
+
+def runSafe(function, *args):
+    # Site rules raise on unexpected markup; count the exception as output
+    try:
+        return function(*args)
+    except Exception as e:
+        return repr(e)
+
+
+def timeIt(function, pages, repeat):
+    """Returns the pages per second and the results of the last round"""
+
+    start = perf_counter()
+    for _ in range(repeat):
+        results = [runSafe(function, *page) for page in pages]
+    return repeat * len(pages) / (perf_counter() - start), results
+
+
+# fmt: off
+@click.command()
+@click.option("--path", default="benchmarks/fixtures/pages.jsonl", help="Pages in JSON lines format (url, html)")
+@click.option("--html_dir", default=None, help="Directory with HTML pages (overrides --path)")
+@click.option("--repeat", default=20, help="Number of rounds")
+# fmt: on
+def main(path, html_dir, repeat):
+
+    pages = htmlPages(html_dir) if html_dir else fixturePages(path)
+    click.echo(f"Pages: {len(pages)}")
+
+    before, expected = timeIt(legacyExtractText, pages, repeat)
+    click.echo(f"{'Original':12} {before:10.1f} pages/s")
+
+    for parser in ["html.parser", "lxml"]:
+        after, results = timeIt(
+            lambda url, html: extractText(url, html, parser), pages, repeat)
+        mismatches = [url for (url, _), a, b in zip(pages, expected, results)
+                      if a != b]
+        click.echo(f"{parser:12} {after:10.1f} pages/s  "
+                   f"speedup {after / before:5.2f}x  mismatches {len(mismatches)}")
+        for url in mismatches:
+            click.echo(f"    {url}")
+
+
+if __name__ == "__main__":
+    main()
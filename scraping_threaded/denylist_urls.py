@@ -0,0 +1,80 @@
+# ===========================================================================
+#                            Denylist URLs
+# ===========================================================================
+# Marks articles as DENYLISTED whose url alone shows that they can not be
+# scraped (videos, pdfs, outlets which are no longer maintained, archived
+# feeds, ...). scrape_articles.py runs the same check on its task stream,
+# this script does it for a whole batch before scraping.
+
+from collections import Counter
+from tabulate import tabulate
+from time import perf_counter
+from utils.database import *
+import scraping_support_functions as ss
+import click
+
+# ================================= HELPERS ================================
+
+
+def classifyTasks(tasks, db, counts: Counter, writer=None):
+    """Yields the tasks which may be fetched and denylists the others"""
+
+    for task in tasks:
+        reason = ss.classify_url(task["url"])
+        if reason is True:
+            yield task
+        else:
+            denylistTask(db, task["_id"], reason, writer, leaseOwner(task))
+            counts[reason] += 1
+
+# ================================= MAIN ================================
+
+
+# fmt: off
+@click.command()
+@click.option('--status', default="UNPROCESSED", help="Any status (FAILED, UNPROCESSED, etc.)")
+@click.option("--batch", default="all", help="all, first last, or a number indicating the batch")
+@click.option("--limit", default=0, help="Only check first n urls (0 equals no limit)")
+@click.option("--batch_size", default=1000, help="Number of tasks fetched per database round trip")
+@click.option("--bulk_size", default=500, help="Buffer n task updates per bulk write")
+@click.option("--dry_run", is_flag=True, help="Only count the urls which would be denylisted")
+# fmt: on
+def main(status, batch, limit, batch_size, bulk_size, dry_run):
+
+    timer_start = perf_counter()
+
+    # Connect to database
+    _, db = getConnection(use_dotenv=True)
+    batch_id = getBatchID(db, batch)
+
+    # Only the url is needed for the classification
+    tasks = fetchTasks(db, batch_id, status, limit, {'url': 1},
+                       stream=True, batch_size=batch_size, keyset=True)
+
+    counts = Counter()
+    checked = 0
+
+    if dry_run:
+        for task in tasks:
+            checked += 1
+            reason = ss.classify_url(task["url"])
+            if reason is not True:
+                counts[reason] += 1
+    else:
+        with BulkWriter(db, bulk_size) as writer:
+            for _ in classifyTasks(tasks, db, counts, writer):
+                checked += 1
+        checked += sum(counts.values())
+
+    # Denylisted articles per reason
+    click.echo(click.style("Denylisted URLs:", fg="blue", bold=True))
+    print(tabulate(counts.most_common() + [("Total", sum(counts.values()))]))
+    print("Checked:", checked)
+
+    # Print runtime
+    timer_stop = perf_counter()
+    print("Runtime:", round(timer_stop - timer_start, 4), "s")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,13 +3,22 @@
 # ===========================================================================
 # Use this script fo scrape the content of the articles
 
-from bs4 import BeautifulSoup as bs
+from parser import Page
+from utils.encoding import decodeContent
+from utils.urls import getDomain
 from utils.database import *
+from utils import compression, database
 from time import perf_counter
-from threading import Thread
+from threading import Thread, Lock
+from queue import Queue
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from collections import deque
+from itertools import islice
+import multiprocessing as mp
 import logging
 import click
 import sys
+import os
 
 import scraping_support_functions as ss
 
@@ -18,87 +27,297 @@ import scraping_support_functions as ss
 # ---------------------------------------------------------------------------
 
 
-def chunks(l, n):
-    """Yield n number of striped chunks from l."""
-    for i in range(0, n):
-        yield l[i::n]
+def batched(tasks, n):
+    """Yield consecutive chunks of n tasks from an iterable."""
+    tasks = iter(tasks)
+    while chunk := list(islice(tasks, n)):
+        yield chunk
 
 
-def extractText(url, response):
+def extractText(url, response, parser="html.parser", encoding=None):
     """Parse the article content from the response object"""
 
-    soup = bs(response, "html.parser")
+    # Raw pages are decoded here, off the fetch path
+    if isinstance(response, bytes):
+        response, _ = decodeContent(response, encoding, domain=getDomain(url))
+
+    # The page is parsed once and shared by all checks below
+    page = Page(url, response, parser)
     error = ""
 
     # Check to see if the soup contains explicit errors
-    valid_soup = ss.check_soup_validity(soup.text.lower())
+    valid_soup = ss.check_soup_validity(page.text_lower)
     if valid_soup is not True:
         error = valid_soup  # return the error if it is found
 
     # Check if an alternative form of article text extraction is necessary
-    alt_scraping = ss.do_alternative_scraping(url, response, soup)
+    alt_scraping = ss.do_alternative_scraping(page)
     if alt_scraping is not None:
         error = alt_scraping  # Return the extracted text if alt scraping was necessary
 
     # Get contents of the page in the standard way
-    paragraphs = soup.find_all('p')
-    stripped_paragraph = [tag.get_text().strip()
-                          for tag in paragraphs]
+    stripped_paragraph = page.paragraph_texts
 
     # If the standard way to scrape returned empty, try a different handling
     if len(stripped_paragraph) == 0 or stripped_paragraph == [""]:
-        error = ss.handle_empty_ptags(url, soup, response)
+        error = ss.handle_empty_ptags(page)
 
     text = " ".join(stripped_paragraph)
 
     return text, error
 
+# ---------------------------------------------------------------------------
+#                            PREFETCH
+# ---------------------------------------------------------------------------
+# Reading a page is I/O bound and parsing it is CPU bound. The pages of the
+# next tasks are read on a small thread pool while the current one is
+# parsed, so a worker only waits for data if the reads fall behind.
+
+
+def loadPage(fs, task):
+    """Returns the raw html of a task and its stored charset (None if there is none)"""
+    file_id = task.get("scraping_result", {}).get("content_html", None)
+    if not file_id:
+        return None
+    return getPageBytes(fs, file_id)
+
+
+class PrefetchStats:
+    """Thread-safe time the workers waited for prefetched pages"""
+
+    def __init__(self):
+        self._lock = Lock()
+        self.pages = 0
+        self.stalls = 0  # pages which were not read yet when they were needed
+        self.stall_time = 0.0
+
+    def add(self, pages: int, stalls: int, stall_time: float):
+        with self._lock:
+            self.pages += pages
+            self.stalls += stalls
+            self.stall_time += stall_time
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {"pages": self.pages, "stalls": self.stalls,
+                    "stall_time": round(self.stall_time, 3)}
+
+
+class Prefetcher:
+    """Yields (task, future of its page) and reads up to `depth` pages ahead
+
+    At most `depth` pages are held in memory per prefetcher. The futures
+    are resolved with result(), which counts the time spent waiting.
+    """
+
+    def __init__(self, fs, tasks, executor, depth: int = 8, stats: PrefetchStats = None):
+        self.fs = fs
+        self.tasks = tasks
+        self.executor = executor
+        self.depth = max(depth, 1)
+        self.stats = stats if stats is not None else PrefetchStats()
+
+    def __iter__(self):
+        pending = deque()
+        for task in self.tasks:
+            pending.append((task, self.executor.submit(loadPage, self.fs, task)))
+            if len(pending) >= self.depth:
+                yield pending.popleft()
+        while pending:
+            yield pending.popleft()
+
+    def result(self, future):
+        """Returns the page of a future (raises if it could not be read)"""
+        if future.done():
+            self.stats.add(1, 0, 0.0)
+            return future.result()
+        start = perf_counter()
+        try:
+            return future.result()
+        finally:
+            self.stats.add(1, 1, perf_counter() - start)
+
 # ---------------------------------------------------------------------------
 #                            MULTIPROCESSING
 # ---------------------------------------------------------------------------
 
 
-def processTasks(id, tasks, logger, db, fs):
+def processTask(task, db, fs, writer=None, parser="html.parser", page=None):
+    """Extract the text of one task; returns None if there is no html
+
+    `page` is the prefetched (html, charset) of the task; it is read here if
+    it is not given. Copies of a page which was extracted before are not
+    parsed again; for those the stored abstract is returned.
+    """
+
+    url = task["url"]
+    if page is None:
+        page = loadPage(fs, task)
+
+    if page is None:
+        return None
+
+    # Raw bytes are decoded by extractText
+    response, charset = page
+    encoding = task["scraping_result"].get("encoding", None) or charset
+
+    # Same page, parser, charset and site rules: reuse the stored text
+    key = extractionKey(response, ss.extraction_profile(url), parser, encoding)
+    extraction = findExtraction(db, key)
+    if extraction is not None:
+        values = {'text_extracted': True,
+                  "abstract": extraction["abstract"],
+                  "scraping_result.content_text": extraction["text_id"],
+                  'parsing_error': extraction["parsing_error"]}
+        updateTask(db, task["_id"], values, None, writer, tries_before=task.get("tries"))
+        return extraction["abstract"]
+
+    # Parse the article content from the response object
+    text, error = extractText(url, response, parser, encoding)
+
+    # Write webpage content to file system
+    meta = {"target_url": task["url"], "article_id": task["_id"]}
+    content_text = storePageContent(
+        fs, text, encoding="UTF-8", attr=meta)
+    saveExtraction(db, key, content_text, text[:250], error, writer)
+
+    # Updated tasks by changig status and info about sraping results
+    values = {'text_extracted': True,
+              "abstract": text[:250],
+              "scraping_result.content_text": content_text,
+              'parsing_error': error}
+    # result = {"content_txt": str(file_id)}
+    updateTask(db, task["_id"], values, None, writer, tries_before=task.get("tries"))
+
+    return text
+
+
+def logResult(id, url, text, logger):
+    """Log the outcome of a single task"""
+    if text is None:
+        logger.info(f"Worker {id:2}: No html content found for {url}")
+    else:
+        logger.info(
+            f"Worker {id:2}: Characters extracted: {len(text):4} - {text.strip()[:50]:50}")
+
+
+def processTasks(id, tasks, logger, db, fs, writer=None, parser="html.parser",
+                 io_pool=None, depth=8, stats=None):
     logger.info(f"Worker {id} started ...")
 
-    # Initiate scraper
-    # scraper = DefaultScraper(str(id), logger, timeout=timeout)
+    # Pages are read ahead on the I/O pool (if there is one)
+    prefetcher = Prefetcher(fs, tasks, io_pool, depth, stats) if io_pool else None
+    items = prefetcher if prefetcher else ((task, None) for task in tasks)
 
-    for task in tasks:
+    for task, future in items:
 
         try:
+            page = prefetcher.result(future) if future is not None else None
+            text = processTask(task, db, fs, writer, parser, page)
+            logResult(id, task["url"], text, logger)
 
-            url = task["url"]
-            file_id = task.get("scraping_result", {}).get("content_html", None)
+        except Exception as e:
+            logger.error(f"Worker {id:2}:  {repr(e)}")
 
-            if not file_id:
-                logger.info(f"Worker {id:2}: No html content found for {url}")
-            else:
-                response = getPageContent(fs, file_id, encoding="UTF-8")
+    logger.info(f"Worker {id:2}: finished")
+
+# ---------------------------------------------------------------------------
+#                            PROCESS POOL
+# ---------------------------------------------------------------------------
+# BeautifulSoup parsing is CPU bound, so threads are limited by the GIL.
+# In process mode chunks of tasks are sent to a pool of processes, each
+# with its own database connection, and the results come back per chunk.
+
+# Database connection and I/O threads of a pool process
+_connection = None
+_io_pool = None
+
+
+def initProcess(codec=None, inline_size=None, io_workers=0):
+    """Open one database connection per pool process"""
+    global _connection, _io_pool
+    _connection = getConnection(use_dotenv=True)
+    if io_workers:
+        _io_pool = ThreadPoolExecutor(max_workers=io_workers)
+    if codec:
+        compression.setCodec(codec)
+    if inline_size is not None:
+        setInlineSize(inline_size)
+
+
+def extractChunk(tasks, bulk_size, bulk_delay, parser="html.parser", depth=8):
+    """Extract a chunk of tasks in a pool process
+
+    Returns (url, text, error) per task; text is None if there was no html.
+    The prefetch metrics of the chunk are returned as well.
+    """
+
+    fs, db = _connection
+    results = []
+    stats = PrefetchStats()
+
+    # Pages are read ahead on the I/O threads of the process
+    prefetcher = Prefetcher(fs, tasks, _io_pool, depth, stats) if _io_pool else None
+    items = prefetcher if prefetcher else ((task, None) for task in tasks)
 
-                # Parse the article content from the response object
-                text, error = extractText(url, response)
+    # Updates of a chunk are written together
+    writer = BulkWriter(db, bulk_size, bulk_delay) if bulk_size else None
 
-                # Write webpage content to file system
-                meta = {"target_url": task["url"], "article_id": task["_id"]}
-                file_id = savePageContent(
-                    fs, text, encoding="UTF-8", attr=meta)
+    try:
+        for task, future in items:
+            try:
+                page = prefetcher.result(future) if future is not None else None
+                text = processTask(task, db, fs, writer, parser, page)
+                results.append((task["url"], text, None))
+            except Exception as e:
+                results.append((task["url"], None, repr(e)))
+    finally:
+        if writer is not None:
+            writer.close()
 
-                # Updated tasks by changig status and info about sraping results
-                values = {'text_extracted': True,
-                          "abstract": text[:250],
-                          "scraping_result.content_text": str(file_id),
-                          'parsing_error': error}
-                # result = {"content_txt": str(file_id)}
-                updateTask(db, task["_id"], values, None)
+    return os.getpid(), results, stats.metrics()
 
-                logger.info(
-                    f"Worker {id:2}: Characters extracted: {len(text):4} - {text.strip()[:50]:50}")
 
+def processTasksInPool(tasks, logger, workers, chunk_size, bulk_size, bulk_delay,
+                       parser="html.parser", io_workers=0, depth=8, stats=None):
+    """Distribute chunks of tasks over a pool of processes"""
+
+    def logChunk(future):
+        try:
+            pid, results, metrics = future.result()
         except Exception as e:
-            logger.error(f"Worker {id:2}:  {repr(e)}")
+            logger.error(f"Chunk failed:  {repr(e)}")
+            return
+        if stats is not None:
+            stats.add(metrics["pages"], metrics["stalls"], metrics["stall_time"])
+        for url, text, error in results:
+            if error:
+                logger.error(f"Worker {pid}:  {error}")
+            else:
+                logResult(pid, url, text, logger)
 
-    logger.info(f"Worker {id:2}: finished")
+    # Spawned processes do not inherit the MongoClient of this process
+    context = mp.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                             initializer=initProcess, initargs=(compression.codec, database.inline_size, io_workers)) as pool:
+
+        logger.info(f"Started {workers} processes ...")
+        pending = set()
+
+        for chunk in batched(tasks, chunk_size):
+
+            # Keep at most two chunks per process in flight
+            if len(pending) >= 2 * workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    logChunk(future)
+
+            pending.add(pool.submit(extractChunk, chunk, bulk_size, bulk_delay, parser, depth))
+
+        for future in wait(pending).done:
+            logChunk(future)
+
+    logger.info("Processes finished")
 
 
 # ---------------------------------------------------------------------------
@@ -108,12 +327,28 @@ def processTasks(id, tasks, logger, db, fs):
 # fmt: off
 @click.command()
 @click.option("--path_logfile", default="logs_extraction.log", help="Logfile location") 
-@click.option("--workers", default=4, help="Number of threads used for scraping")
+@click.option("--mode", default="thread", type=click.Choice(["thread", "process"]), help="Extract in threads or in a process pool")
+@click.option("--workers", default=4, help="Number of threads (or processes) used for extraction")
+@click.option("--chunk_size", default=50, help="Number of tasks sent to a process at once (process mode only)")
+@click.option("--parser", default="html.parser", type=click.Choice(["html.parser", "lxml"]), help="HTML parser (lxml is faster, but may change some texts)")
 @click.option("--limit", default=500, help="Only scraping first n urls (0 equals no limit)")
 @click.option('--status', default="CONTENT-FETCHED", help="Any status")
 @click.option("--batch", default="last", help="all, first last, or a number indicating the batch")
-def main(path_logfile, workers, 
-       limit, status,  batch): 
+@click.option("--domain", "domains", multiple=True, help="Only extract tasks of this domain (media_name); can be repeated")
+@click.option("--exclude_domain", "exclude_domains", multiple=True, help="Skip tasks of this domain (media_name); can be repeated")
+@click.option("--stream", is_flag=True, help="Stream tasks from the database instead of loading all of them")
+@click.option("--batch_size", default=100, help="Number of tasks fetched per database round trip")
+@click.option("--keyset/--single_cursor", default=True, help="Paginate the task stream by _id or read it from one long cursor")
+@click.option("--max_pending", default=1000, help="Number of tasks queued for the workers")
+@click.option("--bulk_size", default=500, help="Buffer n task updates per bulk write (0 writes each update directly)")
+@click.option("--bulk_delay", default=1.0, help="Flush buffered task updates at least every n seconds")
+@click.option("--codec", default="auto", type=click.Choice(["auto"] + compression.CODECS), help="Compression of stored texts (auto: zstd if installed, else gzip)")
+@click.option("--inline_size", default=16_384, help="Store texts up to n bytes in the task instead of a file (0 equals never)")
+@click.option("--prefetch", default=8, help="Number of pages read ahead per worker (0 reads each page when it is needed)")
+@click.option("--io_workers", default=4, help="Number of threads reading pages ahead (per process in process mode)")
+def main(path_logfile, mode, workers, chunk_size, parser,
+       limit, status,  batch, domains, exclude_domains, stream, batch_size, keyset, max_pending, bulk_size, bulk_delay, codec, inline_size,
+       prefetch, io_workers): 
 
     # ------------------- LOGGING -------------------
 
@@ -143,40 +378,86 @@ def main(path_logfile, workers,
 
     # Connect to Database
     fs, db = getConnection(use_dotenv=True)
+    compression.setCodec(codec)
+    setInlineSize(inline_size)
+    batch_id = getBatchID(db, batch)
     # only retrieve the fields that are necessary for the scraping
-    fields = {'scraping_result': 1, 'url': 1}
+    fields = {'url': 1, 'tries': 1, 'scraping_result.content_html': 1, 'scraping_result.encoding': 1}
 
     # ------------------- FETCH TASKS -------------------
 
-    tasks = fetchTasks(db, None, status, limit, fields)
-    logger.info(f"Number of URLs: {len(tasks)}")
+    if stream:
+        tasks = fetchTasks(db, batch_id, status, limit, fields,
+                           stream=True, batch_size=batch_size, keyset=keyset,
+                           domains=domains, exclude_domains=exclude_domains)
+    else:
+        tasks = fetchTasks(db, batch_id, status, limit, fields,
+                           domains=domains, exclude_domains=exclude_domains)
+        logger.info(f"Number of URLs: {len(tasks)}")
 
     # ------------------- FETCH CONTENT -------------------
 
-    logger.info(f"Number of URLs to be scraped: {len(tasks)}")
+    # Buffer task updates and send them as bulk writes
+    use_writer = bulk_size and mode == "thread"
+    writer = BulkWriter(db, bulk_size, bulk_delay, logger) if use_writer else None
 
-    # if there is more than worker use threads
-    if workers > 1:
+    # Threads which read the pages of the next tasks during parsing
+    io_workers = io_workers if prefetch else 0
+    io_pool = ThreadPoolExecutor(max_workers=io_workers) if io_workers and mode == "thread" else None
+    stats = PrefetchStats()
 
-        threads = []
+    try:
 
-        # Create one thread per chunk
-        for id, chunk in enumerate(chunks(tasks, workers)):
+        # processes have their own connections, bulk writers and I/O threads
+        if mode == "process":
+            processTasksInPool(tasks, logger, workers, chunk_size,
+                               bulk_size, bulk_delay, parser, io_workers, prefetch, stats)
 
-            # Package arguments
-            args = (id, chunk, logger, db, fs)  # fmt: skip
+        # if there is more than worker use threads
+        elif workers > 1:
 
-            # Create and start thread
-            t = Thread(target=processTasks, args=args)
-            threads.append(t)
-            t.start()
+            threads = []
 
-        # Wait for the threads to complete
-        for t in threads:
-            t.join()
+            # Workers share a bounded queue, so a streamed batch never has to
+            # be held in memory as a whole
+            queue = Queue(maxsize=max_pending)
 
-    else:
-        processTasks(-1, tasks, logger, db, fs)
+            for id in range(workers):
+
+                # Package arguments; None tells a worker to stop
+                args = (id, iter(queue.get, None), logger, db, fs, writer, parser, io_pool, prefetch, stats)  # fmt: skip
+
+                # Create and start thread
+                t = Thread(target=processTasks, args=args)
+                threads.append(t)
+                t.start()
+
+            # Fill the queue while the workers are running
+            for task in tasks:
+                queue.put(task)
+            for t in threads:
+                queue.put(None)
+
+            # Wait for the threads to complete
+            for t in threads:
+                t.join()
+
+        else:
+            processTasks(-1, tasks, logger, db, fs, writer, parser, io_pool, prefetch, stats)
+
+    finally:
+
+        if io_pool is not None:
+            io_pool.shutdown(wait=True)
+
+        # Time the workers waited for pages which were not read yet
+        if io_workers:
+            logger.info(f"Prefetch: {stats.metrics()}")
+
+        # Write the remaining buffered updates
+        if writer is not None:
+            writer.close()
+            logger.info(f"Bulk writes: {writer.metrics()}")
 
     # ------------------- WRAP UP -------------------
 
@@ -0,0 +1,125 @@
+# ===========================================================================
+#                            Migrate Indexes
+# ===========================================================================
+# Brings the indexes of an existing database up to date (see `indexes` in
+# utils/database.py) and drops the ones they replace. Running it again does
+# not change anything. The plans and timings of the task selection queries
+# are printed before and after, so the effect can be checked.
+
+from tabulate import tabulate
+from time import perf_counter
+from utils.database import *
+from utils.database import _taskQuery, _claimQuery
+import click
+
+# ================================= HELPERS ================================
+
+
+def sampleQueries(db, status: str, batch_id: int, max_tries: int) -> list:
+    """Returns (name, cursor factory) of the queries used to select tasks"""
+
+    # A domain with tasks, for the per-domain query
+    sample = db.articles.find_one({"media_url": {"$exists": True}},
+                                  {"media_url": 1, "media_name": 1})
+    media_url = sample.get("media_url", "") if sample else ""
+    media_name = sample.get("media_name", "") if sample else ""
+
+    return [
+        ("fetchTasks", lambda: db.articles.find(_taskQuery(status, batch_id, max_tries)).limit(1000)),
+        ("fetchTasks (keyset)", lambda: db.articles.find(_taskQuery(status, batch_id, max_tries))
+         .sort("_id", pm.ASCENDING).limit(1000)),
+        ("fetchTasks (all batches)", lambda: db.articles.find(_taskQuery(status)).limit(1000)),
+        ("claimTasks", lambda: db.articles.find(_claimQuery(status, batch_id, max_tries),
+                                                {"_id": 1}).limit(100)),
+        ("getFirstBatchID", lambda: db.articles.find({"status": "UNPROCESSED"})
+         .sort("batch_id", pm.ASCENDING).limit(1)),
+        ("per domain", lambda: db.articles.find({"media_url": media_url, "status": status})
+         .limit(1000)),
+        ("fetchTasks (domains)", lambda: db.articles.find(
+            _taskQuery(status, batch_id, max_tries, [media_name])).limit(1000)),
+    ]
+
+
+def planSummary(plan: dict) -> str:
+    """Returns the stages of a winning plan, e.g. 'LIMIT < FETCH < IXSCAN (name)'"""
+
+    # Plans of the slot based engine are nested one level deeper
+    plan = plan.get("queryPlan", plan)
+    stages = []
+    while plan:
+        stage = plan.get("stage", "?")
+        if "indexName" in plan:
+            stage += f" ({plan['indexName']})"
+        stages.append(stage)
+        inputs = plan.get("inputStages")
+        if inputs:
+            stages.append("[" + ", ".join(planSummary(p) for p in inputs) + "]")
+            break
+        plan = plan.get("inputStage")
+    return " < ".join(stages)
+
+
+def explainQueries(queries: list) -> list:
+    """Returns the plan, examined documents and time of every query"""
+
+    rows = []
+    for name, cursor in queries:
+        start = perf_counter()
+        explain = cursor().explain()
+        elapsed = perf_counter() - start
+        stats = explain.get("executionStats", {})
+        rows.append((name,
+                     planSummary(explain["queryPlanner"]["winningPlan"]),
+                     stats.get("nReturned"),
+                     stats.get("totalKeysExamined"),
+                     stats.get("totalDocsExamined"),
+                     stats.get("executionTimeMillis"),
+                     round(elapsed * 1000, 1)))
+    return rows
+
+
+def printPlans(title: str, rows: list):
+    click.echo(click.style(title, fg="blue", bold=True))
+    print(tabulate(rows, headers=["Query", "Plan", "Returned", "Keys", "Docs", "ms (server)", "ms"]))
+
+# ================================= MAIN ================================
+
+
+# fmt: off
+@click.command()
+@click.option('--status', default="UNPROCESSED", help="Status used in the sample queries")
+@click.option("--batch", default="last", help="Batch used in the sample queries (all, first, last or a number)")
+@click.option("--max_tries", default=5, help="Tries limit used in the sample queries")
+@click.option("--keep_obsolete", is_flag=True, help="Do not drop the indexes which are replaced")
+@click.option("--dry_run", is_flag=True, help="Only print the current plans")
+# fmt: on
+def main(status, batch, max_tries, keep_obsolete, dry_run):
+
+    timer_start = perf_counter()
+
+    # Connect to database
+    _, db = getConnection(use_dotenv=True)
+    batch_id = getBatchID(db, batch)
+    queries = sampleQueries(db, status, batch_id, max_tries)
+
+    printPlans("Plans before:", explainQueries(queries))
+    if dry_run:
+        return
+
+    # ------------------- Indexes -------------------
+
+    start = perf_counter()
+    changes = ensureIndexes(db, drop_obsolete=not keep_obsolete)
+    click.echo(click.style("\nIndexes:", fg="blue", bold=True))
+    print(tabulate(changes, headers=["Change", "Collection", "Index"]) if changes else "Up to date")
+    print("Index build:", round(perf_counter() - start, 4), "s\n")
+
+    printPlans("Plans after:", explainQueries(queries))
+
+    # Print runtime
+    timer_stop = perf_counter()
+    print("Runtime:", round(timer_stop - timer_start, 4), "s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1 +1,2 @@
 # from .default import DefaultScraper, CappedException
+from .page import Page
@@ -0,0 +1,62 @@
+# ===========================================================================
+#                            Parsed Page
+# ===========================================================================
+# A webpage is parsed once and the parts the extraction rules need (text,
+# p-tags, JSON scripts) are computed lazily on first access and then shared
+# by the validity checks, the site rules and the paragraph extraction.
+#
+# "html.parser" is the default because the extracted texts stay identical
+# to earlier runs. "lxml" is faster, but repairs broken markup differently
+# (e.g. nested or unclosed <p> tags), which changes some texts.
+
+from bs4 import BeautifulSoup
+from functools import cached_property
+
+
+class Page:
+    """Webpage which is parsed once and shared by all extraction rules"""
+
+    def __init__(self, url: str, html: str, parser: str = "html.parser"):
+        self.url = url
+        self.html = html
+        self.parser = parser
+
+    @cached_property
+    def soup(self) -> BeautifulSoup:
+        """Parsed document"""
+        return BeautifulSoup(self.html, self.parser)
+
+    @cached_property
+    def text(self) -> str:
+        """Text of the whole document"""
+        return self.soup.text
+
+    @cached_property
+    def text_lower(self) -> str:
+        """Lowercase text of the whole document"""
+        return self.text.lower()
+
+    @cached_property
+    def paragraphs(self) -> list:
+        """All <p> tags"""
+        return self.soup.find_all('p')
+
+    @cached_property
+    def paragraph_texts(self) -> list:
+        """Stripped text of all <p> tags"""
+        return [tag.get_text().strip() for tag in self.paragraphs]
+
+    @cached_property
+    def scripts(self) -> list:
+        """All <script> tags"""
+        return self.soup.find_all('script')
+
+    @cached_property
+    def json_scripts(self) -> list:
+        """<script> tags whose type contains 'json'"""
+        return [s for s in self.scripts if 'json' in s.get('type', '')]
+
+    @cached_property
+    def json_ld(self) -> list:
+        """<script type="application/ld+json"> tags"""
+        return [s for s in self.scripts if s.get('type') == 'application/ld+json']
@@ -9,6 +9,7 @@ class Status(str, Enum):
     """Processing status"""
 
     UNPROCESSED = "UNPROCESSED"
+    IN_PROGRESS = "IN-PROGRESS"
     CONTENT_FETCHED = "CONTENT-FETCHED"
     CONTENT_EXTRACTED = "CONTENT-EXTRACTED"
     DENYLISTED = "DENYLISTED"
@@ -5,6 +5,7 @@
 # - Pydantic Schema - https://docs.pydantic.dev/usage/schema/
 
 from pydantic import BaseModel, Field
+from typing import Union
 import datetime
 
 
@@ -13,17 +14,20 @@ class ScrapingResult(BaseModel):
 
     target_url: str = Field(default=None, description="target URL")
     landing_url: str = Field(default=None, description="landing URL")
-    content_html: str = Field(
-        default=None, description="reference to static content"
+    content_html: Union[str, dict] = Field(
+        default=None, description="reference to static content (file id or inline payload)"
     )
-    content_text: str = Field(
-        default=None, description="reference to extracted content"
+    content: bytes = Field(
+        default=None, exclude=True, description="raw response body (not stored in the task)"
+    )
+    content_text: Union[str, dict] = Field(
+        default=None, description="reference to extracted content (file id or inline payload)"
     )
     elapsed: float = Field(
         default=None, description="Request: time until request finished"
     )
     encoding: str = Field(
-        default=None, description="Request: content encoding")
+        default=None, description="Request: charset declared by the header or <meta> tag")
     headers: list = Field(default=None, description="Request: content headers")
     status_code: int = Field(
         default=None, description="Request: HTTP status code")
@@ -4,11 +4,29 @@
 # Use this script fo scrape the content of the articles
 
 from scraper.default import DefaultScraper, CappedException
+from scraper.async_default import AsyncScraper
+from scraper.inspector import page_types
 from schemas import Status, ScrapingResult
 from bson.objectid import ObjectId
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from extract_text import extractText
+from denylist_urls import classifyTasks
+from collections import Counter
+from functools import partial
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
 from time import perf_counter
-from threading import Thread
+from threading import Thread, Event
 from utils.database import *
+from utils.scheduler import DomainScheduler, CircuitBreaker, feedScheduler
+from utils.latency import LatencyTracker
+from utils.urls import getDomain
+from utils import compression
+import scraping_support_functions as ss
+import multiprocessing as mp
+import requests
+import aiohttp
+import asyncio
 import logging
 import click
 import time
@@ -23,79 +41,372 @@ import re
 # ---------------------------------------------------------------------------
 
 
-def chunks(l, n):
-    """Yield n number of striped chunks from l."""
-    for i in range(0, n):
-        yield l[i::n]
+def fetchFailure(r, error=None):
+    """Returns why a fetch counts against its domain (None on success)"""
 
+    # Capped downloads are a property of the page, not of the domain,
+    # except for block pages and refusals which were recognised while
+    # downloading (e.g. the 403 page of a server)
+    if isinstance(error, CappedException):
+        if error.capped_type == CappedException.BLOCK_PAGE:
+            return CircuitBreaker.BLOCKED
+        return str(r.status_code) if r.status_code in (403, 429, 503) else None
+    if error is not None:
+        return type(error).__name__
+    if r.status_code in (403, 429, 503):
+        return str(r.status_code)
+    if ss.is_block_page(r.content):
+        return CircuitBreaker.BLOCKED
+    return None
 
-def chunkify(input_list, n):
-    # Create a dictionary to group entries by media_url
-    grouped_entries = {}
-    for entry in input_list:
-        media_url = entry.get("media_url")
-        if media_url:
-            grouped_entries.setdefault(media_url, []).append(entry)
 
-    # Split the grouped entries into roughly evenly sized blocks
-    blocks = [[] for _ in range(n)]
-    for media_entries in grouped_entries.values():
-        smallest_block = min(blocks, key=len)
-        smallest_block.extend(media_entries)
+def fetchLatency(r, timeout, error=None):
+    """Returns the response time to record for the domain (None to skip)"""
 
-    return blocks
+    # A timed out request took at least as long as its timeout
+    if error is not None:
+        timed_out = isinstance(error, (requests.exceptions.Timeout, asyncio.TimeoutError))
+        return timeout if timed_out else None
+    return r.elapsed
+
+
+def retryAfter(headers) -> float:
+    """Returns the seconds of a Retry-After header (None if there is none)"""
+
+    for key, value in (headers or {}).items():
+        if key.lower() != "retry-after":
+            continue
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            date = parsedate_to_datetime(value)
+            return max(0.0, (date - datetime.now(timezone.utc)).total_seconds())
+        except (TypeError, ValueError):
+            return None
+    return None
+
+
+def retryDelay(task, r, error, retries, base_delay, max_delay, max_retries):
+    """Returns the seconds until a transient failure is retried (None to give up)"""
+
+    # Only connection problems, timeouts and overloaded servers are retried
+    transient = (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                 aiohttp.ClientConnectionError, asyncio.TimeoutError)
+    if error is not None and not isinstance(error, transient):
+        return None
+    if error is None and r.status_code not in (429, 503):
+        return None
+
+    # Attempts in this run count towards the tries of the task
+    attempts = task.get("attempts", 1)
+    if attempts > retries:
+        return None
+    if max_retries and task.get("tries", 0) + attempts > max_retries:
+        return None
+
+    # Exponential backoff with jitter
+    backoff = min(max_delay, base_delay * 2 ** (attempts - 1))
+    delay = backoff / 2 + random.uniform(0, backoff / 2)
+
+    # The server may ask for a longer pause; far off retries are left to a later run
+    retry_after = retryAfter(r.headers) if error is None else None
+    if retry_after is not None:
+        if retry_after > max_delay:
+            return None
+        delay = max(delay, retry_after)
+
+    return delay
+
+
+def storeResult(task, r, status, db, fs, writer=None):
+    """Write the webpage content to file system and update the task"""
+
+    # Write the raw webpage content to file system, with its declared charset
+    meta = {"target_url": task["url"], "article_id": task["_id"], "charset": r.encoding}
+    # Update task status and save webpage content reference (or small pages)
+    r.content_html = storePageContent(fs, r.content, attr=meta, domain=getDomain(task["url"]))
+
+    # Updated tasks by changig status and info about sraping results
+    updateTask(db, id=task["_id"],
+               values={'status': status},
+               result=r.model_dump(),
+               writer=writer,
+               tries=task.get("attempts", 1), worker_id=leaseOwner(task),
+               tries_before=task.get("tries"))
+
+
+def storeAborted(task, r, error, db, writer=None):
+    """Update the task of a block or error page which was stopped while downloading
+
+    Nothing is stored, but the page is a final result: the task gets the same
+    fields as an extracted page, with the error label of the soup checks.
+    """
+
+    values = {'status': Status.CONTENT_EXTRACTED,
+              'text_extracted': True,
+              "abstract": "",
+              'parsing_error': error.parsing_error or error.capped_type}
+    updateTask(db, id=task["_id"], values=values,
+               result=r.model_dump(), writer=writer,
+               tries=task.get("attempts", 1), worker_id=leaseOwner(task),
+               tries_before=task.get("tries"))
+
+
+def storeExtracted(task, r, text, error, db, fs, store_html=True, writer=None, key=None):
+    """Write the extracted text (and optionally the html) and update the task"""
+
+    meta = {"target_url": task["url"], "article_id": task["_id"]}
+
+    # Raw html is only kept on request, the text is what later steps use
+    if store_html:
+        r.content_html = storePageContent(fs, r.content, attr={**meta, "charset": r.encoding},
+                                          domain=getDomain(task["url"]))
+    else:
+        r.content_html = None
+
+    r.content_text = storePageContent(fs, text, encoding="UTF-8", attr=meta)
+
+    # Later copies of the page reuse the text
+    if key is not None:
+        saveExtraction(db, key, r.content_text, text[:250], error, writer)
+
+    # Same fields as extract_text.py, but the task skips CONTENT-FETCHED
+    values = {'status': Status.CONTENT_EXTRACTED,
+              'text_extracted': True,
+              "abstract": text[:250],
+              'parsing_error': error}
+    updateTask(db, id=task["_id"], values=values,
+               result=r.model_dump(), writer=writer,
+               tries=task.get("attempts", 1), worker_id=leaseOwner(task),
+               tries_before=task.get("tries"))
+
+
+def storeCopy(task, r, extraction, db, fs, store_html=True, writer=None):
+    """Reference the text of an earlier copy of the page and update the task"""
+
+    # The html of a copy is not stored again (files are content addressed)
+    if store_html:
+        meta = {"target_url": task["url"], "article_id": task["_id"], "charset": r.encoding}
+        r.content_html = storePageContent(fs, r.content, attr=meta,
+                                          domain=getDomain(task["url"]))
+    else:
+        r.content_html = None
+    r.content_text = extraction["text_id"]
+
+    values = {'status': Status.CONTENT_EXTRACTED,
+              'text_extracted': True,
+              "abstract": extraction["abstract"],
+              'parsing_error': extraction["parsing_error"]}
+    updateTask(db, id=task["_id"], values=values,
+               result=r.model_dump(), writer=writer,
+               tries=task.get("attempts", 1), worker_id=leaseOwner(task),
+               tries_before=task.get("tries"))
+
+
+def findCopy(task, r, db):
+    """Returns the extraction key of a page and an earlier extraction of it"""
+    key = extractionKey(r.content, ss.extraction_profile(task["url"]), "html.parser", r.encoding)
+    return key, findExtraction(db, key)
+
+
+def reportFetch(id, task, r, error, timeout, scheduler, logger, timeouts=None, retry=None) -> bool:
+    """Records the outcome of a fetch for its domain; returns True if the task is retried"""
+
+    if timeouts is not None:
+        timeouts.record(scheduler.domain(task), fetchLatency(r, timeout, error))
+
+    # Blocks and failures hold back the rest of the domain
+    scheduler.report(task, fetchFailure(r, error))
+
+    # Transient failures are deferred and fetched again in this run
+    delay = retry(task, r, error) if retry else None
+    if delay is None:
+        return False
+    task["attempts"] = task.get("attempts", 1) + 1
+    scheduler.defer(task, delay)
+    logger.info(f"Worker {id:2}: [retry in {delay:.1f}s] {str(r.target_url)}")
+    return True
+
+
+def storeFetched(task, r, status, error, db, fs, writer=None, extractor=None, store_html=True,
+                 logger=None):
+    """Store the result of a fetch (blocking; the async engine runs it on a thread)
+
+    With an extractor (process pool) the text is extracted from the fetched
+    html right away instead of by extract_text.py. If the extraction fails,
+    the html is stored as CONTENT-FETCHED, as without an extractor.
+    """
+
+    # Block and error pages recognised by the inspector are not fetched again
+    if isinstance(error, CappedException) and error.capped_type in page_types:
+        storeAborted(task, r, error, db, writer)
+        return
+
+    if extractor is None or status != Status.CONTENT_FETCHED:
+        storeResult(task, r, status, db, fs, writer)
+        return
+
+    # Same page, charset and site rules: reuse the stored text
+    key, extraction = findCopy(task, r, db)
+    if extraction is not None:
+        storeCopy(task, r, extraction, db, fs, store_html, writer)
+        return
+
+    try:
+        future = extractor.submit(extractText, task["url"], r.content, "html.parser", r.encoding)
+        text, error = future.result()
+    except Exception as e:
+        if logger is not None:
+            logger.error(f"Extraction of {task['url']}:  {repr(e)}")
+        storeResult(task, r, Status.CONTENT_FETCHED, db, fs, writer)
+        return
+    storeExtracted(task, r, text, error, db, fs, store_html, writer, key)
+
+
+def renewClaims(db, worker_id, lease, stop, logger):
+    """Extends the leases of the claimed tasks until `stop` is set
+
+    Claimed tasks may wait in the scheduler for longer than a lease (rate
+    limits, breaker cooldowns, retries); without renewal another host would
+    reclaim and fetch them again.
+    """
+    while not stop.wait(lease / 4):
+        try:
+            renewLeases(db, worker_id, lease)
+        except Exception as e:
+            logger.error(f"Lease renewal:  {repr(e)}")
+
+
+def createExtractor(workers):
+    """Process pool for the CPU bound extraction of the fused mode"""
+
+    # Spawned processes do not inherit the MongoClient of this process
+    context = mp.get_context("spawn")
+    return ProcessPoolExecutor(max_workers=workers, mp_context=context)
 
 # ---------------------------------------------------------------------------
 #                            MULTIPROCESSING
 # ---------------------------------------------------------------------------
 
 
-def processTasks(id, tasks, logger, db, fs, timeout):
-    """Process a list of tasks in a seperate thread"""
+def processTasks(id, scheduler, logger, db, fs, timeout, writer=None,
+                 extractor=None, store_html=True, timeouts=None, retry=None):
+    """Process tasks from the shared scheduler in a seperate thread
+
+    With an extractor (process pool) the text is extracted from the fetched
+    html right away instead of by extract_text.py.
+    """
 
     # Initiate scraper
     logger.info(f"Worker {id} started ...")
     scraper = DefaultScraper(str(id), logger, timeout=timeout)
 
-    # Process tasks
-    for task_id, task in enumerate(tasks):
+    # Process tasks until the scheduler runs empty
+    while (task := scheduler.get()) is not None:
 
         try:
 
             # create the scraping result
             r = ScrapingResult(target_url=task["url"])
 
+            # Timeout of the domain, derived from its past response times
+            domain = scheduler.domain(task)
+            request_timeout = timeouts.timeout(domain) if timeouts else timeout
+
             # Fetch webpage content
+            error = None
             try:
-                r = scraper.get(r)
+                r = scraper.get(r, request_timeout)
                 status = Status.CONTENT_FETCHED
             except Exception as e:
                 logger.error(f"Worker {id:2}:  {repr(e)}")
                 status = Status.FAILED
+                error = e
 
-            # Write webpage content to file system
-            meta = {"target_url": task["url"], "article_id": task["_id"]}
-            file_id = savePageContent(
-                fs, r.content_html, r.encoding, attr=meta)
-
-            # Update task status and save webpage content reference
-            r.content_html = str(file_id)
+            # Transient failures are retried later in this run
+            if reportFetch(id, task, r, error, request_timeout, scheduler, logger, timeouts, retry):
+                continue
 
-            # Updated tasks by changig status and info about sraping results
-            updateTask(db, id=task["_id"],
-                       values={'status': status},
-                       result=r.model_dump())
-
-            time.sleep(2)
+            # Store webpage content (and the extracted text) and update the task
+            storeFetched(task, r, status, error, db, fs, writer, extractor, store_html, logger)
 
             logger.info(
-                f"Worker {id:2}: [{str(r.status_code)}] [{task_id}/{len(tasks)}] {str(r.target_url)}")
+                f"Worker {id:2}: [{str(r.status_code)}] [{len(scheduler)} left] {str(r.target_url)}")
 
         except Exception as e:
             logger.error(f"Worker {id:2}:  {repr(e)}")
 
+        finally:
+            scheduler.done(task)
+
     logger.info(f"Worker {id:2}: finished")
 
+# ---------------------------------------------------------------------------
+#                            ASYNCIO
+# ---------------------------------------------------------------------------
+
+
+async def processTasksAsync(scheduler, logger, db, fs, timeout, concurrency, db_workers, writer=None,
+                            extractor=None, store_html=True, timeouts=None, retry=None):
+    """Process tasks from the shared scheduler with concurrent coroutines"""
+
+    loop = asyncio.get_running_loop()
+
+    # Database calls are blocking and therefore run on a small thread pool
+    executor = ThreadPoolExecutor(max_workers=db_workers)
+
+    async def worker(id, scraper):
+
+        while (task := await scheduler.aget()) is not None:
+
+            try:
+
+                # create the scraping result
+                r = ScrapingResult(target_url=task["url"])
+
+                # Timeout of the domain, derived from its past response times
+                domain = scheduler.domain(task)
+                request_timeout = timeouts.timeout(domain) if timeouts else timeout
+
+                # Fetch webpage content
+                error = None
+                try:
+                    r = await scraper.get(r, request_timeout)
+                    status = Status.CONTENT_FETCHED
+                except Exception as e:
+                    logger.error(f"Worker {id:2}:  {repr(e)}")
+                    status = Status.FAILED
+                    error = e
+
+                # Transient failures are retried later in this run
+                if reportFetch(id, task, r, error, request_timeout, scheduler, logger, timeouts, retry):
+                    continue
+
+                # Store webpage content (and the extracted text) and update the task
+                await loop.run_in_executor(
+                    executor, storeFetched, task, r, status, error, db, fs, writer, extractor, store_html,
+                    logger)
+
+                logger.info(
+                    f"Worker {id:2}: [{str(r.status_code)}] [{len(scheduler)} left] {str(r.target_url)}")
+
+            except Exception as e:
+                logger.error(f"Worker {id:2}:  {repr(e)}")
+
+            finally:
+                scheduler.done(task)
+
+    # One scraper (and connection pool) is shared by all coroutines
+    async with AsyncScraper("async", logger, timeout=timeout,
+                            max_connections=concurrency) as scraper:
+        logger.info(f"Starting {concurrency} coroutines ...")
+        await asyncio.gather(*[worker(id, scraper) for id in range(concurrency)])
+
+    executor.shutdown(wait=True)
+    logger.info("Coroutines finished")
+
 
 # ---------------------------------------------------------------------------
 #                            MAIN
@@ -104,13 +415,52 @@ def processTasks(id, tasks, logger, db, fs, timeout):
 # fmt: off
 @click.command()
 @click.option("--path_logfile", default="logs.log", help="Logfile location")
-@click.option("--workers", default=32, help="Number of threads used for scraping")
-@click.option("--timeout", default=5, help="Time give for the request in seconds")
+@click.option("--engine", default="threads", type=click.Choice(["threads", "async"]), help="Fetch with threads or with asyncio")
+@click.option("--workers", default=32, help="Number of threads used for scraping (database threads for the async engine)")
+@click.option("--concurrency", default=1000, help="Number of concurrent requests (async engine only)")
+@click.option("--timeout", default=5, help="Time give for the request in seconds (for domains without latency data)")
+@click.option("--adaptive_timeout/--fixed_timeout", default=True, help="Derive the timeout of a domain from its past response times")
+@click.option("--min_timeout", default=2.0, help="Lower bound of adaptive timeouts in seconds")
+@click.option("--max_timeout", default=30.0, help="Upper bound of adaptive timeouts in seconds")
+@click.option("--timeout_quantile", default=0.95, help="Percentile of the response times an adaptive timeout is based on")
+@click.option("--timeout_factor", default=3.0, help="Adaptive timeout = factor * percentile")
+@click.option("--rate", default=0.5, help="Requests per second and domain (0 equals no limit)")
+@click.option("--host_concurrency", default=1, help="Number of parallel requests per domain")
 @click.option("--limit", default=1_000_000, help="Only scraping first n urls (0 equals no limit)")
 @click.option('--status', default="UNPROCESSED", help="Any status (FAILED, UNPROCESSED, etc.)")
 @click.option("--max_retries", default=5, help="Consider only URLs which were scraped less than n times (0 to force)")
+@click.option("--retries", default=3, help="Retry transient failures (connection errors, timeouts, 429, 503) n times within the run")
+@click.option("--retry_delay", default=5.0, help="Seconds before the first retry (doubled per attempt, with jitter)")
+@click.option("--max_retry_delay", default=300.0, help="Longest retry delay in seconds (longer Retry-After headers are left to a later run)")
 @click.option("--batch", default="last", help="all, first last, or a number indicating the batch")
-def main(path_logfile, workers, timeout, limit, status,  max_retries, batch): 
+@click.option("--domain", "domains", multiple=True, help="Only scrape tasks of this domain (media_name); can be repeated")
+@click.option("--exclude_domain", "exclude_domains", multiple=True, help="Skip tasks of this domain (media_name); can be repeated")
+@click.option("--claim", is_flag=True, help="Claim tasks with a lease so several hosts can share the queue")
+@click.option("--worker_id", default=None, help="Identifier used for claims (default: hostname-pid)")
+@click.option("--lease", default=3600, help="Seconds after which claimed but unfinished tasks are reclaimed")
+@click.option("--stream", is_flag=True, help="Stream tasks from the database instead of loading all of them")
+@click.option("--batch_size", default=1000, help="Number of tasks fetched per database round trip")
+@click.option("--keyset/--single_cursor", default=True, help="Paginate the task stream by _id or read it from one long cursor")
+@click.option("--max_pending", default=10_000, help="Number of streamed or claimed tasks held in memory")
+@click.option("--bulk_size", default=500, help="Buffer n task updates per bulk write (0 writes each update directly)")
+@click.option("--bulk_delay", default=1.0, help="Flush buffered task updates at least every n seconds")
+@click.option("--breaker/--no_breaker", default=True, help="Hold back domains which fail or block the scraper")
+@click.option("--breaker_failure_rate", default=0.5, help="Share of failed requests (403, 429, errors) which trips a domain")
+@click.option("--breaker_blocks", default=3, help="Number of block pages which trips a domain")
+@click.option("--breaker_cooldown", default=300, help="Seconds a tripped domain is held back (doubled per trip)")
+@click.option("--breaker_max_trips", default=3, help="Skip the remaining tasks of a domain after n trips (0 equals never)")
+@click.option("--denylist/--no_denylist", default=True, help="Denylist urls which can not be scraped before fetching them")
+@click.option("--extract", is_flag=True, help="Extract the text right after fetching (status CONTENT-EXTRACTED)")
+@click.option("--extract_workers", default=mp.cpu_count(), help="Number of processes used for extraction (with --extract)")
+@click.option("--store_html/--no_store_html", default=True, help="Keep the raw html in GridFS (with --extract)")
+@click.option("--codec", default="auto", type=click.Choice(["auto"] + compression.CODECS), help="Compression of stored pages (auto: zstd if installed, else gzip)")
+@click.option("--inline_size", default=16_384, help="Store pages up to n bytes in the task instead of a file (0 equals never)")
+def main(path_logfile, engine, workers, concurrency, timeout,
+         adaptive_timeout, min_timeout, max_timeout, timeout_quantile, timeout_factor, rate, host_concurrency, limit, status,  max_retries,
+         retries, retry_delay, max_retry_delay, batch, domains, exclude_domains,
+         claim, worker_id, lease, stream, batch_size, keyset, max_pending, bulk_size, bulk_delay,
+         breaker, breaker_failure_rate, breaker_blocks, breaker_cooldown, breaker_max_trips,
+         denylist, extract, extract_workers, store_html, codec, inline_size): 
 
     # ------------------- LOGGING -------------------
 
@@ -140,47 +490,166 @@ def main(path_logfile, workers, timeout, limit, status,  max_retries, batch):
 
     # Connect to Database
     fs, db = getConnection(use_dotenv=True)
+    compression.setCodec(codec)
+    setInlineSize(inline_size)
+    logger.info(f"Compression: {compression.codec}, inline up to {inline_size} bytes")
+
+    batch_id = getBatchID(db, batch)
+    logger.info(f"Batch: {batch_id or 'all'}")
 
     # Only retrieve the fields that are necessary for the scraping
     fields = {'media_url': 1, 'url': 1, 'tries': 1}
 
+    # Buffer task updates and send them as bulk writes
+    writer = BulkWriter(db, bulk_size, bulk_delay, logger) if bulk_size else None
+
+    # Number of denylisted urls per reason
+    denylisted = Counter()
+
+    # Shared by the scheduler of every mode
+    breaker = CircuitBreaker(failure_rate=breaker_failure_rate, max_blocks=breaker_blocks,
+                             cooldown=breaker_cooldown, max_trips=breaker_max_trips,
+                             logger=logger) if breaker else None
+
+    # Timeouts per domain, calibrated by the previous runs
+    timeouts = None
+    if adaptive_timeout:
+        timeouts = LatencyTracker(default=timeout, minimum=min_timeout, maximum=max_timeout,
+                                  quantile=timeout_quantile, factor=timeout_factor)
+        timeouts.load(loadLatencies(db))
+        logger.info(f"Latencies of {len(timeouts)} domains loaded")
+
+    # In-run retries share the tries budget of --max_retries
+    retry = partial(retryDelay, retries=retries, base_delay=retry_delay,
+                    max_delay=max_retry_delay, max_retries=max_retries) if retries else None
+
     # ------------------- FETCH TASKS -------------------
 
-    tasks = fetchTasks(db, None, status, limit, fields)
-    logger.info(f"Number of URLs: {len(tasks)}")
+    # Stops the renewal of claimed leases
+    renewing = Event()
+
+    if claim or stream:
+
+        if claim:
+            # Claim tasks in batches while the workers are running
+            worker_id = worker_id or getWorkerID()
+            logger.info(f"Claiming tasks as worker {worker_id}")
+            tasks = claimTasks(db, worker_id, status, batch_id, limit,
+                               max_retries or None, lease, fields, batch_size,
+                               domains, exclude_domains)
+            Thread(target=renewClaims, args=(db, worker_id, lease, renewing, logger),
+                   daemon=True).start()
+        else:
+            # Read tasks from a cursor while the workers are running
+            tasks = fetchTasks(db, batch_id, status, limit, fields,
+                               stream=True, batch_size=batch_size, keyset=keyset,
+                               max_tries=max_retries or None, domains=domains,
+                               exclude_domains=exclude_domains)
+
+        # Urls which can not be scraped never reach the scheduler
+        if denylist:
+            tasks = classifyTasks(tasks, db, denylisted, writer)
+
+        # The scheduler is bounded, so memory stays flat and leases do not
+        # expire while claimed tasks wait in memory
+        scheduler = DomainScheduler(rate=rate, host_concurrency=host_concurrency,
+                                    max_pending=max_pending, breaker=breaker)
+        Thread(target=feedScheduler, args=(scheduler, tasks, logger),
+               daemon=True).start()
 
-    # ------------------- RETRIES -------------------
+    else:
 
-    max_retries = max_retries if max_retries else math.inf
-    tasks = [t for t in tasks if t.get("tries", 0) <= max_retries]
+        # Tasks tried too often are filtered by the query
+        tasks = fetchTasks(db, batch_id, status, limit, fields,
+                           max_tries=max_retries or None, domains=domains,
+                           exclude_domains=exclude_domains)
+        logger.info(f"Number of URLs: {len(tasks)}")
 
-    # ------------------- RANDOMIZE TASKS -------------------
+        # ------------------- DENYLIST -------------------
 
-    # inplace randomization
-    random.shuffle(tasks)
+        if denylist:
+            tasks = list(classifyTasks(tasks, db, denylisted, writer))
+            logger.info(f"Denylisted URLs: {sum(denylisted.values())}")
+
+        # ------------------- RANDOMIZE TASKS -------------------
+
+        # inplace randomization
+        random.shuffle(tasks)
+
+        # ------------------- SCHEDULE TASKS -------------------
+
+        # Every idle worker pulls the next task whose domain may be requested
+        scheduler = DomainScheduler(
+            rate=rate, host_concurrency=host_concurrency, breaker=breaker)
+        feedScheduler(scheduler, tasks, logger)
+
+        logger.info(f"Number of URLs to be scraped: {len(tasks)}")
 
     # ------------------- FETCH CONTENT -------------------
 
-    logger.info(f"Number of URLs to be scraped: {len(tasks)}")
+    # Parsing is CPU bound and runs in its own processes
+    extractor = createExtractor(extract_workers) if extract else None
+    if extract:
+        logger.info(f"Extracting text with {extract_workers} processes")
 
-    # if there is more than worker use threads
-    if workers > 1:
+    try:
 
-        threads = []
+        # the async engine runs all requests in one event loop
+        if engine == "async":
+            asyncio.run(processTasksAsync(
+                scheduler, logger, db, fs, timeout, concurrency, workers, writer,
+                extractor, store_html, timeouts, retry))
 
-        # Create and start one thread per chunk
-        for id, chunk in enumerate(chunkify(tasks, workers)):
-            args = (id, chunk, logger, db, fs, timeout)  # fmt: skip
-            t = Thread(target=processTasks, args=args)
-            threads.append(t)
-            t.start()
+        # if there is more than worker use threads
+        elif workers > 1:
 
-        # Wait for the threads to complete
-        for t in threads:
-            t.join()
+            threads = []
 
-    else:
-        processTasks(-1, tasks, logger, db, fs, timeout)
+            # Create and start the worker threads
+            for id in range(workers):
+                args = (id, scheduler, logger, db, fs, timeout, writer, extractor, store_html, timeouts, retry)  # fmt: skip
+                t = Thread(target=processTasks, args=args)
+                threads.append(t)
+                t.start()
+
+            # Wait for the threads to complete
+            for t in threads:
+                t.join()
+
+        else:
+            processTasks(-1, scheduler, logger, db, fs, timeout, writer,
+                         extractor, store_html, timeouts, retry)
+
+    finally:
+
+        if extractor is not None:
+            extractor.shutdown(wait=True)
+
+        # Write buffered updates before claims are handed back; the rest of
+        # the cleanup runs even if the final flush fails
+        if writer is not None:
+            try:
+                writer.close()
+            except Exception as e:
+                logger.error(f"Bulk writes:  {repr(e)}")
+            logger.info(f"Bulk writes: {writer.metrics()}")
+
+        if denylisted:
+            logger.info(f"Denylisted URLs: {dict(denylisted)}")
+
+        if breaker is not None:
+            logger.info(f"Circuit breaker: {breaker.metrics()}")
+
+        # Keep the latencies for the next run
+        if timeouts is not None:
+            saveLatencies(db, timeouts.changed())
+            logger.info(f"Timeouts: {timeouts.metrics()}")
+
+        # Hand back claimed tasks which were not processed
+        if claim:
+            renewing.set()
+            r = releaseTasks(db, worker_id)
+            logger.info(f"Released {r.modified_count} unprocessed claims")
 
     # ------------------- WRAP UP -------------------
 
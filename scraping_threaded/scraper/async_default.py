@@ -0,0 +1,169 @@
+# ===========================================================================
+#                            Async Scraper
+# ===========================================================================
+# See https://docs.aiohttp.org/en/stable/client.html
+#
+# Asyncio counterpart of the DefaultScraper. A single instance shares one
+# connection pool between all coroutines, so one process can keep thousands
+# of requests in flight while waiting on the network.
+
+from .scraper import Scraper, CappedException
+from .body import BodyBuffer
+from .inspector import inspectContentType, inspectHead
+from schemas.results import ScrapingResult
+from logging import Logger
+from utils.encoding import sniffCharset
+import aiohttp
+import time
+import random
+
+
+# ---------------------------------------------------------------------------
+#                            SCRAPER
+# ---------------------------------------------------------------------------
+
+
+class AsyncScraper(Scraper):
+    """Use aiohttp package to fetch webpage content concurrently"""
+
+    def __init__(
+        self,
+        name: str = "",
+        logger: Logger = Logger(__name__),
+        timeout: float = 5.0,
+        allow_cookies=False,
+        user_agent=None,
+        proxy=None,
+        max_content_length=52_428_800,  # 50MB
+        max_download_time=300,  # 5 minutes
+        chunk_size=16_384,  # first read; reads grow up to 512KB
+        max_connections=1000,
+        max_connections_per_host=0,  # 0 equals no limit
+    ):
+        self.name = name
+        self.logger = logger
+        self.timeout = timeout
+        self.allow_cookies = allow_cookies
+        self.proxy = proxy
+        self.max_content_length = max_content_length
+        self.max_download_time = max_download_time
+        self.chunk_size = chunk_size
+        self.max_connections = max_connections
+        self.max_connections_per_host = max_connections_per_host
+        self.session = None
+
+        # if a user agent is given, then that is the only option in the list
+        if user_agent:
+            self.user_agents = [user_agent]
+        else:
+            self.load_user_agents()
+
+    async def open(self):
+        """Create the client session (must be called inside the event loop)"""
+
+        connector = aiohttp.TCPConnector(
+            limit=self.max_connections,
+            limit_per_host=self.max_connections_per_host,
+            ttl_dns_cache=300,
+        )
+
+        # Same semantics as requests: connect and read timeouts, no total
+        timeout = aiohttp.ClientTimeout(
+            total=None, sock_connect=self.timeout, sock_read=self.timeout)
+
+        cookie_jar = None if self.allow_cookies else aiohttp.DummyCookieJar()
+        self.session = aiohttp.ClientSession(
+            connector=connector, timeout=timeout, cookie_jar=cookie_jar)
+
+        if not self.allow_cookies:
+            self.logger.info(
+                f"Worker {self.name} configured to block all cookies!")
+        if self.proxy:
+            self.logger.info(f"Worker {self.name} uses proxy: {self.proxy}")
+
+    async def close(self):
+        """Close the client session and its connection pool"""
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    async def get(self, result: ScrapingResult, timeout: float = None) -> ScrapingResult:
+        """Fetch webpage content (timeout overrides the default of the scraper)"""
+
+        # ------------------- User Agent -------------------
+
+        # Randomly pull a user agent
+        headers = {"User-Agent": random.choice(self.user_agents)}
+
+        # ------------------- Request -------------------
+
+        # A per-request timeout replaces the one of the session
+        if timeout:
+            timeout = aiohttp.ClientTimeout(
+                total=None, sock_connect=timeout, sock_read=timeout)
+
+        # Request webpage content
+        request_start = time.perf_counter()
+        async with self.session.get(
+            result.target_url, allow_redirects=True, headers=headers, proxy=self.proxy,
+            timeout=timeout or self.session.timeout
+        ) as request:
+
+            # The response is known once the headers are in, so a download
+            # which is stopped below still records where it landed
+            result.landing_url = str(request.url)
+            result.status_code = request.status
+            result.elapsed = time.perf_counter() - request_start
+            result.headers = dict(request.headers)
+
+            # ------------------- Check Headers -------------------
+
+            # Check response size via header:
+            # "Content-Length" is length of content in bytes
+            content_length = request.headers.get("Content-Length")
+            if content_length:
+                if int(content_length) > self.max_content_length:
+                    raise CappedException("Content-Length headers too large : " +
+                                          content_length + " bytes", CappedException.HEADERS_TOO_LARGE)
+
+            # Check content type via header:
+            # images, pdfs, media and other files are not webpages
+            content_type = request.headers.get('Content-Type')
+            inspectContentType(content_type)
+
+            # ------------------- Read Content Stream  -------------------
+
+            # Reads go straight into one buffer; the buffer enforces the size cap
+            body = BodyBuffer(int(content_length) if content_length else None,
+                              self.max_content_length, min_read=self.chunk_size,
+                              inspect=inspectHead)
+            start_time = time.monotonic()
+
+            while chunk := await request.content.read(body.next_read()):
+
+                # Abort if response takes to long
+                if time.monotonic() - start_time > self.max_download_time:
+                    raise CappedException(
+                        "Response takes too long to download!", CappedException.TOO_LONG)
+
+                body.write(chunk)
+
+            # The raw bytes are kept and only decoded at extraction time;
+            # the charset sniffed from the first KB is a hint
+            content = body.getvalue()
+            encoding = sniffCharset(content, content_type)
+
+            # ------------------- Store Results -------------------
+
+            result.content = content
+            result.encoding = encoding
+
+        return result
+
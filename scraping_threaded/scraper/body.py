@@ -0,0 +1,88 @@
+# ===========================================================================
+#                            Response Body Buffer
+# ===========================================================================
+# Collects a response body in one preallocated bytearray instead of a list
+# of small chunks which are joined at the end. The buffer is sized from the
+# "Content-Length" header when it is given (up to `max_initial`, since the
+# header is not trusted) and grows by doubling otherwise.
+# Reads start small and grow with every read, so small pages are read in
+# one or two calls and large pages do not need thousands of iterations.
+# An inspector sees the first KB once they arrive and may stop the download.
+
+from .scraper import CappedException
+
+
+class BodyBuffer:
+    """Growable buffer for a response body with a size cap"""
+
+    def __init__(
+        self,
+        content_length: int = None,  # expected size from the header
+        max_size: int = 52_428_800,  # 50MB
+        min_read: int = 16_384,
+        max_read: int = 524_288,
+        inspect=None,  # called once with the first `inspect_size` bytes
+        inspect_size: int = 4096,
+        max_initial: int = 2_097_152,  # 2MB; larger bodies grow by doubling
+    ):
+        self.max_size = max_size
+        self.min_read = min_read
+        self.max_read = max_read
+        self.content_length = content_length
+        self.size = 0
+        self.reads = 0
+        self.inspect = inspect
+        self.inspect_size = inspect_size
+
+        # One byte more than announced, so a correct header of a page needs
+        # no growth; a large announced size is only allocated as it arrives
+        initial = content_length + 1 if content_length else min_read * 4
+        self._buffer = bytearray(min(initial, max_initial, max_size + 1))
+        self._read_size = min_read
+
+    def next_read(self) -> int:
+        """Returns the number of bytes to request with the next read"""
+
+        size = self._read_size
+        self._read_size = min(self._read_size * 2, self.max_read)
+
+        # Ask for the rest of an announced body at once (within limits),
+        # but only after the first read was inspected
+        if self.reads and self.content_length and self.content_length > self.size:
+            size = max(size, min(self.content_length - self.size, self.max_read))
+        return size
+
+    def write(self, chunk):
+        """Appends a chunk; raises a CappedException above the size cap"""
+
+        end = self.size + len(chunk)
+        if end > self.max_size:
+            raise CappedException(
+                "Response too large: " + str(end) + " bytes", CappedException.TOO_LARGE)
+
+        # Grow by doubling (but not beyond the cap)
+        if end > len(self._buffer):
+            capacity = min(max(end, 2 * len(self._buffer)), self.max_size + 1)
+            self._buffer.extend(bytes(capacity - len(self._buffer)))
+
+        self._buffer[self.size:end] = chunk
+        self.size = end
+        self.reads += 1
+
+        if self.inspect is not None and self.size >= self.inspect_size:
+            self._inspect()
+
+    def _inspect(self):
+        inspect, self.inspect = self.inspect, None
+        with memoryview(self._buffer) as view:
+            inspect(bytes(view[:min(self.size, self.inspect_size)]))
+
+    def getvalue(self) -> bytes:
+        """Returns the body (the only copy of the data)
+
+        Bodies shorter than `inspect_size` are inspected here.
+        """
+        if self.inspect is not None:
+            self._inspect()
+        with memoryview(self._buffer) as view:
+            return bytes(view[:self.size])
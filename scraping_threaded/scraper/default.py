@@ -4,10 +4,13 @@
 # See https://requests.readthedocs.io/en/latest/
 
 from .scraper import Scraper, CappedException
+from .body import BodyBuffer
+from .inspector import inspectContentType, inspectHead
 from schemas.results import ScrapingResult
 from logging import Logger
 from http import cookiejar
-from charset_normalizer import detect
+from utils.encoding import sniffCharset
+from urllib3.exceptions import ProtocolError, DecodeError, ReadTimeoutError, SSLError
 import requests
 import time
 import random
@@ -44,7 +47,7 @@ class DefaultScraper(Scraper):
         proxies=None,
         max_content_length=52_428_800,  # 50MB
         max_download_time=300,  # 5 minutes
-        chunk_size=1024,
+        chunk_size=16_384,  # first read; reads grow up to 512KB
     ):
         self.name = name
         self.logger = logger
@@ -68,15 +71,8 @@ class DefaultScraper(Scraper):
             self.session.proxies.update(proxies)
             self.logger.info(f"Worker {name} uses proxies: {proxies}")
 
-    def load_user_agents(self):
-        """Load the user gents file"""
-
-        # Open the list of user agents
-        with open("user_agents.txt", "r") as file:
-            self.user_agents = [line.strip() for line in file.readlines()]
-
-    def get(self, result: ScrapingResult) -> ScrapingResult:
-        """Fetch webpage content"""
+    def get(self, result: ScrapingResult, timeout: float = None) -> ScrapingResult:
+        """Fetch webpage content (timeout overrides the default of the scraper)"""
 
         # ------------------- User Agent -------------------
 
@@ -88,77 +84,73 @@ class DefaultScraper(Scraper):
 
         # Request webpage content
         request = self.session.get(
-            result.target_url, allow_redirects=True, timeout=self.timeout, stream=True
+            result.target_url, allow_redirects=True, timeout=timeout or self.timeout, stream=True
         )
 
-        # ------------------- Check Headers -------------------
-
-        # Check response size via header:
-        # "Content-Length" is length of content in bytes
-        content_length = request.headers.get("Content-Length")
-        if content_length:
-            if int(content_length) > self.max_content_length:
-                raise CappedException("Content-Length headers too large : " +
-                                      content_length + " bytes", CappedException.HEADERS_TOO_LARGE)
-
-        # Check contenty type via header:
-        # "Content-Type" is length of content in bytes
-        content_type = request.headers.get('Content-Type')
-        if content_type:
-            if content_type.startswith('audio/'):
-                raise CappedException(
-                    "Content-Type is audio: " + content_type + " bytes", CappedException.CONTENT_AUDIO)
-            elif content_type.startswith('video/'):
-                raise CappedException(
-                    "Content-Type is video: " + content_type + " bytes", CappedException.CONTENT_VIDEO)
-
-        # ------------------- Read Content Stream  -------------------
-
-        content_size = 0
-        start_time = time.time()
-        chunks = []
-
-        # Read stream of webpage content in chunks
-        for chunk in request.iter_content(self.chunk_size):
-
-            # Abort if response takes to long
-            if time.time() - start_time > self.max_download_time:
-                raise CappedException(
-                    "Response takes too long to download!", CappedException.TOO_LONG)
-
-            # Abort if response is too large
-            content_size += len(chunk)
-            if content_size > self.max_content_length:
-                raise CappedException(
-                    "Response too large: " + content_size + " bytes", CappedException.TOO_LARGE)
-
-            chunks.append(chunk)
-
-        # Decode content stream to string
-        joined_chunks = b"".join(chunks)
-        encoding = request.encoding if request.encoding is not None else detect(joined_chunks)[
-            'encoding']
-
+        # Aborted downloads hand their connection back to the pool as well
         try:
-            # if fails (e.g., it could be None), then try recognizing it
-            response_content = joined_chunks.decode(encoding)
-        except:
+
+            # The response is known once the headers are in, so a download
+            # which is stopped below still records where it landed
+            result.landing_url = request.url
+            result.status_code = request.status_code
+            result.elapsed = request.elapsed.total_seconds()
+            result.headers = request.headers
+
+            # ------------------- Check Headers -------------------
+
+            # Check response size via header:
+            # "Content-Length" is length of content in bytes
+            content_length = request.headers.get("Content-Length")
+            if content_length:
+                if int(content_length) > self.max_content_length:
+                    raise CappedException("Content-Length headers too large : " +
+                                          content_length + " bytes", CappedException.HEADERS_TOO_LARGE)
+
+            # Check content type via header:
+            # images, pdfs, media and other files are not webpages
+            content_type = request.headers.get('Content-Type')
+            inspectContentType(content_type)
+
+            # ------------------- Read Content Stream  -------------------
+
+            # Reads go straight into one buffer; the buffer enforces the size cap
+            body = BodyBuffer(int(content_length) if content_length else None,
+                              self.max_content_length, min_read=self.chunk_size,
+                              inspect=inspectHead)
+            start_time = time.monotonic()
+
             try:
-                # try utf-8, the most likely
-                encoding = "utf-8"
-                response_content = joined_chunks.decode("utf-8")
-            except Exception as e:
-                # just point there was a decoding error (but this is not a "FAILED",
-                # request) - maybe there is a way of saving joined_chunks?
-                response_content = 'DECODING_ERROR'
-
-        # ------------------- Store Results -------------------
-
-        result.landing_url = request.url
-        result.status_code = request.status_code
-        result.content_html = response_content  # static.content
-        result.encoding = encoding
-        result.elapsed = request.elapsed.total_seconds()
-        result.headers = request.headers
-
-        return result
+                while chunk := request.raw.read(body.next_read(), decode_content=True):
+
+                    # Abort if response takes to long
+                    if time.monotonic() - start_time > self.max_download_time:
+                        raise CappedException(
+                            "Response takes too long to download!", CappedException.TOO_LONG)
+
+                    body.write(chunk)
+
+            # Same exceptions as iter_content raises
+            except ProtocolError as e:
+                raise requests.exceptions.ChunkedEncodingError(e)
+            except DecodeError as e:
+                raise requests.exceptions.ContentDecodingError(e)
+            except ReadTimeoutError as e:
+                raise requests.exceptions.ConnectionError(e)
+            except SSLError as e:
+                raise requests.exceptions.SSLError(e)
+
+            # The raw bytes are kept and only decoded at extraction time;
+            # the charset sniffed from the first KB is a hint
+            content = body.getvalue()
+            encoding = sniffCharset(content, content_type)
+
+            # ------------------- Store Results -------------------
+
+            result.content = content  # static.content
+            result.encoding = encoding
+
+            return result
+
+        finally:
+            request.close()
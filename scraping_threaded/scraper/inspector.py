@@ -0,0 +1,89 @@
+# ===========================================================================
+#                            Content Inspector
+# ===========================================================================
+# Looks at the first bytes of a response while it is downloaded. Files
+# (images, pdfs, archives, media) are recognised by their magic bytes and
+# known block and error pages by phrases in their first KB, so the download
+# stops before the rest is transferred, stored and parsed.
+
+from .scraper import CappedException
+from scraping_support_scripts import hard_coded_errors as e
+from scraping_support_scripts.phrase_matcher import PhraseMatcher
+
+# Bytes of the body which are inspected
+INSPECT_SIZE = 4096
+
+# Magic bytes at the start of a file and the resulting capped type
+magic_bytes = [
+    (b"%PDF-", CappedException.CONTENT_PDF),
+    (b"\x89PNG\r\n\x1a\n", CappedException.CONTENT_IMAGE),
+    (b"\xff\xd8\xff", CappedException.CONTENT_IMAGE),
+    (b"GIF87a", CappedException.CONTENT_IMAGE),
+    (b"GIF89a", CappedException.CONTENT_IMAGE),
+    (b"ID3", CappedException.CONTENT_AUDIO),
+    (b"OggS", CappedException.CONTENT_AUDIO),
+    (b"fLaC", CappedException.CONTENT_AUDIO),
+    (b"\x1a\x45\xdf\xa3", CappedException.CONTENT_VIDEO),  # webm, mkv
+    (b"PK\x03\x04", CappedException.CONTENT_BINARY),  # zip, docx, epub
+    (b"\x1f\x8b", CappedException.CONTENT_BINARY),  # gzip file
+    (b"\x7fELF", CappedException.CONTENT_BINARY),
+]
+
+# Content-Types which are not worth downloading
+binary_types = {
+    "audio/": CappedException.CONTENT_AUDIO,
+    "video/": CappedException.CONTENT_VIDEO,
+    "image/": CappedException.CONTENT_IMAGE,
+    "application/pdf": CappedException.CONTENT_PDF,
+    "application/octet-stream": CappedException.CONTENT_BINARY,
+    "application/zip": CappedException.CONTENT_BINARY,
+    "font/": CappedException.CONTENT_BINARY,
+}
+
+# Capped types of pages which were received, but are not worth storing;
+# unlike files and network errors they are a final result of the task
+page_types = {CappedException.BLOCK_PAGE, CappedException.ERROR_PAGE}
+
+# Block and error pages, recognised in the lowercase first KB, with the
+# error labels which the soup checks use for the same pages
+page_errors = {
+    'ERROR: Blocked from website': CappedException.BLOCK_PAGE,
+    'ERROR: 403 Forbidden': CappedException.ERROR_PAGE,
+    'ERROR: 404 Page not found': CappedException.ERROR_PAGE,
+}
+page_matcher = PhraseMatcher([
+    ('ERROR: Blocked from website', 'contains', e.early_abort_text_errors['Blocked from website']),
+    ('ERROR: 403 Forbidden', 'contains', e.early_abort_text_errors['403 Forbidden']),
+    ('ERROR: 404 Page not found', 'contains', e.early_abort_text_errors['404 Page not found']),
+])
+
+
+def inspectContentType(content_type: str):
+    """Raises a CappedException for Content-Types which are not webpages"""
+    if not content_type:
+        return
+    content_type = content_type.lower()
+    for prefix, capped_type in binary_types.items():
+        if content_type.startswith(prefix):
+            raise CappedException(
+                "Content-Type is not a webpage: " + content_type, capped_type)
+
+
+def inspectHead(head: bytes):
+    """Raises a CappedException if the start of a body is a file or an error page"""
+
+    # Media sometimes comes with a text/html Content-Type
+    for magic, capped_type in magic_bytes:
+        if head.startswith(magic):
+            raise CappedException(
+                "Body is not a webpage: " + repr(head[:8]), capped_type)
+    if head[4:8] == b"ftyp":  # mp4, mov, m4a
+        raise CappedException("Body is not a webpage: " + repr(head[:12]),
+                              CappedException.CONTENT_VIDEO)
+
+    # Phrases are ASCII, so the encoding does not matter here
+    text = head[:INSPECT_SIZE].decode("utf-8", errors="ignore").lower()
+    error = page_matcher.last(text, default=None)
+    if error is not None:
+        raise CappedException(
+            "Body is a block or error page: " + error, page_errors[error], error)
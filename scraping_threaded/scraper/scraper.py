@@ -11,14 +11,22 @@ class CappedException(Exception):
     HEADERS_TOO_LARGE = "HEADERS_TOO_LARGE"
     CONTENT_AUDIO = "CONTENT_AUDIO"
     CONTENT_VIDEO = "CONTENT_VIDEO"
+    CONTENT_IMAGE = "CONTENT_IMAGE"
+    CONTENT_PDF = "CONTENT_PDF"
+    CONTENT_BINARY = "CONTENT_BINARY"
+    BLOCK_PAGE = "BLOCK_PAGE"
+    ERROR_PAGE = "ERROR_PAGE"
 
-    def __init__(self, message, capped_type):
+    def __init__(self, message, capped_type, parsing_error=None):
         # Call the base class constructor with the parameters it needs
         super().__init__(message)
 
         # Capped type
         self.capped_type = capped_type
 
+        # Error label of a recognised page (e.g. 'ERROR: 403 Forbidden')
+        self.parsing_error = parsing_error
+
 
 class Scraper(ABC):
     """Abstract scraper class"""
@@ -26,6 +34,13 @@ class Scraper(ABC):
     def __init__(self):
         pass
 
+    def load_user_agents(self):
+        """Load the user gents file"""
+
+        # Open the list of user agents
+        with open("user_agents.txt", "r") as file:
+            self.user_agents = [line.strip() for line in file.readlines()]
+
     @abstractmethod
     def get(self, url):
         pass
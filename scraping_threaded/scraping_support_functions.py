@@ -1,376 +1,458 @@
 from scraping_support_scripts import hard_coded_errors as e
+from scraping_support_scripts.phrase_matcher import PhraseMatcher
+from scraping_support_scripts.site_registry import SiteRegistry, split_patterns
+from bs4 import BeautifulSoup as bs
 import re
 import json
-from lxml import etree
 
 
-def check_scrapability(url: str):
-    # For urls that will never be able to be scraped
-    error = True  # returns true if the url is not any of the ones listed below
+# ---------------------------------------------------------------------------
+# Urls which will never be able to be scraped. The rules only look at the
+# url, so they run before a page is fetched. When several rules match, the
+# one registered last wins, like in the former chain of loops.
+# ---------------------------------------------------------------------------
 
-    for item in e.n_scrapable_url_errors['Website is no longer maintained']:
-        if item in url:
-            error = 'ERROR: Website is no longer maintained'
+url_rules = SiteRegistry()
 
-    for elt in e.n_scrapable_url_errors['Video/ Image content only']:
-        if elt in url:
-            error = 'ERROR: Video/ Image content only'
 
-    if url.endswith('.jpg'):
-        error = 'ERROR: Video/ Image content only'
+def never_scrapable(error, patterns):
+    # Register an error for a list of hostnames and url substrings
+    hosts, substrings = split_patterns(patterns)
+    url_rules.register(lambda url: error, hosts, substrings)
 
-    for obj in e.n_scrapable_url_errors['Not scrapable content']:
-        if obj in url:
-            error = 'ERROR: Not scrapable content'
 
-    if 'msnbc' in url and 'watch' in url:
-        error = 'ERROR: Video/ Image content only'
-    if 'ir.voanews' in url or 'paper.li' in url or "hani.co.kr" in url or 'destentor.nl' in url or 'thenewsdoctors.com' in url:
-        error = 'ERROR: Not in English'
-    if '.pdf' in url:
-        error = 'ERROR: Content is a pdf'
+never_scrapable('ERROR: Website is no longer maintained',
+                e.n_scrapable_url_errors['Website is no longer maintained'])
+never_scrapable('ERROR: Video/ Image content only',
+                e.n_scrapable_url_errors['Video/ Image content only'])
+url_rules.register(
+    lambda url: 'ERROR: Video/ Image content only' if url.endswith('.jpg') else None, always=True)
+never_scrapable('ERROR: Not scrapable content',
+                e.n_scrapable_url_errors['Not scrapable content'])
+url_rules.register(
+    lambda url: 'ERROR: Video/ Image content only' if 'watch' in url else None, substrings=['msnbc'])
+never_scrapable('ERROR: Not in English',
+                ['ir.voanews', 'paper.li', 'hani.co.kr', 'destentor.nl', 'thenewsdoctors.com'])
+never_scrapable('ERROR: Content is a pdf', ['.pdf'])
+never_scrapable('ERROR: Must enable cookies to access site',
+                ['calciomercato.com', 'shadowandact.com'])
 
-    if 'calciomercato.com' in url or 'shadowandact.com' in url:
-        error = 'ERROR: Must enable cookies to access site'
+
+def check_scrapability(url: str):
+    # For urls that will never be able to be scraped
+    error = True  # returns true if the url is not any of the ones listed below
+    for rule in url_rules.lookup(url):
+        error = rule(url) or error
     return error
 
 
+# Explicit error messages in the soup contents, in the order of the original
+# checks: if several rules match, the one listed last determines the error
+soup_validity_rules = [
+    ('ERROR: 401 Authorization Required', 'contains', ['401 authorization required', 'user is not authorized to perform this action']),
+    ('ERROR: 403 Forbidden', 'contains', e.soup_contents_text_errors['403 Forbidden']),
+    ('ERROR: 403 Forbidden', 'equals', ['forbidden', '403']),
+    ('ERROR: 404 Page not found', 'equals', ['Looks like something went wrong.'.lower(), 'Something went wrong. Wait a moment and try again.'.lower()]),
+    ('ERROR: 404 Page not found', 'equals', [' BLACKLISTED NEWS FAVORITES'.lower()]),
+    ('ERROR: 404 Page not found', 'contains', e.soup_contents_text_errors['404 Page not found']),
+    ('ERROR: 404 Page not found', 'equals', ['not found']),
+    ('ERROR: 406 Not Acceptable', 'equals', ['not acceptable']),
+    ('ERROR: 406 Not Acceptable', 'contains', ['406 not acceptable']),
+    ('ERROR: 410 Deleted', 'contains', ['410 deleted by author']),
+    ('ERROR: 451 Unavailable for legal reasons', 'contains', e.soup_contents_text_errors['451 Unavailable for legal reasons']),
+    ('ERROR: 502 gateway error', 'contains', ['reported a bad gateway error', '502 bad gateway']),
+    ("ERROR: Article has been archived", 'contains', ['this content has been removed']),
+    ("ERROR: Article behind a paywall or login page", 'contains', e.soup_contents_text_errors['Article behind a paywall or login page']),
+    ("ERROR: Article not found", 'contains', e.soup_contents_text_errors['Article not found']),
+    ('ERROR: Blocked from website', 'contains', ['blocked your ip']),
+    ('ERROR: Blocked from website', 'equals', ['too many requests']),
+    ('ERROR: Blocked from website', 'contains', e.soup_contents_text_errors['Blocked from website']),
+    ("ERROR: Client-Side Exception", 'contains', ['client-side exception']),
+    ('ERROR: Connection Issue', 'contains', ['an unknown connection issue between Cloudflare and the origin web server'.lower()]),
+    ('ERROR: Internal Server Error', 'contains', ['internal server error']),
+    ('ERROR: Mod_Security server-side error', 'contains', ['This error was generated by Mod_Security'.lower()]),
+    ('ERROR: Must enable cookies to access site', 'contains', e.soup_contents_text_errors['Must enable cookies to access site']),
+    ('ERROR: Provided host name is not valid for this server', 'contains', ['The provided host name is not valid for this server.'.lower()]),
+    ("ERROR: Server side connection error", 'contains', ['server temporarily unavailable']),
+    ('ERROR: Video/ Image content only', 'contains', ['\nvia youtube']),
+]
+
+# Compiled once, so every page is scanned a single time
+soup_validity_matcher = PhraseMatcher(soup_validity_rules)
+
+
 def check_soup_validity(low_soup_text: str) -> str:
     # Check for explicit error messages in the soup contents
-    error = True
-    if '401 authorization required' in low_soup_text or 'user is not authorized to perform this action' in low_soup_text:
-        error = 'ERROR: 401 Authorization Required'
-
-    for f in e.soup_contents_text_errors['403 Forbidden']:
-        if f in low_soup_text:
-            error = 'ERROR: 403 Forbidden'
-    if low_soup_text == 'forbidden' or low_soup_text == '403':
-        error = 'ERROR: 403 Forbidden'
+    return soup_validity_matcher.last(low_soup_text, default=True)
+
+
+# Block pages (e.g. Cloudflare) are short, while articles may quote the phrases
+block_page_matcher = PhraseMatcher(
+    [('ERROR: Blocked from website', 'contains', e.block_page_text_errors)])
+
+
+def is_block_page(html, max_length: int = 50_000) -> bool:
+    # Check the raw html (str or bytes) of a response for a block page
+    if not html or len(html) > max_length:
+        return False
+    if isinstance(html, bytes):
+        html = html.decode('utf-8', errors='ignore')
+    return len(block_page_matcher.ranks(html.lower())) > 0
+
+
+# ---------------------------------------------------------------------------
+# Site specific extraction. Every extractor is registered for the hosts
+# (or url substrings) it handles; do_alternative_scraping looks up the host
+# of an url once. New outlets (e.g. from a plugin module) are added with
+#
+#   @ss.alternative_scrapers.site('example.com', substrings=['/example/'])
+#   def scrape_example(page): ...
+#
+# Extractors receive the parsed Page, so the document is parsed only once.
+# They are tried in registration order. An extractor which returns None
+# hands over to the next matching one, like the former if-chain.
+# ---------------------------------------------------------------------------
+
+alternative_scrapers = SiteRegistry()
+
+
+@alternative_scrapers.site('qz.com', 'newtimes.com.rw', 'newtimes.co.rw', 'newsweek.com', 'scmp.com')
+def scrape_app_json_article_body(page):
+    if 'Forbidden' in page.html:
+        return 'ERROR: 403 Forbidden'
+    for jte in page.json_ld:
+        if 'articleBody' in jte.string:
+            json_obj = json.loads(jte.string)
+            try:
+                article_text = json_obj['articleBody']
+                return article_text
+            except KeyError:
+                return 'ERROR: No text gathered'
+    stripped_paragraph = page.paragraph_texts
+    if len(stripped_paragraph) > 0:
+        return " ".join(stripped_paragraph)
+    return 'ERROR: No text gathered'
+
+
+@alternative_scrapers.site('miamiherald.typepad.com')
+def scrape_miamiherald_typepad(page):
+    div_elts = page.soup.find_all('div', attrs={'id': "story-content"})
+    stripped = [tag.get_text().strip() for tag in div_elts]
+    return " ".join(stripped)
+
+
+@alternative_scrapers.site('dailywire.com')
+def scrape_dailywire(page):
+    div_elts = page.soup.find_all('div', attrs={'id': 'post-body-text'})
+    stripped = [tag.get_text().strip() for tag in div_elts]
+    return " ".join(stripped)
+
+
+@alternative_scrapers.site('nationalreview.com')
+def scrape_nationalreview(page):
+    # Original version: This has worked at least three times
+    js_var = re.findall(
+        r'nr.headless.preloadedData = .*;', page.html)  # debug
+    if len(js_var) > 0:
+        js_var_data = js_var[0].replace(
+            'nr.headless.preloadedData = ', '')[:-1]
+        json_obj = json.loads(js_var_data)
+        first_key = list(json_obj.keys())[0]
+        content = json_obj[first_key]['body']['queried_object']['content']['rendered']
+        js_soup = bs(content, 'html.parser')
+        text = js_soup.get_text().strip()
+        return text
+    return 'ERROR: No text fathered'
+
+
+@alternative_scrapers.site('columbiaspectator.com')
+def scrape_columbiaspectator(page):
+    fusion_global_content = re.findall(r'Fusion\.globalContent=.*?};',
+                                       page.html)  # find the data given the variable name
+    fg_contents = fusion_global_content[0].replace('Fusion.globalContent=', '')[
+        :-1]  # get the contents of the variables
+    json_vers = json.loads(fg_contents)  # make it a json obj
+    # get the relevant section of the json obj
+    content_elts = json_vers['content_elements']
+    text = []
+    for item in content_elts:
+        if item['type'] == 'text':
+            text.append(item['content'])
+    return " ".join(text)
+
+
+@alternative_scrapers.site(substrings=['toledoblade'])
+def scrape_toledoblade(page):
+    json_type_elts = [s for s in page.scripts if s.string and 'JSON' in s.string]
+    for jte in json_type_elts:
+        if 'pgStoryZeroJSON' in jte.string:
+            cleaned_json = jte.string.replace(
+                'pgStoryZeroJSON = ', '').replace('\n', '')
+            try:
+                json_version = json.loads(cleaned_json)
+                article_body = json_version['articles'][0]['body']
+                soup_obj = bs(article_body, 'html.parser')
+                text = soup_obj.get_text().strip()
+                return text  # works, 11
+            except json.decoder.JSONDecodeError:
+                article_regex = re.findall(r'body": ".*?",', cleaned_json)
+                cleaned_article_regex = article_regex[0].replace(
+                    'body": "', '').replace('"', '')
+                soup_obj = bs(cleaned_article_regex, 'html.parser')
+                text = soup_obj.get_text().strip()
+                return text
+    return None
 
-    if 'Looks like something went wrong.'.lower() == low_soup_text or 'Something went wrong. Wait a moment and try again.'.lower() == low_soup_text:
-        error = 'ERROR: 404 Page not found'
-    if ' BLACKLISTED NEWS FAVORITES'.lower() == low_soup_text:
-        error = 'ERROR: 404 Page not found'
-    for n in e.soup_contents_text_errors['404 Page not found']:
-        if n in low_soup_text:
-            error = 'ERROR: 404 Page not found'
-    if low_soup_text == 'not found':
-        error = 'ERROR: 404 Page not found'
 
-    if low_soup_text == 'not acceptable':
-        error = 'ERROR: 406 Not Acceptable'
-    if '406 not acceptable' in low_soup_text:
-        error = 'ERROR: 406 Not Acceptable'
+@alternative_scrapers.site(substrings=['blacknews.com/news'])
+def scrape_blacknews(page):
+    div_elts = page.soup.find_all(
+        'div', attrs={'class': "post-body entry-content"})
+    stripped = [tag.get_text().strip() for tag in div_elts]
+    return " ".join(stripped)
 
-    if '410 deleted by author' in low_soup_text:
-        error = 'ERROR: 410 Deleted'
 
-    for elt in e.soup_contents_text_errors['451 Unavailable for legal reasons']:
-        if elt in low_soup_text:
-            error = 'ERROR: 451 Unavailable for legal reasons'
+@alternative_scrapers.site(substrings=['thepoliticalinsider'])
+def scrape_thepoliticalinsider(page):
+    blog_div_elts = page.soup.find_all(
+        'div', attrs={'class': 'text article-body font-default font-size-med'})
+    stripped = [tag.get_text().strip() for tag in blog_div_elts]
+    if len(stripped) > 0:
+        return " ".join(stripped)
+    script_variable = re.findall(
+        r'class="yoast-schema-graph">[\S\s]*?<\/script>', page.html)
+    try:
+        script_data = script_variable[0].replace(
+            'class="yoast-schema-graph">', '').replace('</script>', '')
+        json_option = json.loads(script_data)
+        dv = True  # Todo: finsih this
+    except IndexError:
+        return "ERROR: Scraping error during JSON conversion"
+    return None
 
-    if 'reported a bad gateway error' in low_soup_text or '502 bad gateway' in low_soup_text:
-        error = 'ERROR: 502 gateway error'
 
-    if 'this content has been removed' in low_soup_text:
-        error = "ERROR: Article has been archived"
+@alternative_scrapers.site(substrings=['ibtimes.co'])  # also covers ibtimes.com
+def scrape_ibtimes(page):
+    if 'Forbidden' in page.html:
+        return 'ERROR: 403 Forbidden'
+    # json_obj = json.loads(json_type_elts[-1].text)
+    # contents = json_obj['props']['pageProps']['pageContent']['parsedBody']
+    # text = [content for content in contents if isinstance(content, str)]
+    # return " ".join(text)
+    return 'ERROR: No text gathered'
 
-    for obj in e.soup_contents_text_errors['Article behind a paywall or login page']:
-        if obj in low_soup_text:
-            error = "ERROR: Article behind a paywall or login page"
 
-    for item in e.soup_contents_text_errors['Article not found']:
-        if item in low_soup_text:
-            error = "ERROR: Article not found"
+@alternative_scrapers.site('tampabay.com')
+def scrape_tampabay(page):
+    return 'ERROR: No text gathered'  # Doesnt seem to work
 
-    if 'blocked your ip' in low_soup_text or low_soup_text == 'too many requests':
-        error = 'ERROR: Blocked from website'
-    for b in e.soup_contents_text_errors['Blocked from website']:
-        if b in low_soup_text:
-            error = 'ERROR: Blocked from website'
 
-    if 'client-side exception' in low_soup_text:
-        error = "ERROR: Client-Side Exception"
+@alternative_scrapers.site('newsday.com')
+def scrape_newsday(page):
+    try:
+        for elt in page.json_scripts:
+            if 'bodyText' in elt.string:
+                json_version = json.loads(elt.string)
+                text = json_version['props']['pageProps']['data']['page']['leaf']['bodyText']
+                return text
+        return 'ERROR: No text gathered'
+    except IndexError:
+        return 'ERROR: No text gathered'
+    except KeyError:
+        return 'ERROR: No text gathered'
 
-    if 'an unknown connection issue between Cloudflare and the origin web server'.lower() in low_soup_text:
-        error = 'ERROR: Connection Issue'
 
-    if 'internal server error' in low_soup_text:
-        error = 'ERROR: Internal Server Error'
+@alternative_scrapers.site(substrings=['timesofindia'])
+def scrape_timesofindia(page):
+    if 'videoshow' in page.url or '/photostory' in page.url:
+        return "ERROR: Video/ Image content only"
+    alt_elts = page.soup.find_all('div', attrs={'data-articlebody': '1'})
+    stripped = [tag.get_text().strip() for tag in alt_elts]
+    if len(stripped) < 1:
+        blog_div_elts = page.soup.find_all(
+            'div', attrs={'class': 'main-content single-article-content'})
+        stripped = [tag.get_text().strip() for tag in blog_div_elts]
+        if len(stripped) < 1:
+            return 'ERROR: No text gathered'
+        return " ".join(stripped)
+    return " ".join(stripped)
 
-    if 'This error was generated by Mod_Security'.lower() in low_soup_text:
-        error = 'ERROR: Mod_Security server-side error'
 
-    for j in e.soup_contents_text_errors['Must enable cookies to access site']:
-        if j in low_soup_text:
-            error = 'ERROR: Must enable cookies to access site'
+@alternative_scrapers.site('newsmax.com')
+def scrape_newsmax(page):
+    div_elts = page.soup.find_all('div', id='mainArticleDiv')
+    stripped = [tag.get_text().strip() for tag in div_elts]
+    return " ".join(stripped)
 
-    if 'The provided host name is not valid for this server.'.lower() in low_soup_text:
-        error = 'ERROR: Provided host name is not valid for this server'
 
-    if 'server temporarily unavailable' in low_soup_text:
-        error = "ERROR: Server side connection error"
+@alternative_scrapers.site('sbs.com.au')
+def scrape_sbs(page):
+    json_obj = json.loads(page.json_scripts[-1].string)
+    contents = json_obj['props']['pageProps']['pageContent']['parsedBody']
+    text = [content for content in contents if isinstance(content, str)]
+    return " ".join(text)
 
-    if '\nvia youtube' in low_soup_text:
-        error = 'ERROR: Video/ Image content only'
 
-    return error
+@alternative_scrapers.site(substrings=['NDTV-LatestNews'])
+def scrape_ndtv(page):
+    div_elts = page.soup.find_all('div', id='ins_storybody')
+    stripped = [tag.get_text().strip() for tag in div_elts]
+    return " ".join(stripped)
 
 
-def do_alternative_scraping(url, response, soup):
-    app_json_art_body = ['qz.com', 'newtimes.com.rw',
-                         'newtimes.co.rw', 'newsweek.com', 'scmp.com']
-    for a in app_json_art_body:
-        if a in url:
-            if 'Forbidden' in response:
-                return 'ERROR: 403 Forbidden'
-            tree = etree.HTML(response)
-            json_type_elts = tree.xpath(
-                '//script[@type="application/ld+json"]')
-            for jte in json_type_elts:
-                if 'articleBody' in jte.text:
-                    json_obj = json.loads(jte.text)
-                    try:
-                        article_text = json_obj['articleBody']
-                        return article_text
-                    except KeyError:
-                        return 'ERROR: No text gathered'
-            paragraphs = soup.find_all('p')
-            stripped_paragraph = [tag.get_text().strip() for tag in paragraphs]
-            if len(stripped_paragraph) > 0:
-                return " ".join(stripped_paragraph)
-            return 'ERROR: No text gathered'
-    if 'miamiherald.typepad.com' in url:
-        div_elts = soup.find_all('div', attrs={'id': "story-content"})
-        stripped = [tag.get_text().strip() for tag in div_elts]
-        return " ".join(stripped)
-    if 'dailywire.com' in url:
-        div_elts = soup.find_all('div', attrs={'id': 'post-body-text'})
-        stripped = [tag.get_text().strip() for tag in div_elts]
-        return " ".join(stripped)
-    if 'nationalreview.com' in url:
-        # Try with tree
-        tree = etree.HTML(response)
-        json_type_elts = tree.xpath('//script[@type="text/javascript"]')
-
-        # Original version: This has worked at least three times
-        js_var = re.findall(
-            r'nr.headless.preloadedData = .*;', response)  # debug
-        if len(js_var) > 0:
-            js_var_data = js_var[0].replace(
-                'nr.headless.preloadedData = ', '')[:-1]
-            json_obj = json.loads(js_var_data)
-            first_key = list(json_obj.keys())[0]
-            content = json_obj[first_key]['body']['queried_object']['content']['rendered']
-            js_soup = bs(content, 'html.parser')
-            text = js_soup.get_text().strip()
+def do_alternative_scraping(page):
+    for scrape in alternative_scrapers.lookup(page.url):
+        text = scrape(page)
+        if text is not None:
             return text
-        return 'ERROR: No text fathered'
-    if 'columbiaspectator.com' in url:
-        # Try tree version #debug
-        tree = etree.HTML(response)
-
-        # Old version
-        fusion_global_content = re.findall(r'Fusion\.globalContent=.*?};',
-                                           response)  # find the data given the variable name
-        fg_contents = fusion_global_content[0].replace('Fusion.globalContent=', '')[
-            :-1]  # get the contents of the variables
-        json_vers = json.loads(fg_contents)  # make it a json obj
-        # get the relevant section of the json obj
-        content_elts = json_vers['content_elements']
-        text = []
-        for item in content_elts:
-            if item['type'] == 'text':
-                text.append(item['content'])
-        return " ".join(text)
-
-    if 'toledoblade' in url:
-        tree = etree.HTML(response)
-        json_type_elts = tree.xpath('//script[contains(text(),"JSON")]')
-        for jte in json_type_elts:
-            if 'pgStoryZeroJSON' in jte.text:
-                cleaned_json = jte.text.replace(
-                    'pgStoryZeroJSON = ', '').replace('\n', '')
-                try:
-                    json_version = json.loads(cleaned_json)
-                    article_body = json_version['articles'][0]['body']
-                    soup_obj = bs(article_body, 'html.parser')
-                    text = soup_obj.get_text().strip()
-                    return text  # works, 11
-                except json.decoder.JSONDecodeError:
-                    article_regex = re.findall(r'body": ".*?",', cleaned_json)
-                    cleaned_article_regex = article_regex[0].replace(
-                        'body": "', '').replace('"', '')
-                    soup_obj = bs(cleaned_article_regex, 'html.parser')
-                    text = soup_obj.get_text().strip()
-                    return text
-
-    if 'blacknews.com/news' in url:
-        div_elts = soup.find_all(
-            'div', attrs={'class': "post-body entry-content"})
-        stripped = [tag.get_text().strip() for tag in div_elts]
-        return " ".join(stripped)
+    return None
 
-    if 'thepoliticalinsider' in url:
-        blog_div_elts = soup.find_all(
-            'div', attrs={'class': 'text article-body font-default font-size-med'})
-        stripped = [tag.get_text().strip() for tag in blog_div_elts]
-        if len(stripped) > 0:
-            return " ".join(stripped)
-        script_variable = re.findall(
-            r'class="yoast-schema-graph">[\S\s]*?<\/script>', response)
-        try:
-            script_data = script_variable[0].replace(
-                'class="yoast-schema-graph">', '').replace('</script>', '')
-            json_option = json.loads(script_data)
-            dv = True  # Todo: finsih this
-        except IndexError:
-            return "ERROR: Scraping error during JSON conversion"
-
-    if 'ibtimes.com' in url or 'ibtimes.co' in url:
-        if 'Forbidden' in response:
-            return 'ERROR: 403 Forbidden'
-        tree = etree.HTML(response)
-        json_type_elts = tree.xpath('//script[contains(@type,"json")]')
-        # json_obj = json.loads(json_type_elts[-1].text)
-        # contents = json_obj['props']['pageProps']['pageContent']['parsedBody']
-        # text = [content for content in contents if isinstance(content, str)]
-        # return " ".join(text)
-        return 'ERROR: No text gathered'
-    if 'tampabay.com' in url:
-        tree = etree.HTML(response)
-        json_elts = tree.xpath('//script[contains(@type,"json")]')
-        return 'ERROR: No text gathered'  # Doesnt seem to work
-    if 'newsday.com' in url:
-        tree = etree.HTML(response)
-        json_elts = tree.xpath('//script[contains(@type,"json")]')
-        try:
-            for elt in json_elts:
-                if 'bodyText' in elt.text:
-                    json_version = json.loads(elt.text)
-                    text = json_version['props']['pageProps']['data']['page']['leaf']['bodyText']
-                    return text
-            return 'ERROR: No text gathered'
-        except IndexError:
-            return 'ERROR: No text gathered'
-        except KeyError:
-            return 'ERROR: No text gathered'
 
-    if 'timesofindia' in url:
-        if 'videoshow' in url or '/photostory' in url:
-            return "ERROR: Video/ Image content only"
-        alt_elts = soup.find_all('div', attrs={'data-articlebody': '1'})
-        stripped = [tag.get_text().strip() for tag in alt_elts]
-        if len(stripped) < 1:
-            blog_div_elts = soup.find_all(
-                'div', attrs={'class': 'main-content single-article-content'})
-            stripped = [tag.get_text().strip() for tag in blog_div_elts]
-            if len(stripped) < 1:
-                return 'ERROR: No text gathered'
-            return " ".join(stripped)
-        return " ".join(stripped)
+# ---------------------------------------------------------------------------
+# Errors for pages without content in the p-tags. The rules are checked in
+# the order listed here and the last matching one determines the error.
+# Url rules are looked up by host; rules on the soup text apply to all urls.
+# ---------------------------------------------------------------------------
 
-    if 'newsmax.com' in url.lower():
-        div_elts = soup.find_all('div', id='mainArticleDiv')
-        stripped = [tag.get_text().strip() for tag in div_elts]
-        return " ".join(stripped)
+empty_ptag_rules = SiteRegistry()
 
-    if 'sbs.com.au' in url:
-        tree = etree.HTML(response)
-        json_type_elts = tree.xpath('//script[contains(@type,"json")]')
-        json_obj = json.loads(json_type_elts[-1].text)
-        contents = json_obj['props']['pageProps']['pageContent']['parsedBody']
-        text = [content for content in contents if isinstance(content, str)]
-        return " ".join(text)
-
-    if 'NDTV-LatestNews' in url:
-        div_elts = soup.find_all('div', id='ins_storybody')
-        stripped = [tag.get_text().strip() for tag in div_elts]
-        return " ".join(stripped)
 
-    return None
+def url_error(error, patterns):
+    # Register an error for a list of hostnames and url substrings
+    hosts, substrings = split_patterns(patterns)
+    empty_ptag_rules.register(lambda page: error, hosts, substrings)
+
+
+def text_error(error, phrases):
+    # Register an error for phrases in the (lowercase) soup text
+    def rule(page):
+        for phrase in phrases:
+            if phrase in page.text_lower:
+                return error
+        return None
+    empty_ptag_rules.register(rule, always=True)
 
 
-def handle_errors_in_empty_ptags(url, soup_text):
+url_error('ERROR: 403 Forbidden', ['pantsonfirenews.com'])
+url_error('ERROR: 451 Unavailable for legal reasons', ['fox2now.com/news', 'ktla.com/news/'])
+empty_ptag_rules.register(
+    lambda page: 'ERROR: 404 Page not found' if page.text == ' ' else None, always=True)
+empty_ptag_rules.register(
+    lambda page: "ERROR: Video/ Image content only" if 'clips' in page.url else None, hosts=['mediamatters.org'])
+empty_ptag_rules.register(
+    lambda page: "ERROR: Video/ Image content only" if 'epoch video' in page.text_lower else None,
+    hosts=['theepochtimes.com'])
+empty_ptag_rules.register(lambda page: page.text, hosts=['chinadaily.com.cn'])
+url_error('ERROR: Not scrapable content', ['gmanetwork.com', 'ecowatch'])
+url_error('ERROR: 404 Page not found', e.empty_ptag_url_errors['404 Page not found'])
+url_error("ERROR: Article has been archived", e.empty_ptag_url_errors['Article has been archived'])
+text_error("ERROR: Article not found", e.empty_ptag_text_errors['Article not found'])
+url_error("ERROR: Article not found", e.empty_ptag_url_errors['Article not found'])
+text_error('ERROR: Blocked from website', e.empty_ptag_text_errors['Blocked from website'])
+url_error("ERROR: Video/ Image content only", e.empty_ptag_url_errors['Video/ Image content only'])
+
+
+def handle_errors_in_empty_ptags(page):
     # If there's not content in the ptags, check the soup.text for error handling
     # Also checks the url in some cases
     text = True
-    if 'pantsonfirenews.com' in url:
-        text = 'ERROR: 403 Forbidden'
-    if 'fox2now.com/news' in url or 'ktla.com/news/' in url:
-        text = 'ERROR: 451 Unavailable for legal reasons'
-    if soup_text == ' ':
-        text = 'ERROR: 404 Page not found'
-    if 'mediamatters.org' in url and 'clips' in url:
-        text = "ERROR: Video/ Image content only"
-    if 'theepochtimes.com' in url and 'epoch video' in soup_text.lower():
-        text = "ERROR: Video/ Image content only"
-    if 'chinadaily.com.cn' in url:
-        text = soup_text
-    if 'gmanetwork.com' in url or 'ecowatch' in url:
-        text = 'ERROR: Not scrapable content'
-
-    for n in e.empty_ptag_url_errors['404 Page not found']:
-        if n in url:
-            text = 'ERROR: 404 Page not found'
-
-    for obj in e.empty_ptag_url_errors['Article has been archived']:
-        if obj in url:
-            text = "ERROR: Article has been archived"
-
-    for nf in e.empty_ptag_text_errors['Article not found']:
-        if nf in soup_text.lower():
-            text = "ERROR: Article not found"
-
-    for item in e.empty_ptag_url_errors['Article not found']:
-        if item in url:
-            text = "ERROR: Article not found"
-
-    for elt in e.empty_ptag_text_errors['Blocked from website']:
-        if elt in soup_text.lower():
-            text = 'ERROR: Blocked from website'
-
-    for x in e.empty_ptag_url_errors['Video/ Image content only']:
-        if x in url:
-            text = "ERROR: Video/ Image content only"
-
+    for rule in empty_ptag_rules.lookup(page.url):
+        error = rule(page)
+        if error is not None:
+            text = error
     return text
 
 
-def try_alt_scrape_method(url, soup, response):
-    if 'ynetnews.com' in url:
-        span_elts = soup.find_all('span', attrs={'data-text': 'true'})
-        stripped = [tag.get_text().strip() for tag in span_elts]
-        return " ".join(stripped)
-    if 'refinery29' in url:
-        alt_elts = soup.find_all('div', attrs={'class': 'section-text'})
-        stripped = [tag.get_text().strip() for tag in alt_elts]
-        return " ".join(stripped)
-    if 'cnbctv18.com' in url:
-        tree = etree.HTML(response)
-        elts = tree.xpath('//script[contains(@type,"application/ld+json")]')
-        body_elts = [x for x in elts if 'articleBody' in x.text][0]
-        json_vers = json.loads(str(body_elts.text))
-        return json_vers['articleBody']
-    if 'wral.com' in url:
-        return 'ERROR: 404 Page not found'
-    if 'kake' in url:
-        return "ERROR: Video/ Image content only"
-    if 'post-gazette.com' in url:
-        return "ERROR: Article behind a paywall or login page"
-    if 'grabien' in url:
-        return "ERROR: Video/ Image content only"
-    if 'israelnationalnews' in url:
-        return 'ERROR: Article not found'
-    if 'avoiceformen' in url:
-        return "ERROR: Article not found"
+# Dead feeds which are denylisted before fetching (see classify_url). The
+# empty p-tag rules above also list live outlets, so they only apply once a
+# page came back without content.
+dead_outlet_rules = SiteRegistry()
+
+
+def dead_outlet(error, patterns):
+    # Register an error for a list of hostnames and url substrings
+    hosts, substrings = split_patterns(patterns)
+    dead_outlet_rules.register(error, hosts, substrings)
+
+
+dead_outlet('ERROR: 404 Page not found', e.dead_feed_url_errors['404 Page not found'])
+dead_outlet("ERROR: Article has been archived", e.dead_feed_url_errors['Article has been archived'])
+
+
+def classify_url(url: str):
+    # Error for urls which do not have to be fetched at all (or True)
+    error = check_scrapability(url)
+    if error is not True:
+        return error
+    errors = dead_outlet_rules.lookup(url)
+    return errors[-1] if errors else True
+
+
+# ---------------------------------------------------------------------------
+# Last resort extraction for pages without content in the p-tags; the
+# first matching method is used.
+# ---------------------------------------------------------------------------
+
+alt_scrape_methods = SiteRegistry()
+
+
+@alt_scrape_methods.site('ynetnews.com')
+def scrape_ynetnews(page):
+    span_elts = page.soup.find_all('span', attrs={'data-text': 'true'})
+    stripped = [tag.get_text().strip() for tag in span_elts]
+    return " ".join(stripped)
+
+
+@alt_scrape_methods.site(substrings=['refinery29'])
+def scrape_refinery29(page):
+    alt_elts = page.soup.find_all('div', attrs={'class': 'section-text'})
+    stripped = [tag.get_text().strip() for tag in alt_elts]
+    return " ".join(stripped)
+
+
+@alt_scrape_methods.site('cnbctv18.com')
+def scrape_cnbctv18(page):
+    elts = [s for s in page.json_scripts if 'application/ld+json' in s['type']]
+    body_elts = [x for x in elts if 'articleBody' in x.string][0]
+    json_vers = json.loads(str(body_elts.string))
+    return json_vers['articleBody']
+
+
+def alt_scrape_error(error, patterns):
+    # Register an error for pages of the given hosts or url substrings
+    hosts, substrings = split_patterns(patterns)
+    alt_scrape_methods.register(lambda page: error, hosts, substrings)
+
+
+alt_scrape_error('ERROR: 404 Page not found', ['wral.com'])
+alt_scrape_error("ERROR: Video/ Image content only", ['kake'])
+alt_scrape_error("ERROR: Article behind a paywall or login page", ['post-gazette.com'])
+alt_scrape_error("ERROR: Video/ Image content only", ['grabien'])
+alt_scrape_error('ERROR: Article not found', ['israelnationalnews'])
+alt_scrape_error("ERROR: Article not found", ['avoiceformen'])
+
+
+def try_alt_scrape_method(page):
+    for scrape in alt_scrape_methods.lookup(page.url):
+        return scrape(page)
     return "ERROR: No text gathered"
 
 
-def handle_empty_ptags(url, soup, response):
-    handled_errors = handle_errors_in_empty_ptags(url, soup.text)
+def handle_empty_ptags(page):
+    handled_errors = handle_errors_in_empty_ptags(page)
     if handled_errors is not True:
         return handled_errors
 
-    handle_text = try_alt_scrape_method(url, soup, response)
+    handle_text = try_alt_scrape_method(page)
     return handle_text
+
+
+
+def extraction_profile(url: str) -> str:
+    # Part of the url the extracted text depends on. Without site rules a
+    # page is extracted the same way on every site (copies share their text);
+    # site rules may read the whole url.
+    for registry in (alternative_scrapers, empty_ptag_rules, alt_scrape_methods):
+        if registry.site_specific(url):
+            return url
+    return ''
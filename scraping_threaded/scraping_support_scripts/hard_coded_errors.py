@@ -144,3 +144,33 @@ soup_contents_text_errors = {'403 Forbidden': ['403 forbidden', '403 error',
                                                    'The action you just performed triggered the security solution'.lower(),
                                                    'Sorry but something about this request looked a bit suspicious, and we block suspicious'.lower()]
                              }
+
+""" BLOCK PAGE ERRORS """
+# Checked on the raw html of short responses to notice that a domain blocks the scraper
+block_page_text_errors = soup_contents_text_errors['Blocked from website'] + [
+    'sorry, you have been blocked', 'attention required! | cloudflare', 'error code: 1020']
+
+""" EARLY ABORT ERRORS """
+# Checked on the first KB of a response while it is downloaded. Only phrases
+# which do not occur at the start of real articles are listed here (mostly
+# page titles); broad ones like 'enable javascript' stay in the soup checks.
+early_abort_text_errors = {'Blocked from website': ['<title>access denied</title>',
+                                                    '<title>attention required! | cloudflare</title>',
+                                                    'sorry, you have been blocked',
+                                                    'error code: 1020',
+                                                    '<title>request rejected</title>',
+                                                    'request unsuccessful. incapsula incident id',
+                                                    'potential automated action detected',
+                                                    '<title>pardon our interruption</title>'],
+                           '403 Forbidden': ['<title>403 forbidden</title>', '<h1>403 forbidden</h1>'],
+                           '404 Page not found': ['<title>404 not found</title>', '<h1>404 not found</h1>',
+                                                  '<title>404 - file or directory not found.</title>']}
+
+""" DEAD FEED URL ERRORS """
+# Feed redirect hosts which no longer serve articles. Unlike the empty p-tag
+# tables above, which are only checked on fetched pages, these urls are
+# denylisted before they are fetched, so only hosts which are gone as a
+# whole belong here (not outlets which still publish).
+dead_feed_url_errors = {'404 Page not found': ['feeds.foxnews.com/'],
+                        'Article has been archived': ['rssfeeds.azcentral.com', 'rssfeeds.cincinnati.com',
+                                                      'rssfeeds.burlingtonfreepress']}
@@ -0,0 +1,44 @@
+"""
+Multi-pattern matcher for the phrase tables in hard_coded_errors.
+All phrases of a rule list are compiled once into an Aho-Corasick automaton,
+which finds every occurrence in a single pass over the text. Rules keep the
+order of the original if-chains: when several rules match, the one listed
+last wins.
+"""
+import ahocorasick
+
+
+class PhraseMatcher:
+    def __init__(self, rules: list):
+        # rules: list of (label, kind, phrases) with kind 'contains' or 'equals'
+        self.labels = []
+        self.exact = {}
+        self.automaton = ahocorasick.Automaton()
+
+        contains = {}
+        for rank, (label, kind, phrases) in enumerate(rules):
+            self.labels.append(label)
+            target = contains if kind == 'contains' else self.exact
+            for phrase in phrases:
+                # A phrase listed in several rules counts for the last one
+                target[phrase] = max(target.get(phrase, -1), rank)
+
+        for phrase, rank in contains.items():
+            self.automaton.add_word(phrase, rank)
+        self.has_phrases = len(contains) > 0
+        if self.has_phrases:
+            self.automaton.make_automaton()
+
+    def ranks(self, text: str) -> set:
+        # Returns the ranks of all rules which match the text
+        found = set()
+        if text in self.exact:
+            found.add(self.exact[text])
+        if self.has_phrases:
+            found.update(rank for _, rank in self.automaton.iter(text))
+        return found
+
+    def last(self, text: str, default=True):
+        # Returns the label of the matching rule listed last (or the default)
+        found = self.ranks(text)
+        return self.labels[max(found)] if found else default
@@ -0,0 +1,103 @@
+"""
+Registry which maps hostnames to site specific rules (extractors or errors).
+The host of an URL is parsed once and looked up together with all of its
+parent domains, so the cost per page does not grow with the number of
+special-cased outlets. Rules that depend on other parts of the URL (e.g.
+'NDTV-LatestNews') are registered as substrings and keep the plain
+`pattern in url` semantics. All substrings are compiled into one
+Aho-Corasick automaton, so they are found in a single pass over the URL.
+"""
+from urllib.parse import urlsplit
+import ahocorasick
+import re
+
+# Patterns which only consist of a hostname, e.g. 'qz.com' or 'sbs.com.au'.
+# Partial hosts without a top level domain (e.g. 'ir.voanews') stay substrings.
+host_pattern = re.compile(r'^[a-z0-9-]+(\.[a-z0-9-]+)*\.[a-z]{2,6}$')
+
+
+def split_patterns(patterns):
+    # Split a list of url patterns into hostnames and substrings
+    hosts = [p for p in patterns if host_pattern.match(p)]
+    substrings = [p for p in patterns if not host_pattern.match(p)]
+    return hosts, substrings
+
+
+def url_host(url: str) -> str:
+    try:
+        return urlsplit(url).hostname or ''
+    except ValueError:
+        return ''
+
+
+class SiteRegistry:
+    def __init__(self):
+        self.hosts = {}  # hostname -> list of (rank, value)
+        self.substrings = []  # list of (rank, substring, value)
+        self.always = []  # list of (rank, value) which apply to every url
+        self.next_rank = 0
+        self.automaton = None  # compiled substrings, rebuilt after changes
+
+    def register(self, value, hosts=(), substrings=(), always=False):
+        # Rules are ranked in the order in which they are registered
+        rank = self.next_rank
+        self.next_rank += 1
+        for host in hosts:
+            self.hosts.setdefault(host.lower(), []).append((rank, value))
+        for substring in substrings:
+            self.substrings.append((rank, substring, value))
+            self.automaton = None
+        if always:
+            self.always.append((rank, value))
+        return value
+
+    def site(self, *hosts, substrings=()):
+        # Decorator to register a site specific function (e.g. from a plugin)
+        def decorator(function):
+            return self.register(function, hosts, substrings)
+        return decorator
+
+    def compile(self):
+        # Builds the automaton which maps every substring to its rules
+        rules = {}
+        for rank, substring, value in self.substrings:
+            rules.setdefault(substring, []).append((rank, value))
+
+        # Only publish the automaton once it is complete (workers share it)
+        automaton = ahocorasick.Automaton()
+        for substring, values in rules.items():
+            automaton.add_word(substring, values)
+        if rules:
+            automaton.make_automaton()
+        self.automaton = automaton
+
+    def matches(self, url: str) -> list:
+        # Returns (rank, value) of all rules matching the url, ordered by rank
+        found = {}
+
+        # Look up the host and all of its parent domains
+        parts = url_host(url).split('.')
+        for i in range(len(parts)):
+            for rank, value in self.hosts.get('.'.join(parts[i:]), ()):
+                found[rank] = value
+
+        if self.substrings:
+            if self.automaton is None:
+                self.compile()
+            for _, values in self.automaton.iter(url):
+                for rank, value in values:
+                    found[rank] = value
+
+        for rank, value in self.always:
+            found[rank] = value
+
+        return sorted(found.items(), key=lambda item: item[0])
+
+    def lookup(self, url: str) -> list:
+        # Returns the values of all rules matching the url, ordered by rank
+        return [value for _, value in self.matches(url)]
+
+    def site_specific(self, url: str) -> bool:
+        # True if a host or substring rule matches (rules for all urls do not count)
+        always = {rank for rank, _ in self.always}
+        return any(rank not in always for rank, _ in self.matches(url))
@@ -37,10 +37,9 @@ def main():
 
     # ------------------- Indexes -------------------
 
-    db.articles.create_index('batch_id', name='index_articles_batch_id')
-    db.articles.create_index('media_name', name='index_articles_media_name')
-    db.articles.create_index([("status", pm.TEXT)],
-                             name='index_articles_status')
+    # Same definitions as migrate_indexes.py
+    for change, collection, name in ensureIndexes(db):
+        print(f"Index {collection}.{name}: {change}")
 
     # List all collections
     print("Collections in DB:", db.list_collection_names())
@@ -0,0 +1,6 @@
+# The scripts import their modules relative to scraping_threaded, so the
+# tests run with that directory on the path: python -m pytest tests
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,110 @@
+# ===========================================================================
+#                     Tests: Response Body and Inspector
+# ===========================================================================
+
+from scraper.body import BodyBuffer
+from scraper.inspector import inspectHead, inspectContentType, page_types
+from scraper.scraper import CappedException
+from scrape_articles import fetchFailure
+from utils.scheduler import CircuitBreaker
+from types import SimpleNamespace
+import pytest
+
+
+# ------------------- Body Buffer -------------------
+
+
+def test_buffer_round_trip():
+    body = BodyBuffer(content_length=None, min_read=4)
+    chunks = [bytes([n]) * n for n in range(1, 200)]
+    for chunk in chunks:
+        body.write(chunk)
+    assert body.getvalue() == b"".join(chunks)
+
+
+def test_buffer_does_not_trust_large_content_length():
+    body = BodyBuffer(content_length=10**9, max_initial=1024)
+    assert len(body._buffer) == 1024
+    body.write(b"x" * 5000)
+    assert body.getvalue() == b"x" * 5000
+
+
+def test_buffer_caps_size():
+    body = BodyBuffer(max_size=100)
+    body.write(b"x" * 100)
+    with pytest.raises(CappedException) as info:
+        body.write(b"x")
+    assert info.value.capped_type == CappedException.TOO_LARGE
+
+
+def test_buffer_inspects_head_once():
+    heads = []
+    body = BodyBuffer(inspect=heads.append, inspect_size=8)
+    body.write(b"1234")
+    body.write(b"5678")
+    body.write(b"9")
+    body.getvalue()
+    assert heads == [b"12345678"]
+
+
+def test_buffer_inspects_short_body_at_the_end():
+    heads = []
+    body = BodyBuffer(inspect=heads.append, inspect_size=8)
+    body.write(b"abc")
+    assert body.getvalue() == b"abc"
+    assert heads == [b"abc"]
+
+
+# ------------------- Inspector -------------------
+
+
+def test_inspect_files():
+    with pytest.raises(CappedException) as info:
+        inspectHead(b"%PDF-1.4 ...")
+    assert info.value.capped_type == CappedException.CONTENT_PDF
+    with pytest.raises(CappedException):
+        inspectContentType("application/pdf")
+    inspectContentType("text/html; charset=utf-8")
+    inspectHead(b"<html><head><title>News</title></head>")
+
+
+def test_inspect_error_page_keeps_label():
+    with pytest.raises(CappedException) as info:
+        inspectHead(b"<html><head><title>403 Forbidden</title></head>")
+    assert info.value.capped_type == CappedException.ERROR_PAGE
+    assert info.value.parsing_error == "ERROR: 403 Forbidden"
+    assert info.value.capped_type in page_types
+
+
+def test_inspect_block_page():
+    with pytest.raises(CappedException) as info:
+        inspectHead(b"<html><title>Access Denied</title>")
+    assert info.value.capped_type == CappedException.BLOCK_PAGE
+
+
+# ------------------- Breaker Failures -------------------
+
+
+def response(status_code, content=b"<html></html>"):
+    return SimpleNamespace(status_code=status_code, content=content)
+
+
+def test_aborted_refusals_count_against_the_domain():
+    # A 403 page recognised while downloading must still trip the breaker
+    error = CappedException("Body is a block or error page", CappedException.ERROR_PAGE,
+                            "ERROR: 403 Forbidden")
+    assert fetchFailure(response(403), error) == "403"
+    assert fetchFailure(response(429), error) == "429"
+
+    blocked = CappedException("Body is a block or error page", CappedException.BLOCK_PAGE)
+    assert fetchFailure(response(200), blocked) == CircuitBreaker.BLOCKED
+
+
+def test_page_properties_do_not_count_against_the_domain():
+    too_large = CappedException("Response too large", CappedException.TOO_LARGE)
+    assert fetchFailure(response(200), too_large) is None
+    not_found = CappedException("Body is a block or error page", CappedException.ERROR_PAGE,
+                                "ERROR: 404 Page not found")
+    assert fetchFailure(response(404), not_found) is None
+    assert fetchFailure(response(200)) is None
+    assert fetchFailure(response(503)) == "503"
@@ -0,0 +1,146 @@
+# ===========================================================================
+#                       Tests: Task Queries and Claims
+# ===========================================================================
+
+from utils.database import (fetchTasks, claimTasks, renewLeases, leaseOwner, updateTask,
+                            denylistTask, BulkWriter)
+from pymongo.errors import AutoReconnect
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+import pytest
+
+mongomock = pytest.importorskip("mongomock")
+
+
+@pytest.fixture
+def db():
+    db = mongomock.MongoClient().scraping
+    db.articles.insert_many([
+        {"url": f"https://{domain}/{n}", "media_name": domain, "batch_id": 1,
+         "status": "NOT-FETCHED", "tries": 0}
+        for domain in ["a.com", "b.com"] for n in range(5)
+    ])
+    return db
+
+
+# ------------------- Streaming -------------------
+
+
+@pytest.mark.parametrize("keyset", [True, False])
+def test_stream_reads_every_task_once(db, keyset):
+    tasks = list(fetchTasks(db, 1, "NOT-FETCHED", stream=True, batch_size=3, keyset=keyset))
+    ids = [t["_id"] for t in tasks]
+    assert len(ids) == 10
+    assert ids == sorted(ids)
+
+    limited = list(fetchTasks(db, 1, "NOT-FETCHED", limit=4, stream=True, batch_size=3,
+                              keyset=keyset))
+    assert [t["_id"] for t in limited] == ids[:4]
+
+
+def test_fetch_filters_domains_on_the_server(db):
+    tasks = fetchTasks(db, 1, "NOT-FETCHED", limit=3, exclude_domains=["a.com"])
+    assert len(tasks) == 3
+    assert {t["media_name"] for t in tasks} == {"b.com"}
+
+
+# ------------------- Claims -------------------
+
+
+def test_workers_do_not_claim_the_same_tasks(db):
+    first = list(claimTasks(db, "w1", "NOT-FETCHED", limit=6, fields={"url": 1}))
+    second = list(claimTasks(db, "w2", "NOT-FETCHED", fields={"url": 1}))
+
+    assert len(first) == 6 and len(second) == 4
+    assert not {t["_id"] for t in first} & {t["_id"] for t in second}
+    assert {leaseOwner(t) for t in first} == {"w1"}
+    assert db.articles.count_documents({"status": "IN-PROGRESS"}) == 10
+
+
+def test_expired_lease_is_claimed_again(db):
+    claimed = list(claimTasks(db, "w1", "NOT-FETCHED", limit=1))
+    db.articles.update_one({"_id": claimed[0]["_id"]},
+                           {"$set": {"lease.expires_at": datetime.utcnow() - timedelta(seconds=1)}})
+
+    reclaimed = list(claimTasks(db, "w2", "NOT-FETCHED", limit=1))
+    assert reclaimed[0]["_id"] == claimed[0]["_id"]
+    assert leaseOwner(reclaimed[0]) == "w2"
+
+
+def test_renew_extends_only_own_leases(db):
+    list(claimTasks(db, "w1", "NOT-FETCHED", limit=2, lease=60))
+    list(claimTasks(db, "w2", "NOT-FETCHED", limit=2, lease=60))
+
+    assert renewLeases(db, "w1", lease=3600).matched_count == 2
+    renewed = db.articles.find({"lease.worker_id": "w1"})
+    assert all(t["lease"]["expires_at"] > datetime.utcnow() + timedelta(seconds=600)
+               for t in renewed)
+    other = db.articles.find({"lease.worker_id": "w2"})
+    assert all(t["lease"]["expires_at"] < datetime.utcnow() + timedelta(seconds=600)
+               for t in other)
+
+
+def test_only_the_lease_owner_finishes_a_task(db):
+    task = next(claimTasks(db, "w1", "NOT-FETCHED", limit=1, fields={"tries": 1}))
+    id = str(task["_id"])
+
+    assert updateTask(db, id, {"status": "CONTENT-FETCHED"}, worker_id="w2").modified_count == 0
+    assert denylistTask(db, id, "test", worker_id="w2").modified_count == 0
+    assert updateTask(db, id, {"status": "CONTENT-FETCHED"}, worker_id=leaseOwner(task),
+                      tries_before=task["tries"]).modified_count == 1
+
+    stored = db.articles.find_one({"_id": task["_id"]})
+    assert stored["status"] == "CONTENT-FETCHED"
+    assert stored["tries"] == 1
+    assert "lease" not in stored
+
+
+def test_repeated_update_counts_tries_once(db):
+    task = db.articles.find_one()
+    for _ in range(2):
+        updateTask(db, str(task["_id"]), {"status": "CONTENT-FETCHED"}, tries=2,
+                   tries_before=task["tries"])
+    assert db.articles.find_one({"_id": task["_id"]})["tries"] == 2
+
+
+# ------------------- Bulk Writer -------------------
+
+
+class FlakyCollection:
+    """Collection whose first bulk writes fail with a connection error"""
+
+    def __init__(self, failures: int):
+        self.failures = failures
+        self.batches = []
+
+    def bulk_write(self, batch, ordered=True):
+        if self.failures:
+            self.failures -= 1
+            raise AutoReconnect("connection reset")
+        self.batches.append(batch)
+        return SimpleNamespace(modified_count=len(batch) - 1, upserted_count=1)
+
+
+def test_bulk_writer_retries_connection_errors():
+    articles = FlakyCollection(failures=1)
+    writer = BulkWriter({"articles": articles}, max_delay=60, retry_delay=0)
+    writer.add("op1")
+    writer.add("op2")
+    writer.close()
+
+    assert articles.batches == [["op1", "op2"]]
+    metrics = writer.metrics()
+    assert metrics["retries"] == 1
+    assert metrics["written"] == 2
+    assert metrics["dropped"] == 0
+
+
+def test_bulk_writer_drops_batch_after_max_attempts():
+    articles = FlakyCollection(failures=5)
+    writer = BulkWriter({"articles": articles}, max_delay=60, max_attempts=2, retry_delay=0)
+    writer.add("op1")
+    writer.close()
+
+    assert articles.batches == []
+    assert writer.metrics()["dropped"] == 1
+    assert writer.metrics()["errors"] == 1
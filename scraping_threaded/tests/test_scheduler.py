@@ -0,0 +1,184 @@
+# ===========================================================================
+#                            Tests: Domain Scheduler
+# ===========================================================================
+
+from utils.scheduler import TokenBucket, CircuitBreaker, Circuit, DomainScheduler, feedScheduler
+import asyncio
+import logging
+import time
+
+
+def task(domain, n=0):
+    return {"url": f"https://{domain}/{n}"}
+
+
+# ------------------- Token Bucket -------------------
+
+
+def test_token_bucket_refills_at_rate():
+    bucket = TokenBucket(rate=2)
+    now = bucket.updated
+    assert bucket.delay(now) == 0.0
+    bucket.consume(now)
+    assert bucket.delay(now) == 0.5
+    assert bucket.delay(now + 0.5) == 0.0
+
+
+def test_token_bucket_without_rate_never_waits():
+    bucket = TokenBucket(rate=0)
+    for _ in range(5):
+        bucket.consume(0)
+    assert bucket.delay(0) == 0.0
+
+
+# ------------------- Circuit Breaker -------------------
+
+
+def test_breaker_trips_on_failure_rate():
+    breaker = CircuitBreaker(failure_rate=0.5, min_requests=4, cooldown=10)
+    for failure in [None, "403", None, "403"]:
+        breaker.record("a.com", failure, now=0)
+    assert breaker.delay("a.com", 0) == 10
+    assert breaker.delay("b.com", 0) == 0.0
+
+
+def test_breaker_trips_on_block_pages():
+    breaker = CircuitBreaker(max_blocks=2, min_requests=100, cooldown=10)
+    breaker.record("a.com", CircuitBreaker.BLOCKED, now=0)
+    assert breaker.delay("a.com", 0) == 0.0
+    breaker.record("a.com", CircuitBreaker.BLOCKED, now=0)
+    assert breaker.delay("a.com", 0) == 10
+
+
+def test_breaker_probe_closes_or_reopens():
+    breaker = CircuitBreaker(max_blocks=1, cooldown=10, max_trips=0)
+    breaker.record("a.com", CircuitBreaker.BLOCKED, now=0)
+
+    # After the cooldown a single probe is let through
+    assert breaker.delay("a.com", 10) == 0.0
+    assert breaker.started("a.com") is True
+    assert breaker.delay("a.com", 10) is None
+
+    # A failed probe opens the circuit for twice the cooldown
+    breaker.record("a.com", "403", now=10)
+    assert breaker.delay("a.com", 10) == 20
+
+    # A successful probe closes it
+    assert breaker.delay("a.com", 30) == 0.0
+    breaker.started("a.com")
+    breaker.record("a.com", None, now=30)
+    assert breaker._circuits["a.com"].state == Circuit.CLOSED
+    assert breaker.started("a.com") is False
+
+
+def test_breaker_exhausted_after_max_trips():
+    breaker = CircuitBreaker(max_blocks=1, cooldown=0, max_trips=2)
+    breaker.record("a.com", CircuitBreaker.BLOCKED, now=0)
+    assert not breaker.exhausted("a.com")
+    breaker.delay("a.com", 0)
+    breaker.started("a.com")
+    breaker.record("a.com", CircuitBreaker.BLOCKED, now=0)
+    assert breaker.exhausted("a.com")
+
+
+# ------------------- Scheduler -------------------
+
+
+def test_busy_domain_does_not_block_others():
+    scheduler = DomainScheduler(rate=0, host_concurrency=1)
+    for n in range(3):
+        scheduler.put(task("a.com", n))
+    scheduler.put(task("b.com"))
+    scheduler.close()
+
+    first = scheduler.get()
+    second = scheduler.get()
+    assert {first["url"], second["url"]} == {"https://a.com/0", "https://b.com/0"}
+
+    # a.com gets its next task once the running one is done
+    scheduler.done(first if "a.com" in first["url"] else second)
+    assert scheduler.get()["url"] == "https://a.com/1"
+
+
+def test_rate_limit_spaces_requests_of_a_domain():
+    scheduler = DomainScheduler(rate=20, host_concurrency=2)
+    for n in range(3):
+        scheduler.put(task("a.com", n))
+    scheduler.close()
+
+    start = time.monotonic()
+    while (t := scheduler.get()) is not None:
+        scheduler.done(t)
+    assert time.monotonic() - start >= 0.09  # 2 waits of 1/20s
+
+
+def test_deferred_task_comes_back():
+    scheduler = DomainScheduler(rate=0)
+    scheduler.put(task("a.com"))
+    scheduler.close()
+
+    t = scheduler.get()
+    scheduler.defer(t, 0.05)
+    scheduler.done(t)
+    assert len(scheduler) == 1
+    assert scheduler.get() is t
+    scheduler.done(t)
+    assert scheduler.get() is None
+
+
+def test_exhausted_domain_drops_pending_and_new_tasks():
+    breaker = CircuitBreaker(max_blocks=1, max_trips=1, cooldown=60)
+    scheduler = DomainScheduler(rate=0, breaker=breaker)
+    scheduler.put(task("a.com", 0))
+    scheduler.put(task("a.com", 1))
+
+    t = scheduler.get()
+    scheduler.report(t, CircuitBreaker.BLOCKED)
+    scheduler.done(t)
+    assert len(scheduler) == 0
+
+    # Tasks fed afterwards (stream and claim mode) are skipped as well
+    scheduler.put(task("a.com", 2))
+    assert len(scheduler) == 0
+    assert breaker.metrics()["skipped"] == 2
+
+
+def test_only_the_probe_task_ends_the_probe():
+    breaker = CircuitBreaker(max_blocks=1, max_trips=0, cooldown=0)
+    scheduler = DomainScheduler(rate=0, host_concurrency=2, breaker=breaker)
+    for n in range(3):
+        scheduler.put(task("a.com", n))
+
+    first, second = scheduler.get(), scheduler.get()
+    scheduler.report(first, CircuitBreaker.BLOCKED)
+    scheduler.done(first)
+
+    probe = scheduler.get()
+    assert breaker._circuits["a.com"].probing
+
+    # An ordinary task finishing while the probe runs
+    scheduler.done(second)
+    assert breaker._circuits["a.com"].probing
+
+    scheduler.report(probe, None)
+    scheduler.done(probe)
+    assert breaker._circuits["a.com"].state == Circuit.CLOSED
+
+
+def test_aget_hands_out_every_task_once():
+    scheduler = DomainScheduler(rate=50, host_concurrency=1)
+    tasks = [task(f"d{d}.com", n) for d in range(5) for n in range(4)]
+    feedScheduler(scheduler, tasks, logging.getLogger(__name__))
+    seen = []
+
+    async def worker():
+        while (t := await scheduler.aget()) is not None:
+            await asyncio.sleep(0)
+            seen.append(t["url"])
+            scheduler.done(t)
+
+    async def main():
+        await asyncio.wait_for(asyncio.gather(*[worker() for _ in range(50)]), 10)
+
+    asyncio.run(main())
+    assert sorted(seen) == sorted(t["url"] for t in tasks)
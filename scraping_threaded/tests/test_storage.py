@@ -0,0 +1,128 @@
+# ===========================================================================
+#                            Tests: Page Storage
+# ===========================================================================
+
+from utils import compression, database
+from utils.blobs import FileSystemStore
+from utils.database import (storePageContent, getPageBytes, getPageContent,
+                            getPageContentInfo, extractionKey, contentHash)
+from types import SimpleNamespace
+import pytest
+
+
+PAGE = ("<html><head><meta charset='utf-8'><title>Café</title></head><body>"
+        + "<p>Some paragraph of an article.</p>" * 200 + "</body></html>").encode("utf-8")
+
+
+@pytest.fixture
+def fs(tmp_path):
+    compression.dictionaries.clear()
+    yield FileSystemStore(str(tmp_path))
+    compression.dictionaries.clear()
+
+
+# ------------------- Codecs -------------------
+
+
+@pytest.mark.parametrize("codec", compression.CODECS)
+def test_codec_round_trip(fs, codec):
+    if codec == compression.ZSTD:
+        pytest.importorskip("zstandard")
+    data, meta = compression.compress(fs, PAGE, name=codec)
+    assert compression.decompress(fs, data, meta.get("codec")) == PAGE
+    if codec != compression.NONE:
+        assert len(data) < len(PAGE)
+
+
+def test_unknown_codec_is_rejected():
+    with pytest.raises(ValueError):
+        compression.setCodec("brotli")
+
+
+def test_zstd_dictionary_round_trip(fs):
+    pytest.importorskip("zstandard")
+    samples = [f"<html><title>Story {n}</title><nav>Home | World | Sports</nav>"
+               f"<p>Text number {n * 7919} of the site.</p></html>".encode() for n in range(500)]
+    compression.saveDictionary(fs, "a.com", compression.trainDictionary(samples, 4096))
+
+    data, meta = compression.compress(fs, samples[0], "a.com", name=compression.ZSTD)
+    assert "dictionary_id" in meta
+    compression.dictionaries.clear()
+    assert compression.decompress(fs, data, meta["codec"], meta["dictionary_id"]) == samples[0]
+
+
+# ------------------- Inline Payloads and Files -------------------
+
+
+def test_small_page_is_stored_inline(fs):
+    page = "<html><title>Café</title></html>"
+    ref = storePageContent(fs, page.encode("latin-1"), attr={"charset": "latin-1"})
+    assert isinstance(ref, dict)
+    assert ref["sha256"] == contentHash(page.encode("latin-1"))
+
+    content, charset = getPageBytes(fs, ref)
+    assert content == page.encode("latin-1")
+    assert charset == "latin-1"
+    assert getPageContent(fs, ref) == page
+    assert "data" not in getPageContentInfo(fs, ref)
+
+
+def test_large_page_is_stored_as_file(fs, monkeypatch):
+    monkeypatch.setattr(database, "inline_size", 1024)
+    ref = storePageContent(fs, PAGE, attr={"charset": "utf-8"})
+    assert isinstance(ref, str)
+
+    content, charset = getPageBytes(fs, ref)
+    assert content == PAGE
+    assert charset == "utf-8"
+    assert getPageContentInfo(fs, ref)["_id"] == ref
+
+    # Copies of a page share one file
+    assert storePageContent(fs, PAGE, attr={"charset": "utf-8"}) == ref
+
+
+def test_empty_page_is_not_stored(fs):
+    assert storePageContent(fs, b"") is None
+    assert storePageContent(fs, "") is None
+
+
+class MemoryStore:
+    """Blob store of an earlier backend (ids which are not content hashes)"""
+
+    def __init__(self):
+        self.blobs = {}
+
+    def put(self, data: bytes, **attr):
+        id = "%024x" % len(self.blobs)
+        self.blobs[id] = SimpleNamespace(read=lambda: data, **attr)
+        return id
+
+    def get(self, id):
+        return self.blobs[id]
+
+    def info(self, id) -> dict:
+        return {"_id": id, **vars(self.blobs[id])}
+
+
+def test_file_system_store_uses_fallback_for_other_ids(tmp_path):
+    fallback = MemoryStore()
+    old = fallback.put(b"old page", charset="utf-8")
+    fs = FileSystemStore(str(tmp_path), use_mmap=True, fallback=fallback)
+    new = fs.put(b"new page", charset="utf-8")
+
+    assert fs.get(old).read() == b"old page"
+    assert fs.info(old)["charset"] == "utf-8"
+    assert bytes(fs.get(new).read()) == b"new page"
+    assert fs.info(new)["_id"] == new
+
+
+# ------------------- Extraction Keys -------------------
+
+
+def test_extraction_key_separates_what_changes_the_result():
+    key = extractionKey(PAGE, "default")
+    assert key == extractionKey(PAGE, "default", "html.parser", None)
+    assert key != extractionKey(PAGE, "amp")
+    assert key != extractionKey(PAGE, "default", "lxml")
+    assert key != extractionKey(PAGE, "default", encoding="latin-1")
+    assert extractionKey(PAGE, encoding="UTF-8") == extractionKey(PAGE, encoding="utf-8")
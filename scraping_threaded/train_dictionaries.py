@@ -0,0 +1,83 @@
+# ===========================================================================
+#                            Train Dictionaries
+# ===========================================================================
+# Trains a zstd dictionary per domain on pages which were already fetched
+# and stores it in the blob store. Pages of the domain which are stored
+# afterwards are compressed with it (see utils/compression.py). Markup of one site
+# repeats a lot, so dictionaries mostly help with the many small pages.
+
+from collections import defaultdict
+from tabulate import tabulate
+from time import perf_counter
+from utils.database import *
+from utils.urls import getDomain
+from utils import compression
+import click
+
+# ================================= MAIN ================================
+
+
+# fmt: off
+@click.command()
+@click.option('--status', default="CONTENT-FETCHED", help="Status of the tasks whose pages are used")
+@click.option("--batch", default="all", help="all, first last, or a number indicating the batch")
+@click.option("--limit", default=0, help="Only read the pages of the first n tasks (0 equals no limit)")
+@click.option("--samples", default=200, help="Maximum number of pages per domain")
+@click.option("--min_samples", default=20, help="Only train domains with at least n pages")
+@click.option("--dict_size", default=65_536, help="Size of a dictionary in bytes")
+@click.option("--dry_run", is_flag=True, help="Only train and report the ratios, do not store the dictionaries")
+# fmt: on
+def main(status, batch, limit, samples, min_samples, dict_size, dry_run):
+
+    timer_start = perf_counter()
+
+    if compression.zstandard is None:
+        raise click.ClickException("Training dictionaries requires the zstandard package")
+
+    # Connect to database
+    fs, db = getConnection(use_dotenv=True)
+    batch_id = getBatchID(db, batch)
+
+    tasks = fetchTasks(db, batch_id, status, limit, {'url': 1, 'scraping_result.content_html': 1},
+                       stream=True, keyset=True)
+
+    # Collect sample pages per domain
+    pages = defaultdict(list)
+    for task in tasks:
+        file_id = task.get("scraping_result", {}).get("content_html")
+        domain = getDomain(task["url"])
+        if not file_id or file_id == "None" or len(pages[domain]) >= samples:
+            continue
+        content, _ = getPageBytes(fs, file_id)
+        pages[domain].append(content)
+
+    rows = []
+    for domain, contents in sorted(pages.items()):
+        if len(contents) < min_samples:
+            continue
+        dictionary = compression.trainDictionary(contents, dict_size)
+
+        # Compression ratio on the samples, without and with the dictionary
+        plain = sum(len(compression.zstandard.ZstdCompressor(level=compression.ZSTD_LEVEL).compress(c))
+                    for c in contents)
+        trained = compression.zstandard.ZstdCompressor(level=compression.ZSTD_LEVEL,
+                                                        dict_data=dictionary)
+        with_dict = sum(len(trained.compress(c)) for c in contents)
+        raw = sum(len(c) for c in contents)
+        rows.append((domain, len(contents), round(raw / plain, 2), round(raw / with_dict, 2)))
+
+        if not dry_run:
+            compression.saveDictionary(fs, domain, dictionary)
+
+    # Compression ratio per domain
+    click.echo(click.style("Dictionaries:", fg="blue", bold=True))
+    print(tabulate(rows, headers=["Domain", "Pages", "Ratio zstd", "Ratio zstd + dict"]))
+    print("Domains:", len(rows), "of", len(pages))
+
+    # Print runtime
+    timer_stop = perf_counter()
+    print("Runtime:", round(timer_stop - timer_start, 4), "s")
+
+
+if __name__ == "__main__":
+    main()
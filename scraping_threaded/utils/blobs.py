@@ -0,0 +1,211 @@
+# ===========================================================================
+#                            Blob Storage
+# ===========================================================================
+# Pages and texts are stored as blobs with a few metadata fields. GridFS is
+# the default backend. The file system backend keeps blobs in a local
+# directory, sharded by their content hash, so workers on the same machine
+# read and write the bytes without going through MongoDB. Both backends
+# have the same interface, which is all the scripts use:
+#
+#   find(digest)         id of the blob with a content hash (or None)
+#   put(data, **attr)    stores a blob; returns its id
+#   get(id)              blob with read() and its metadata as attributes
+#   info(id)             metadata of a blob as a dict
+#   latest(field, value) id of the newest blob with metadata field == value
+
+from abc import ABC, abstractmethod
+from bson import ObjectId
+import gridfs
+import hashlib
+import json
+import mmap
+import os
+import re
+import tempfile
+import time
+
+
+class BlobStore(ABC):
+    """Abstract blob store"""
+
+    @abstractmethod
+    def find(self, digest: str):
+        pass
+
+    @abstractmethod
+    def put(self, data: bytes, **attr):
+        pass
+
+    @abstractmethod
+    def get(self, id):
+        pass
+
+    @abstractmethod
+    def info(self, id) -> dict:
+        pass
+
+    @abstractmethod
+    def latest(self, field: str, value: str):
+        pass
+
+
+# ---------------------------------------------------------------------------
+#                            GRIDFS
+# ---------------------------------------------------------------------------
+
+
+class GridFSStore(BlobStore):
+    """Blobs in GridFS (metadata in fs.files, bytes in fs.chunks)"""
+
+    def __init__(self, db):
+        self.fs = gridfs.GridFS(db)
+
+    def find(self, digest: str):
+        f = self.fs.find_one({"sha256": digest})
+        return f._id if f is not None else None
+
+    def put(self, data: bytes, **attr):
+        return self.fs.put(data, **attr)
+
+    def get(self, id):
+        return self.fs.get(ObjectId(id) if isinstance(id, str) else id)
+
+    def info(self, id) -> dict:
+        return dict(self.get(id)._file)
+
+    def latest(self, field: str, value: str):
+        f = self.fs.find_one({field: value}, sort=[("uploadDate", -1)])
+        return f._id if f is not None else None
+
+
+# ---------------------------------------------------------------------------
+#                            FILE SYSTEM
+# ---------------------------------------------------------------------------
+
+# Ids of the file system store are SHA-256 hex digests
+digest_pattern = re.compile(r'^[0-9a-f]{64}$')
+
+
+class FileBlob:
+    """Blob of the file system store; metadata fields are attributes"""
+
+    def __init__(self, path: str, meta: dict, offset: int, use_mmap: bool = False):
+        self.path = path
+        self.meta = meta
+        self.offset = offset  # start of the data in the file
+        self.use_mmap = use_mmap
+
+    def __getattr__(self, name):
+        try:
+            return self.__dict__["meta"][name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def read(self):
+        """Returns the data (a view of a read-only memory map with use_mmap)"""
+        with open(self.path, "rb") as file:
+            if self.use_mmap and self.meta.get("length"):
+                view = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+                return memoryview(view)[self.offset:]
+            file.seek(self.offset)
+            return file.read()
+
+
+class FileSystemStore(BlobStore):
+    """Blobs in a local directory, keyed by content hash
+
+    A blob with the hash 'ab12...' is stored as <root>/ab/12/ab12... : one
+    line of JSON metadata followed by the data. Blobs are written to a
+    temporary file and renamed, so readers never see a partial blob. The
+    newest blob per value of a `tagged` metadata field (e.g. the dictionary
+    of a domain) is recorded under <root>/latest.
+    """
+
+    def __init__(self, root: str, use_mmap: bool = False, fallback: BlobStore = None,
+                 tagged: tuple = ("zstd_dictionary",)):
+        self.root = root
+        self.use_mmap = use_mmap
+        self.fallback = fallback  # store of blobs with other ids (e.g. GridFS)
+        self.tagged = tagged
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.root, digest[:2], digest[2:4], digest)
+
+    def _tagPath(self, field: str, value: str) -> str:
+        name = hashlib.sha256(str(value).encode("UTF-8")).hexdigest()
+        return os.path.join(self.root, "latest", field, name)
+
+    def _write(self, path: str, *parts):
+        # Write to a temporary file in the same directory, then rename
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as file:
+                for part in parts:
+                    file.write(part)
+            os.chmod(tmp, 0o644)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def find(self, digest: str):
+        if os.path.exists(self._path(digest)):
+            return digest
+        return self.fallback.find(digest) if self.fallback else None
+
+    def put(self, data: bytes, **attr):
+        # The content hash is given by savePageContent (hash of the
+        # uncompressed page); other blobs are keyed by the hash of the data
+        digest = attr.get("sha256") or hashlib.sha256(data).hexdigest()
+        path = self._path(digest)
+        meta = {**attr, "length": len(data), "uploadDate": time.time()}
+        header = json.dumps(meta, default=str).encode("UTF-8") + b"\n"
+        self._write(path, header, data)
+
+        for field in self.tagged:
+            if field in attr:
+                self._write(self._tagPath(field, attr[field]), digest.encode("ascii"))
+        return digest
+
+    def get(self, id):
+        id = str(id)
+        if not digest_pattern.match(id):
+            if self.fallback is None:
+                raise gridfs.errors.NoFile("No blob with id " + id)
+            return self.fallback.get(id)
+
+        path = self._path(id)
+        try:
+            with open(path, "rb") as file:
+                header = file.readline()
+        except FileNotFoundError:
+            raise gridfs.errors.NoFile("No blob with id " + id)
+        return FileBlob(path, json.loads(header), len(header), self.use_mmap)
+
+    def info(self, id) -> dict:
+        if not digest_pattern.match(str(id)) and self.fallback is not None:
+            return self.fallback.info(id)
+        return {"_id": str(id), **self.get(id).meta}
+
+    def latest(self, field: str, value: str):
+        try:
+            with open(self._tagPath(field, value), "rb") as file:
+                return file.read().decode("ascii")
+        except FileNotFoundError:
+            return self.fallback.latest(field, value) if self.fallback else None
+
+
+def openBlobStore(db, backend: str = "gridfs", path: str = None, use_mmap: bool = False) -> BlobStore:
+    """Returns the blob store of a backend ('gridfs' or 'filesystem')"""
+
+    if backend == "gridfs":
+        return GridFSStore(db)
+    if backend == "filesystem":
+        if not path:
+            raise ValueError("The filesystem blob store requires a path")
+        # Blobs stored in GridFS before the switch stay readable
+        return FileSystemStore(path, use_mmap, fallback=GridFSStore(db))
+    raise ValueError("Unknown blob store: " + str(backend))
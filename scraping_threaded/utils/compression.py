@@ -0,0 +1,145 @@
+# ===========================================================================
+#                            Compression
+# ===========================================================================
+# Pages are compressed before they are written to the blob store and
+# decompressed transparently when they are read. The codec is recorded in
+# the metadata of every file, so files of different codecs (and
+# uncompressed files of earlier runs) can be mixed.
+#
+# zstd is used if the zstandard package is installed (pip install
+# zstandard). Markup of one site repeats a lot, so pages of a domain are
+# compressed with a dictionary trained on earlier pages of that domain
+# (see train_dictionaries.py). The dictionaries are stored in the blob
+# store as well. Without zstandard, pages are compressed with gzip.
+
+from threading import Lock
+import gzip
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+NONE = "none"
+GZIP = "gzip"
+ZSTD = "zstd"
+
+CODECS = [NONE, GZIP, ZSTD]
+
+# Levels with a good ratio that still compress faster than a page downloads
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+# Metadata field of dictionary files (holds the domain)
+DICTIONARY_FIELD = "zstd_dictionary"
+
+
+def defaultCodec() -> str:
+    """Returns zstd if it is installed, otherwise gzip"""
+    return ZSTD if zstandard is not None else GZIP
+
+
+# Codec of new files; set once per process by the scripts
+codec = defaultCodec()
+
+
+def setCodec(name: str):
+    """Sets the codec of new files ('auto' picks the best available one)"""
+    global codec
+    if name == "auto":
+        name = defaultCodec()
+    if name == ZSTD and zstandard is None:
+        raise ValueError("zstd compression requires the zstandard package")
+    if name not in CODECS:
+        raise ValueError("Unknown codec: " + str(name))
+    codec = name
+
+
+# ---------------------------------------------------------------------------
+#                            DICTIONARIES
+# ---------------------------------------------------------------------------
+
+
+class DictionaryCache:
+    """Thread-safe zstd dictionaries of a process, loaded from the blob store once"""
+
+    def __init__(self):
+        self._lock = Lock()
+        self._by_id = {}  # file id -> dictionary
+        self._by_domain = {}  # domain -> file id (None if there is none)
+
+    def get(self, fs, id):
+        """Returns the dictionary stored in the file with the given id"""
+        with self._lock:
+            dictionary = self._by_id.get(id)
+        if dictionary is None:
+            dictionary = zstandard.ZstdCompressionDict(bytes(fs.get(id).read()))
+            with self._lock:
+                self._by_id[id] = dictionary
+        return dictionary
+
+    def latest(self, fs, domain: str):
+        """Returns (id, dictionary) of the newest dictionary of a domain"""
+        with self._lock:
+            known = domain in self._by_domain
+            id = self._by_domain.get(domain)
+        if not known:
+            id = fs.latest(DICTIONARY_FIELD, domain)
+            with self._lock:
+                self._by_domain[domain] = id
+        return (id, self.get(fs, id)) if id is not None else (None, None)
+
+    def clear(self):
+        with self._lock:
+            self._by_id.clear()
+            self._by_domain.clear()
+
+
+dictionaries = DictionaryCache()
+
+
+def trainDictionary(samples: list, size: int = 65_536):
+    """Trains a zstd dictionary on pages of one domain"""
+    return zstandard.train_dictionary(size, samples, level=ZSTD_LEVEL)
+
+
+def saveDictionary(fs, domain: str, dictionary):
+    """Stores a dictionary in the blob store; new files of the domain will use it"""
+    id = fs.put(dictionary.as_bytes(), **{DICTIONARY_FIELD: domain})
+    dictionaries.clear()
+    return id
+
+
+# ---------------------------------------------------------------------------
+#                            CODECS
+# ---------------------------------------------------------------------------
+
+
+def compress(fs, content: bytes, domain: str = None, name: str = None) -> tuple:
+    """Compresses a page; returns the data and the metadata to store with it"""
+
+    name = name or codec
+    if name == GZIP:
+        return gzip.compress(content, GZIP_LEVEL), {"codec": GZIP}
+    if name == ZSTD:
+        id, dictionary = dictionaries.latest(fs, domain) if domain else (None, None)
+        compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL, dict_data=dictionary)
+        meta = {"codec": ZSTD}
+        if id is not None:
+            meta["dictionary_id"] = id
+        return compressor.compress(content), meta
+    return content, {}
+
+
+def decompress(fs, data: bytes, name: str = None, dictionary_id=None) -> bytes:
+    """Reverses compress (files without codec are returned as they are)"""
+
+    if name == GZIP:
+        return gzip.decompress(data)
+    if name == ZSTD:
+        if zstandard is None:
+            raise ValueError("File is compressed with zstd, but zstandard is not installed")
+        dictionary = dictionaries.get(fs, dictionary_id) if dictionary_id else None
+        return zstandard.ZstdDecompressor(dict_data=dictionary).decompress(data)
+    return data
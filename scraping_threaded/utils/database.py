@@ -3,30 +3,47 @@
 # ===========================================================================
 
 from typing import List
+from datetime import datetime, timedelta
+from threading import Thread, Lock, Event
+from time import perf_counter, sleep
 from dotenv import load_dotenv
-from bson import ObjectId
+from bson import ObjectId, Binary
+from pymongo.errors import BulkWriteError, ConnectionFailure, CursorNotFound, OperationFailure
 import pymongo as pm
-import gridfs
+from utils.encoding import decodeContent
+from utils import compression
+from utils.blobs import BlobStore, openBlobStore
+import hashlib
+import socket
+import uuid
 import os
 
 # --------------------------------- Connection --------------------------------
 
 
 def getConnection(
-    connection_string: str = "", database_name: str = "", use_dotenv: bool = False
+    connection_string: str = "", database_name: str = "", use_dotenv: bool = False,
+    blob_store: str = "gridfs", blob_path: str = None, blob_mmap: bool = False,
 ):
-    "Returns MongoDB and GridFS connection"
+    """Returns the blob store (GridFS by default) and the MongoDB connection
+
+    With use_dotenv, the blob store is configured by BLOB_STORE (gridfs or
+    filesystem), BLOB_PATH and BLOB_MMAP (1 for memory-mapped reads).
+    """
 
     # Load config from config file
     if use_dotenv:
         load_dotenv()
         connection_string = os.getenv("CONNECTION_STRING")
         database_name = os.getenv("DATABASE_NAME")
+        blob_store = os.getenv("BLOB_STORE", blob_store)
+        blob_path = os.getenv("BLOB_PATH", blob_path)
+        blob_mmap = os.getenv("BLOB_MMAP", "1" if blob_mmap else "0") == "1"
 
     # Use connection string
     conn = pm.MongoClient(connection_string)
     db = conn[database_name]
-    fs = gridfs.GridFS(db)
+    fs = openBlobStore(db, blob_store, blob_path, blob_mmap)
 
     return fs, db
 
@@ -50,6 +67,17 @@ def getFirstBatchID(db) -> int:
     return batch_id
 
 
+def getBatchID(db, batch: str) -> int:
+    """Resolves 'all', 'first', 'last' or a number to a batch ID (None for all)"""
+    if batch == "all":
+        return None
+    if batch == "first":
+        return getFirstBatchID(db)
+    if batch == "last":
+        return getLatestBatchID(db)
+    return int(batch)
+
+
 def deleteBatch(db, batch_id: int):
     """Deletes all documents of a batch"""
     db.articles.delete_many({"batch_id": batch_id})
@@ -63,54 +91,338 @@ def fetchTasks(
     status: str,
     limit: int = 0,
     fields: dict = {},
+    stream: bool = False,
+    batch_size: int = 1000,
+    keyset: bool = True,
+    max_tries: int = None,
+    domains: list = None,
+    exclude_domains: list = None,
 ):
-    """Returns a batch of scraping tasks"""
+    """Returns a batch of scraping tasks (a generator if `stream` is set)
+
+    All filters run on the server, so `limit` counts the tasks which are
+    returned: tasks tried more than `max_tries` times and tasks of other
+    domains (media_name) are never read. Only the given fields are
+    returned (whole documents if there are none).
+    """
 
-    # Add status code to fields
-    fields["status_code"] = 1
-    query = {"$and": []}
+    query = _taskQuery(status, batch_id, max_tries, domains, exclude_domains)
+    fields = fields or None
 
-    if batch_id and status:
-        query["$and"] = [{"status": status}, {"batch_id": batch_id}]
-    elif status:
-        # Consider all batches if no batch ID specified
-        query["$and"] = [{"status": status}]
-    elif batch_id:
-        # Consider all batches if no batch ID specified
-        query["$and"] = [{"batch_id": batch_id}]
+    # Streaming keeps at most one batch of documents in memory
+    if stream:
+        return _streamTasks(db, query, fields, limit, batch_size, keyset)
 
     # Sorting requires a lot of memory
     tasks = db.articles.find(query, fields).limit(limit)
 
     return list(tasks)
 
+
+def _domainQuery(domains: list = None, exclude_domains: list = None) -> list:
+    """Returns the conditions on the domain (media_name) of a task"""
+
+    conditions = []
+    if domains:
+        conditions.append({"media_name": {"$in": list(domains)}})
+    if exclude_domains:
+        conditions.append({"media_name": {"$nin": list(exclude_domains)}})
+    return conditions
+
+
+def _taskQuery(status: str, batch_id: int = None, max_tries: int = None,
+               domains: list = None, exclude_domains: list = None) -> dict:
+    """Returns the filter of fetchTasks (covered by the indexes below)"""
+
+    conditions = []
+    if status:
+        conditions.append({"status": status})
+    # Consider all batches if no batch ID specified
+    if batch_id:
+        conditions.append({"batch_id": batch_id})
+    if max_tries is not None:
+        conditions.append({"tries": {"$lte": max_tries}})
+    conditions += _domainQuery(domains, exclude_domains)
+
+    # An empty $and is not a valid filter
+    return {"$and": conditions} if conditions else {}
+
+
+def _afterQuery(query: dict, last_id) -> dict:
+    """Returns the filter of the tasks after `last_id` (in _id order)"""
+    if last_id is None:
+        return query
+    return {"$and": query.get("$and", []) + [{"_id": {"$gt": last_id}}]}
+
+
+def _streamTasks(db, query: dict, fields: dict, limit: int, batch_size: int, keyset: bool):
+    """Yields tasks in _id order, by default paginated by _id"""
+
+    last_id = None
+    fetched = 0
+
+    # A single cursor fetching `batch_size` documents per round trip. The
+    # server drops cursors which are idle for 10 minutes (e.g. while the
+    # consumer is full); the stream then continues after the last _id
+    if not keyset:
+        while True:
+            cursor = db.articles.find(_afterQuery(query, last_id), fields) \
+                .sort("_id", pm.ASCENDING).limit(limit - fetched if limit else 0) \
+                .batch_size(batch_size)
+            try:
+                for task in cursor:
+                    fetched += 1
+                    last_id = task["_id"]
+                    yield task
+                return
+            except CursorNotFound:
+                if limit and fetched >= limit:
+                    return
+
+    # Keyset pagination: short-lived queries which continue after the last
+    # _id, so no cursor has to stay open during a long run
+    while not limit or fetched < limit:
+        size = min(batch_size, limit - fetched) if limit else batch_size
+        page = list(db.articles.find(_afterQuery(query, last_id), fields)
+                    .sort("_id", pm.ASCENDING).limit(size))
+        if not page:
+            return
+        fetched += len(page)
+        last_id = page[-1]["_id"]
+        yield from page
+
+# --------------------------------- Claims --------------------------------
+# Claiming moves a task to IN-PROGRESS and attaches a lease to it. Several
+# scraper hosts can therefore share one queue without fetching the same
+# URLs. A lease that expires (e.g. the host crashed) makes the task
+# claimable again under its original status.
+
+
+def getWorkerID() -> str:
+    "Returns an identifier for this scraper process"
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def _claimQuery(status: str, batch_id: int = None, max_tries: int = None,
+                domains: list = None, exclude_domains: list = None):
+    """Returns the filter matching claimable tasks"""
+
+    query = {"$or": [
+        {"status": status},
+        {"status": "IN-PROGRESS", "lease.status": status,
+         "lease.expires_at": {"$lt": datetime.utcnow()}},
+    ]}
+    if batch_id:
+        query["batch_id"] = batch_id
+    if max_tries is not None:
+        query["tries"] = {"$lte": max_tries}
+    domain = _domainQuery(domains, exclude_domains)
+    if domain:
+        query["$and"] = domain
+    return query
+
+
+def _lease(worker_id: str, status: str, lease: float, token: str = None):
+    """Returns the lease sub-document of a claimed task"""
+
+    lease = {"worker_id": worker_id, "status": status,
+             "expires_at": datetime.utcnow() + timedelta(seconds=lease)}
+    if token:
+        lease["token"] = token
+    return lease
+
+
+def claimTasks(
+    db,
+    worker_id: str,
+    status: str,
+    batch_id: int = None,
+    limit: int = 0,
+    max_tries: int = None,
+    lease: float = 900,
+    fields: dict = {},
+    batch_size: int = 100,
+    domains: list = None,
+    exclude_domains: list = None,
+):
+    """Yields tasks which are claimed in batches of `batch_size`"""
+
+    claimed = 0
+    while not limit or claimed < limit:
+        size = min(batch_size, limit - claimed) if limit else batch_size
+        query = _claimQuery(status, batch_id, max_tries, domains, exclude_domains)
+
+        # Pick candidates and claim them with a unique token; documents
+        # claimed by another host in between are not matched anymore
+        ids = [t["_id"] for t in db.articles.find(query, {"_id": 1}).limit(size)]
+        if not ids:
+            return
+
+        token = uuid.uuid4().hex
+        update = {"$set": {"status": "IN-PROGRESS",
+                           "lease": _lease(worker_id, status, lease, token)}}
+        db.articles.update_many({**query, "_id": {"$in": ids}}, update)
+
+        # Return only the tasks won by this claim; the owner of the lease
+        # is kept, so only this worker can finish them (see updateTask)
+        query = {"_id": {"$in": ids}, "lease.token": token}
+        projection = {**fields, "lease.worker_id": 1} if fields else None
+        tasks = list(db.articles.find(query, projection))
+        claimed += len(tasks)
+        yield from tasks
+
+
+def renewLeases(db, worker_id: str, lease: float = 900):
+    """Extends the leases of all tasks held by a worker"""
+
+    query = {"status": "IN-PROGRESS", "lease.worker_id": worker_id}
+    update = {"$set": {"lease.expires_at": datetime.utcnow() + timedelta(seconds=lease)}}
+    return db.articles.update_many(query, update)
+
+
+def leaseOwner(task) -> str:
+    """Returns the worker which claimed a task (None if it was not claimed)"""
+    return (task.get("lease") or {}).get("worker_id")
+
+
+def releaseTasks(db, worker_id: str):
+    """Returns all tasks leased by a worker to their original status"""
+
+    query = {"status": "IN-PROGRESS", "lease.worker_id": worker_id}
+    update = [{"$set": {"status": "$lease.status"}}, {"$unset": "lease"}]
+    return db.articles.update_many(query, update)
+
 # --------------------------------- Files --------------------------------
+# Pages and texts are referenced from the task by the id of their file, or
+# stored inline in the task if they are small (see storePageContent).
+
+# Payloads up to this size (in bytes, before compression) are stored inline
+inline_size = 16_384
+
+
+def setInlineSize(size: int):
+    """Sets the largest payload stored inline (0 stores every payload as a file)"""
+    global inline_size
+    inline_size = size
 
 
-def getPageContent(fs: gridfs, id: str, encoding="UTF-8"):
-    """Retrieves a file from GridFS"""
-    f = fs.get(ObjectId(id))
-    return f.read().decode(encoding)
+def getPageBytes(fs: BlobStore, id) -> tuple:
+    """Retrieves the raw bytes of a page and its stored charset
 
+    `id` is the id of a file in the blob store or an inline payload. Both
+    are decompressed with the codec stored with them.
+    """
+    if isinstance(id, dict):
+        content = compression.decompress(fs, id["data"], id.get("codec"),
+                                         id.get("dictionary_id"))
+        return bytes(content), id.get("charset")
 
-def getPageContentInfo(db, id: str):
-    """Retrieves a file from GridFS"""
-    info = db.fs.files.find_one({"_id": ObjectId(id)})
-    return dict(info)
+    f = fs.get(id)
+    content = compression.decompress(fs, f.read(), getattr(f, "codec", None),
+                                     getattr(f, "dictionary_id", None))
+    # Memory-mapped files are only views
+    return bytes(content), getattr(f, "charset", None)
 
 
-def savePageContent(fs, content, encoding="UTF-8", attr={}):
-    """Saves a file in GridFS"""
+def getPageContent(fs: BlobStore, id, encoding=None):
+    """Retrieves a page (file id or inline payload) and decodes it
+
+    Pages are stored as raw bytes. The given encoding and the charset stored
+    with the file are tried first, then the encoding is detected.
+    """
+    content, charset = getPageBytes(fs, id)
+    text, _ = decodeContent(content, encoding, charset)
+    return text
+
+
+def getPageContentInfo(fs: BlobStore, id) -> dict:
+    """Retrieves the metadata of a page (file id or inline payload)"""
+    if isinstance(id, dict):
+        return {k: v for k, v in id.items() if k != "data"}
+    return fs.info(id)
+
+
+def contentHash(content) -> str:
+    """Returns the SHA-256 hex digest of a page (str is hashed as UTF-8)"""
+    if type(content) == str:
+        content = content.encode("UTF-8")
+    return hashlib.sha256(content).hexdigest()
+
+
+def savePageContent(fs, content, encoding="UTF-8", attr={}, dedup=True, domain=None):
+    """Saves a file in the blob store (GridFS by default)
+
+    Files are content addressed: a file with the same SHA-256 is stored only
+    once and its id is returned for every copy (the attributes are the ones
+    of the first copy). Files are compressed with the codec configured in
+    utils.compression; pages of a domain with a trained dictionary use it.
+    """
     if content and len(content) > 0:
         if type(content) == str:
             content = content.encode(encoding)
-        file_id = fs.put(content, **attr)
+        digest = contentHash(content)
+        if dedup:
+            existing = fs.find(digest)
+            if existing is not None:
+                return existing
+        data, meta = compression.compress(fs, content, domain)
+        file_id = fs.put(data, sha256=digest, raw_length=len(content), **meta, **attr)
         return file_id
     # else:
     #    raise ValueError("File must not be emtpy")
     return None
 
 
+def storePageContent(fs, content, encoding="UTF-8", attr={}, domain=None):
+    """Stores a page or text; returns the reference to keep in the task
+
+    Payloads up to `inline_size` bytes are returned as a compressed BSON
+    binary (with the codec and charset), so they are written and read with
+    the task itself. Larger ones are saved as a file and referenced by id.
+    Empty payloads are not stored (None).
+    """
+    if type(content) == str:
+        content = content.encode(encoding)
+    if content and len(content) <= inline_size:
+        data, meta = compression.compress(fs, content, domain)
+        inline = {"data": Binary(data), "sha256": contentHash(content), **meta}
+        if attr.get("charset"):
+            inline["charset"] = attr["charset"]
+        return inline
+    file_id = savePageContent(fs, content, encoding, attr, domain=domain)
+    return str(file_id) if file_id is not None else None
+
+# --------------------------------- Extractions --------------------------------
+# Extracted texts by page hash, so copies of a page (syndicated articles,
+# urls imported twice) are only extracted once. The key also holds the
+# parser, the charset hint and the extraction profile of the url, because
+# each of them changes the result.
+
+
+def extractionKey(content, profile: str = "", parser: str = "html.parser", encoding: str = None) -> str:
+    """Returns the key of an extraction (hash of the page, parser, charset hint and url profile)"""
+    return "|".join([contentHash(content), parser, (encoding or "").lower(), profile])
+
+
+def findExtraction(db, key: str) -> dict:
+    """Returns a stored extraction (text_id, abstract, parsing_error) or None
+
+    text_id is the reference returned by storePageContent.
+    """
+    return db.extractions.find_one({"_id": key})
+
+
+def saveExtraction(db, key: str, text_id, abstract: str, error, writer=None):
+    """Stores the outcome of an extraction under its key"""
+
+    filter = {"_id": key}
+    values = {"$setOnInsert": {"text_id": text_id, "abstract": abstract,
+                               "parsing_error": error}}
+    if writer is not None:
+        return writer.add(pm.UpdateOne(filter, values, upsert=True), collection="extractions")
+    return db.extractions.update_one(filter, values, upsert=True)
+
+
 # def updateTask(db, id: str, values: dict = {}):
 #     "Updates scraping task in database"
 
@@ -122,17 +434,288 @@ def savePageContent(fs, content, encoding="UTF-8", attr={}):
 #     r = db.articles.update_one(filter, values)
 #     return r
 
-def updateTask(db, id: str, values: dict = {}, result={}):
-    "Updates scraping task in database"
+def updateTask(db, id: str, values: dict = {}, result={}, writer=None, tries: int = 1,
+               worker_id: str = None, tries_before: int = None):
+    """Updates scraping task in database (buffered if a writer is given)
+
+    With a worker_id (claim mode) the task is only updated while that worker
+    holds its lease; a task which was reclaimed by another host is left alone.
+    With the tries the task was read with, the new count is set instead of
+    incremented, so a bulk write which is sent again does not count twice.
+    """
 
     filter = {"_id": ObjectId(id)}
+    if worker_id:
+        filter["lease.worker_id"] = worker_id
     values = {
         "$set": {**values, "scraping_result": {**result}} if result else {**values},
-        "$inc": {"tries": 1},
+        "$unset": {"lease": ""},  # finishing a task ends its claim
     }
+    # Retries within a run count as tries
+    if tries_before is not None:
+        values["$set"]["tries"] = tries_before + tries
+    else:
+        values["$inc"] = {"tries": tries}
+    if writer is not None:
+        return writer.add(pm.UpdateOne(filter, values))
     r = db.articles.update_one(filter, values)
     return r
 
+def denylistTask(db, id: str, reason: str, writer=None, worker_id: str = None):
+    "Marks a task as DENYLISTED, e.g. before its url is fetched (see updateTask)"
+
+    filter = {"_id": ObjectId(id)}
+    if worker_id:
+        filter["lease.worker_id"] = worker_id
+    values = {
+        "$set": {"status": "DENYLISTED", "denylist_reason": reason},
+        "$unset": {"lease": ""},
+    }
+    if writer is not None:
+        return writer.add(pm.UpdateOne(filter, values))
+    return db.articles.update_one(filter, values)
+
+# --------------------------------- Bulk Writes --------------------------------
+
+
+class BulkWriter:
+    """Write-behind buffer which sends operations as unordered bulk writes
+
+    Operations are flushed once `max_size` operations are buffered or
+    `max_delay` seconds have passed. close() flushes the remaining ones and
+    has to be called on shutdown. A batch which fails with a connection
+    error (e.g. AutoReconnect, NetworkTimeout) is sent again up to
+    `max_attempts` times (task updates set their tries, so they can be
+    applied twice); operations which are given up on count as errors.
+    """
+
+    def __init__(self, db, max_size: int = 500, max_delay: float = 1.0, logger=None,
+                 max_attempts: int = 3, retry_delay: float = 1.0):
+        self.db = db
+        self.max_size = max_size
+        self.max_delay = max_delay
+        self.logger = logger
+        self.max_attempts = max(max_attempts, 1)
+        self.retry_delay = retry_delay
+
+        self._ops = {}  # collection name -> list of operations
+        self._size = 0
+        self._lock = Lock()
+        self._flush_lock = Lock()
+        self._stop = Event()
+
+        # Metrics
+        self.flushes = 0
+        self.written = 0
+        self.errors = 0
+        self.dropped = 0  # operations which were not written at all
+        self.retries = 0
+        self.max_queue_depth = 0
+        self.flush_time_total = 0.0
+        self.flush_time_max = 0.0
+
+        # Flush periodically, even if the buffer does not fill up
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def add(self, op, collection: str = "articles"):
+        """Buffers an operation; flushes if the buffer is full"""
+
+        with self._lock:
+            self._ops.setdefault(collection, []).append(op)
+            self._size += 1
+            self.max_queue_depth = max(self.max_queue_depth, self._size)
+            full = self._size >= self.max_size
+
+        if full:
+            self.flush()
+
+    def flush(self):
+        """Writes all buffered operations"""
+
+        with self._flush_lock:
+            with self._lock:
+                ops, self._ops, self._size = self._ops, {}, 0
+
+            for collection, batch in ops.items():
+                start = perf_counter()
+                self._write(collection, batch)
+                duration = perf_counter() - start
+
+                self.flushes += 1
+                self.flush_time_total += duration
+                self.flush_time_max = max(self.flush_time_max, duration)
+
+    def _write(self, collection: str, batch: list):
+        """Sends one batch; retries it after connection errors"""
+
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                r = self.db[collection].bulk_write(batch, ordered=False)
+                self.written += r.modified_count + r.upserted_count
+                return
+            except BulkWriteError as e:
+                # Unordered writes continue after an error
+                self.written += e.details.get("nModified", 0) + e.details.get("nUpserted", 0)
+                self.errors += len(e.details.get("writeErrors", []))
+                self._log(f"Bulk write:  {repr(e)}")
+                return
+            except ConnectionFailure as e:
+                if attempt == self.max_attempts:
+                    error = e
+                    break
+                self.retries += 1
+                self._log(f"Bulk write (attempt {attempt}):  {repr(e)}")
+                sleep(self.retry_delay * attempt)
+            except Exception as e:
+                error = e
+                break
+
+        # The batch is lost; its operations are counted as errors
+        self.errors += len(batch)
+        self.dropped += len(batch)
+        self._log(f"Bulk write: dropped {len(batch)} operations on {collection}:  {repr(error)}")
+
+    def _log(self, message: str):
+        if self.logger:
+            self.logger.error(message)
+
+    def close(self):
+        """Stops the periodic flush and writes the remaining operations"""
+        self._stop.set()
+        self._thread.join()
+        self.flush()
+
+    def queueDepth(self) -> int:
+        """Returns the number of buffered operations"""
+        return self._size
+
+    def metrics(self) -> dict:
+        """Returns flush latency and queue depth statistics"""
+        return {
+            "flushes": self.flushes,
+            "written": self.written,
+            "errors": self.errors,
+            "dropped": self.dropped,
+            "retries": self.retries,
+            "queue_depth": self._size,
+            "max_queue_depth": self.max_queue_depth,
+            "flush_latency_avg": self.flush_time_total / self.flushes if self.flushes else 0.0,
+            "flush_latency_max": self.flush_time_max,
+        }
+
+    def _run(self):
+        while not self._stop.wait(self.max_delay):
+            try:
+                self.flush()
+            except Exception as e:
+                self._log(f"Bulk write:  {repr(e)}")
+
+# --------------------------------- Latencies --------------------------------
+
+
+def loadLatencies(db) -> dict:
+    """Returns the stored latency histograms ({domain: counts})"""
+    return {d["_id"]: d["counts"] for d in db.domain_latencies.find({}, {"counts": 1})}
+
+
+def saveLatencies(db, histograms: dict):
+    """Stores latency histograms ({domain: counts}) for the next runs"""
+    if not histograms:
+        return None
+    now = datetime.now()
+    operations = [pm.UpdateOne({"_id": domain},
+                               {"$set": {"counts": counts, "updated_at": now}},
+                               upsert=True)
+                  for domain, counts in histograms.items()]
+    return db.domain_latencies.bulk_write(operations, ordered=False)
+
+# --------------------------------- Indexes --------------------------------
+# Indexes of the task selection queries, shared by setup_db.py and
+# migrate_indexes.py. Queued tasks (UNPROCESSED, FAILED) are a small part
+# of a large collection, so they get partial indexes of their own.
+
+# (collection, keys, options); the names identify the indexes
+indexes = [
+    # fetchTasks and claims: status and batch, retries filtered by tries
+    ("articles", [("status", pm.ASCENDING), ("batch_id", pm.ASCENDING), ("tries", pm.ASCENDING)],
+     {"name": "index_articles_status_batch_tries"}),
+    # Queued tasks per batch in _id order (keyset pagination). Partial
+    # indexes on the same keys require MongoDB 5.0, so the failed tasks,
+    # which are mostly selected by tries, carry them as a third key
+    ("articles", [("batch_id", pm.ASCENDING), ("_id", pm.ASCENDING)],
+     {"name": "index_articles_unprocessed",
+      "partialFilterExpression": {"status": "UNPROCESSED"}}),
+    ("articles", [("batch_id", pm.ASCENDING), ("_id", pm.ASCENDING), ("tries", pm.ASCENDING)],
+     {"name": "index_articles_failed",
+      "partialFilterExpression": {"status": "FAILED"}}),
+    # Expired leases of claimed tasks, and the tasks of a worker
+    ("articles", [("lease.status", pm.ASCENDING), ("lease.expires_at", pm.ASCENDING)],
+     {"name": "index_articles_lease",
+      "partialFilterExpression": {"status": "IN-PROGRESS"}}),
+    ("articles", [("lease.worker_id", pm.ASCENDING)],
+     {"name": "index_articles_lease_worker",
+      "partialFilterExpression": {"status": "IN-PROGRESS"}}),
+    # Per-domain scheduling
+    ("articles", [("media_url", pm.ASCENDING), ("status", pm.ASCENDING)],
+     {"name": "index_articles_media_url"}),
+    ("articles", [("batch_id", pm.ASCENDING)], {"name": "index_articles_batch_id"}),
+    # Domain filters of fetchTasks
+    ("articles", [("media_name", pm.ASCENDING), ("status", pm.ASCENDING)],
+     {"name": "index_articles_media_name"}),
+    # Content addressed files and compression dictionaries
+    ("fs.files", [("sha256", pm.ASCENDING)], {"name": "index_fs_files_sha256"}),
+    ("fs.files", [("zstd_dictionary", pm.ASCENDING), ("uploadDate", pm.DESCENDING)],
+     {"name": "index_fs_files_dictionary", "sparse": True}),
+]
+
+# Indexes which are replaced by the ones above
+obsolete_indexes = [
+    ("articles", "index_articles_status"),  # TEXT index, unusable for equality
+]
+
+
+def ensureIndexes(db, drop_obsolete: bool = True) -> list:
+    """Creates the indexes (idempotent); returns the changes made
+
+    An index whose name exists with another definition is rebuilt, indexes
+    which can not be created are reported as failed.
+    """
+
+    changes = []
+    for collection, keys, options in indexes:
+        existing = db[collection].index_information().get(options["name"])
+        if existing is not None:
+            same_keys = [tuple(k) for k in existing["key"]] == keys
+            same_options = all(existing.get(k) == v for k, v in options.items() if k != "name")
+            if same_keys and same_options:
+                continue
+            db[collection].drop_index(options["name"])
+            change = "rebuilt"
+        else:
+            change = "created"
+
+        # E.g. the same keys exist under another name
+        try:
+            db[collection].create_index(keys, **options)
+        except OperationFailure as e:
+            change = "failed: " + str(e)
+        changes.append((change, collection, options["name"]))
+
+    if drop_obsolete:
+        for collection, name in obsolete_indexes:
+            if name in db[collection].index_information():
+                db[collection].drop_index(name)
+                changes.append(("dropped", collection, name))
+
+    return changes
+
 # --------------------------------- Statistics --------------------------------
 
 
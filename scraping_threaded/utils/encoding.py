@@ -0,0 +1,191 @@
+# ===========================================================================
+#                            Character Encodings
+# ===========================================================================
+# Pages are stored as the raw bytes of the response together with the
+# charset they declare. They are decoded only when the text is extracted.
+#
+# The encoding is sniffed from the first few KB (byte order mark, HTTP
+# header, <meta> tag). Encodings which decoded a page are cached per
+# domain, and statistical detection only runs on a bounded prefix when
+# nothing else is known.
+
+from charset_normalizer import detect
+from threading import Lock
+import codecs
+import re
+
+
+# Bytes of a page which are searched for a <meta> charset
+SNIFF_LIMIT = 4096
+
+# Bytes of a page which are used for statistical detection
+DETECT_LIMIT = 65_536
+
+# Byte order marks, longest first (UTF-32 LE starts with the UTF-16 LE mark),
+# with the codecs which remove the mark while decoding
+boms = [
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+]
+
+# Charset of a "Content-Type" header or a <meta> tag
+charset_pattern = re.compile(rb'charset\s*=\s*["\']?\s*([a-zA-Z0-9_.:-]+)', re.I)
+
+# <meta charset="..."> or <meta http-equiv="Content-Type" content="...; charset=...">
+meta_pattern = re.compile(rb'<meta[^>]+charset[^>]*>', re.I)
+
+
+# ---------------------------------------------------------------------------
+#                            SNIFFING
+# ---------------------------------------------------------------------------
+
+
+def normalizeCharset(name) -> str:
+    """Returns the canonical name of a charset (None if it is unknown)"""
+    if not name:
+        return None
+    if isinstance(name, bytes):
+        name = name.decode("ascii", "ignore")
+    try:
+        return codecs.lookup(name.strip()).name
+    except LookupError:
+        return None
+
+
+def bomCharset(content: bytes) -> str:
+    """Returns the charset given by a byte order mark"""
+    for bom, encoding in boms:
+        if content.startswith(bom):
+            return encoding
+    return None
+
+
+def headerCharset(content_type) -> str:
+    """Returns the charset given in a Content-Type header"""
+    if not content_type:
+        return None
+    match = charset_pattern.search(content_type.encode("latin-1", "ignore"))
+    return normalizeCharset(match.group(1)) if match else None
+
+
+def metaCharset(content: bytes, limit: int = SNIFF_LIMIT) -> str:
+    """Returns the charset of the first <meta> tag within `limit` bytes"""
+    if not content:
+        return None
+    tag = meta_pattern.search(content[:limit])
+    if tag is None:
+        return None
+    match = charset_pattern.search(tag.group(0))
+    return normalizeCharset(match.group(1)) if match else None
+
+
+def sniffCharset(content: bytes, content_type: str = None) -> str:
+    """Returns the declared charset: byte order mark, header, <meta> tag"""
+    if not content:
+        return headerCharset(content_type)
+    return bomCharset(content) or headerCharset(content_type) or metaCharset(content)
+
+
+# ---------------------------------------------------------------------------
+#                            DOMAIN CACHE
+# ---------------------------------------------------------------------------
+
+
+class EncodingCache:
+    """Thread-safe encodings which decoded pages of a domain"""
+
+    def __init__(self, max_size: int = 100_000):
+        self.max_size = max_size
+        self._lock = Lock()
+        self._encodings = {}  # domain -> encoding
+        self.hits = 0
+        self.detections = 0
+
+    def get(self, domain: str) -> str:
+        with self._lock:
+            return self._encodings.get(domain)
+
+    def count(self, hits: int = 0, detections: int = 0):
+        """Adds to the metrics (decodeContent runs on several threads)"""
+        with self._lock:
+            self.hits += hits
+            self.detections += detections
+
+    def confirm(self, domain: str, encoding: str):
+        """Remembers the encoding which decoded a page of the domain"""
+        if not domain or not encoding:
+            return
+        with self._lock:
+            if len(self._encodings) >= self.max_size and domain not in self._encodings:
+                self._encodings.clear()
+            self._encodings[domain] = encoding
+
+
+# Shared by all threads of a process
+encoding_cache = EncodingCache()
+
+
+# ---------------------------------------------------------------------------
+#                            DECODING
+# ---------------------------------------------------------------------------
+
+
+def _tryDecode(content: bytes, encoding: str):
+    try:
+        return content.decode(encoding)
+    except (UnicodeDecodeError, LookupError):
+        return None
+
+
+def decodeContent(content: bytes, *hints, domain: str = None,
+                  cache: EncodingCache = encoding_cache) -> tuple:
+    """Decodes a page; returns (text, encoding)
+
+    The byte order mark, the hints (e.g. the stored charset) and the <meta>
+    tag are tried first, then UTF-8, then the encoding cached for the
+    domain, then detection on a prefix of the page. As a last resort the page is decoded
+    as UTF-8 with replacement characters, so a page is never lost.
+    """
+
+    if content is None:
+        return None, None
+    if isinstance(content, str):
+        return content, None
+
+    # Declared charsets
+    declared = [bomCharset(content)] + [normalizeCharset(h) for h in hints]
+    declared.append(metaCharset(content))
+    for encoding in declared:
+        if encoding is not None:
+            text = _tryDecode(content, encoding)
+            if text is not None:
+                cache.confirm(domain, encoding)
+                return text, encoding
+
+    # Valid UTF-8 is almost never anything else; it goes first because
+    # single byte encodings decode any page
+    text = _tryDecode(content, "utf-8")
+    if text is not None:
+        return text, "utf-8"
+
+    # Encoding of earlier pages of the domain
+    cached = cache.get(domain) if domain else None
+    if cached is not None:
+        text = _tryDecode(content, cached)
+        if text is not None:
+            cache.count(hits=1)
+            return text, cached
+
+    # Detection is expensive, so it only looks at the start of the page
+    cache.count(detections=1)
+    encoding = normalizeCharset(detect(content[:DETECT_LIMIT])["encoding"])
+    if encoding is not None:
+        text = _tryDecode(content, encoding)
+        if text is not None:
+            cache.confirm(domain, encoding)
+            return text, encoding
+
+    return content.decode("utf-8", errors="replace"), "utf-8"
@@ -0,0 +1,138 @@
+# ===========================================================================
+#                            Domain Latency
+# ===========================================================================
+# Tracks the response time (ScrapingResult.elapsed) of every domain in a
+# log-scaled histogram and derives the request timeout of a domain from a
+# percentile of it. Fast hosts fail fast, slow hosts get the time they
+# need. The histograms are stored in the database, so a run starts with
+# the timeouts of the previous runs.
+
+from threading import Lock
+import math
+
+
+# ---------------------------------------------------------------------------
+#                            HISTOGRAM
+# ---------------------------------------------------------------------------
+
+
+class LatencyHistogram:
+    """Histogram with buckets growing by 20% from 10ms to about 15 minutes"""
+
+    MIN = 0.01
+    GROWTH = 1.2
+    SIZE = 64
+
+    def __init__(self, counts: list = None):
+        self.counts = list(counts) if counts else [0.0] * self.SIZE
+
+    @property
+    def samples(self) -> float:
+        return sum(self.counts)
+
+    def add(self, seconds: float):
+        """Counts a latency in its bucket"""
+        if seconds <= self.MIN:
+            index = 0
+        else:
+            index = math.ceil(math.log(seconds / self.MIN, self.GROWTH))
+        self.counts[min(index, self.SIZE - 1)] += 1
+
+    def quantile(self, q: float) -> float:
+        """Returns the upper bound of the bucket holding the q-quantile"""
+        target = q * self.samples
+        total = 0.0
+        for index, count in enumerate(self.counts):
+            total += count
+            if total >= target and count:
+                return self.MIN * self.GROWTH ** index
+        return self.MIN * self.GROWTH ** (self.SIZE - 1)
+
+    def decay(self, factor: float):
+        """Scales all counts, so older samples weigh less than new ones"""
+        self.counts = [count * factor for count in self.counts]
+
+
+# ---------------------------------------------------------------------------
+#                            TRACKER
+# ---------------------------------------------------------------------------
+
+
+class LatencyTracker:
+    """Thread-safe per-domain latencies and the timeouts derived from them"""
+
+    def __init__(
+        self,
+        default: float = 5.0,  # timeout of domains with too few samples
+        minimum: float = 2.0,
+        maximum: float = 30.0,
+        quantile: float = 0.95,
+        factor: float = 3.0,  # timeout = factor * quantile
+        min_samples: int = 5,
+        decay: float = 0.5,  # weight of the stored samples in a new run
+    ):
+        self.default = default
+        self.minimum = minimum
+        self.maximum = maximum
+        self.quantile = quantile
+        self.factor = factor
+        self.min_samples = min_samples
+        self.decay = decay
+
+        self._lock = Lock()
+        self._histograms = {}  # domain -> histogram
+        self._changed = set()  # domains with new samples in this run
+
+    def __len__(self):
+        return len(self._histograms)
+
+    def load(self, histograms: dict):
+        """Adds stored histograms ({domain: counts}) from previous runs"""
+        with self._lock:
+            for domain, counts in histograms.items():
+                histogram = LatencyHistogram(counts)
+                histogram.decay(self.decay)
+                self._histograms[domain] = histogram
+
+    def changed(self) -> dict:
+        """Returns the histograms ({domain: counts}) updated in this run"""
+        with self._lock:
+            return {d: list(self._histograms[d].counts) for d in self._changed}
+
+    def record(self, domain: str, seconds: float):
+        """Adds the latency of a request
+
+        Timed out requests should be recorded with the timeout, so the
+        timeout of a domain grows until its requests succeed.
+        """
+        if seconds is None:
+            return
+        with self._lock:
+            histogram = self._histograms.get(domain)
+            if histogram is None:
+                histogram = LatencyHistogram()
+                self._histograms[domain] = histogram
+            histogram.add(seconds)
+            self._changed.add(domain)
+
+    def timeout(self, domain: str) -> float:
+        """Returns the timeout for the next request to a domain"""
+        with self._lock:
+            histogram = self._histograms.get(domain)
+            if histogram is None or histogram.samples < self.min_samples:
+                return self.default
+            timeout = self.factor * histogram.quantile(self.quantile)
+        return round(min(max(timeout, self.minimum), self.maximum), 3)
+
+    def metrics(self) -> dict:
+        """Returns the spread of the current timeouts over all domains"""
+        timeouts = sorted(self.timeout(d) for d in list(self._histograms))
+        if not timeouts:
+            return {"domains": 0}
+        return {
+            "domains": len(timeouts),
+            "updated": len(self._changed),
+            "timeout_min": timeouts[0],
+            "timeout_median": timeouts[len(timeouts) // 2],
+            "timeout_max": timeouts[-1],
+        }
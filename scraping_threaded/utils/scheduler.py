@@ -0,0 +1,529 @@
+# ===========================================================================
+#                            Domain Scheduler
+# ===========================================================================
+# Shared work queue for the scraping workers. Tasks are grouped by domain
+# and every domain has its own token bucket and concurrency limit. An idle
+# worker takes the next task of any domain that is allowed to run, so the
+# total throughput grows with the number of domains in a batch instead of
+# being bound by the largest one. An optional circuit breaker holds back
+# domains which started to block the scraper.
+
+from collections import deque
+from threading import Condition
+from logging import Logger
+from utils.urls import getDomain
+import itertools
+import math
+import asyncio
+import heapq
+import time
+
+
+# ---------------------------------------------------------------------------
+#                            TOKEN BUCKET
+# ---------------------------------------------------------------------------
+
+
+class TokenBucket:
+    """Token bucket which refills at `rate` tokens per second"""
+
+    def __init__(self, rate: float, capacity: float = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity,
+                          self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: float) -> float:
+        """Returns the seconds until the next token is available"""
+        if self.rate <= 0:
+            return 0.0
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def consume(self, now: float):
+        """Takes one token out of the bucket"""
+        if self.rate > 0:
+            self._refill(now)
+            self.tokens -= 1
+
+
+# ---------------------------------------------------------------------------
+#                            CIRCUIT BREAKER
+# ---------------------------------------------------------------------------
+
+
+class Circuit:
+    """Breaker state of a single domain"""
+
+    CLOSED = "CLOSED"
+    OPEN = "OPEN"
+    HALF_OPEN = "HALF-OPEN"
+
+    def __init__(self, window: int):
+        self.state = Circuit.CLOSED
+        self.outcomes = deque(maxlen=window)  # None or failure reason
+        self.open_until = 0.0
+        self.trips = 0
+        self.probing = False
+
+
+class CircuitBreaker:
+    """Per-domain circuit breaker driven by the outcome of every request
+
+    A domain trips once the failures among its last `window` requests reach
+    `failure_rate` (after at least `min_requests`) or once `max_blocks`
+    block pages were seen. Its tasks are then held back for `cooldown`
+    seconds, doubled with every further trip. Afterwards a single probe is
+    let through: success closes the circuit, failure opens it again. After
+    `max_trips` trips (0 equals no limit) the remaining tasks are skipped.
+    """
+
+    BLOCKED = "BLOCKED"  # failure reason of a detected block page
+
+    def __init__(
+        self,
+        failure_rate: float = 0.5,
+        min_requests: int = 5,
+        max_blocks: int = 3,
+        window: int = 20,
+        cooldown: float = 300,
+        max_cooldown: float = 3600,
+        max_trips: int = 3,
+        logger: Logger = None,
+    ):
+        self.failure_rate = failure_rate
+        self.min_requests = min_requests
+        self.max_blocks = max_blocks
+        self.window = window
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.max_trips = max_trips
+        self.logger = logger
+
+        self._circuits = {}  # domain -> circuit
+        self._trips = 0
+        self._probes = 0
+        self._skipped = 0
+
+    def _circuit(self, domain: str) -> Circuit:
+        circuit = self._circuits.get(domain)
+        if circuit is None:
+            circuit = Circuit(self.window)
+            self._circuits[domain] = circuit
+        return circuit
+
+    def _log(self, domain: str, circuit: Circuit, reason: str = ""):
+        if self.logger is not None:
+            self.logger.warning(
+                f"Circuit {domain}: {circuit.state} (trips: {circuit.trips}) {reason}")
+
+    def delay(self, domain: str, now: float):
+        """Returns the seconds until a domain may be requested again
+
+        None means that a probe is running and the domain has to wait for
+        its outcome.
+        """
+
+        circuit = self._circuits.get(domain)
+        if circuit is None or circuit.state == Circuit.CLOSED:
+            return 0.0
+        if circuit.state == Circuit.OPEN:
+            if now < circuit.open_until:
+                return circuit.open_until - now
+            circuit.state = Circuit.HALF_OPEN
+            self._log(domain, circuit)
+        return None if circuit.probing else 0.0
+
+    def started(self, domain: str) -> bool:
+        """Registers a request; returns True if it is the probe (HALF-OPEN state)"""
+        circuit = self._circuits.get(domain)
+        if circuit is not None and circuit.state == Circuit.HALF_OPEN:
+            circuit.probing = True
+            self._probes += 1
+            return True
+        return False
+
+    def finished(self, domain: str):
+        """Ends a probe whose outcome was never recorded"""
+        circuit = self._circuits.get(domain)
+        if circuit is not None:
+            circuit.probing = False
+
+    def record(self, domain: str, failure: str, now: float):
+        """Records the outcome of a request (failure is None on success)"""
+
+        circuit = self._circuit(domain)
+
+        if circuit.state == Circuit.HALF_OPEN and circuit.probing:
+            circuit.probing = False
+            if failure is None:
+                circuit.state = Circuit.CLOSED
+                circuit.outcomes.clear()
+                self._log(domain, circuit, "probe succeeded")
+            else:
+                self._trip(domain, circuit, now, f"probe failed: {failure}")
+            return
+
+        # Requests which were running when the circuit opened do not count
+        if circuit.state != Circuit.CLOSED:
+            return
+
+        circuit.outcomes.append(failure)
+        failures = [f for f in circuit.outcomes if f is not None]
+        blocks = failures.count(self.BLOCKED)
+
+        if blocks >= self.max_blocks:
+            self._trip(domain, circuit, now, f"{blocks} block pages")
+        elif (len(circuit.outcomes) >= self.min_requests
+              and len(failures) / len(circuit.outcomes) >= self.failure_rate):
+            self._trip(domain, circuit, now,
+                       f"{len(failures)}/{len(circuit.outcomes)} failed, last: {failure}")
+
+    def _trip(self, domain: str, circuit: Circuit, now: float, reason: str):
+        circuit.trips += 1
+        circuit.state = Circuit.OPEN
+        circuit.outcomes.clear()
+        cooldown = min(self.cooldown * 2 ** (circuit.trips - 1), self.max_cooldown)
+        circuit.open_until = now + cooldown
+        self._trips += 1
+        self._log(domain, circuit, f"for {cooldown:.0f}s, {reason}")
+
+    def exhausted(self, domain: str) -> bool:
+        """Returns True if the remaining tasks of a domain should be skipped"""
+        circuit = self._circuits.get(domain)
+        return (circuit is not None and self.max_trips > 0
+                and circuit.trips >= self.max_trips
+                and circuit.state == Circuit.OPEN)
+
+    def skipped(self, domain: str, count: int):
+        """Registers tasks which were dropped because of an exhausted domain"""
+        self._skipped += count
+        if self.logger is not None:
+            self.logger.warning(f"Circuit {domain}: skipped {count} tasks")
+
+    def metrics(self) -> dict:
+        """Returns counters and the domains which are not CLOSED"""
+        states = {d: c.state for d, c in self._circuits.items()
+                  if c.state != Circuit.CLOSED}
+        return {
+            "trips": self._trips,
+            "probes": self._probes,
+            "skipped": self._skipped,
+            "open": sum(s == Circuit.OPEN for s in states.values()),
+            "half_open": sum(s == Circuit.HALF_OPEN for s in states.values()),
+            "domains": states,
+        }
+
+
+# ---------------------------------------------------------------------------
+#                            SCHEDULER
+# ---------------------------------------------------------------------------
+
+
+class DomainScheduler:
+    """Thread-safe queue which hands out tasks per domain politeness rules"""
+
+    def __init__(
+        self,
+        rate: float = 0.5,  # requests per second and domain (0 equals no limit)
+        burst: float = 1,  # number of requests a domain may send at once
+        host_concurrency: int = 1,  # parallel requests per domain
+        max_pending: int = 0,  # 0 equals no limit
+        breaker: CircuitBreaker = None,
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.host_concurrency = host_concurrency
+        self.max_pending = max_pending
+        self.breaker = breaker
+
+        self._cond = Condition()
+        self._pending = {}  # domain -> deque of tasks
+        self._active = {}  # domain -> number of running tasks
+        self._buckets = {}  # domain -> token bucket
+        self._ready = []  # heap of (ready_at, seq, domain)
+        self._delayed = []  # heap of (due_at, seq, task) waiting for a retry
+        self._scheduled = set()  # domains which are in the heap
+        self._probes = set()  # ids of running tasks which probe a domain
+        self._waiters = deque()  # futures of idle coroutines (see aget)
+        self._timer_at = math.inf  # earliest time a waiting coroutine wakes up by itself
+        self._seq = itertools.count()
+        self._size = 0
+        self._running = 0
+        self._closed = False
+
+    def __len__(self):
+        return self._size
+
+    def domain(self, task) -> str:
+        """Returns the domain which is used to group a task"""
+        return getDomain(task["url"])
+
+    # ------------------- Producer -------------------
+
+    def put(self, task):
+        """Adds a task; blocks while the queue holds `max_pending` tasks"""
+
+        domain = self.domain(task)
+        with self._cond:
+            while self.max_pending and self._size - len(self._delayed) >= self.max_pending:
+                self._cond.wait()
+
+            # Domains which keep blocking get no new tasks
+            if self.breaker is not None and self.breaker.exhausted(domain):
+                self.breaker.skipped(domain, 1)
+                return
+
+            self._pending.setdefault(domain, deque()).append(task)
+            self._size += 1
+            self._schedule(domain, time.monotonic())
+            self._cond.notify_all()
+            self._wake()
+
+    def defer(self, task, delay: float):
+        """Adds a task again after `delay` seconds, e.g. to retry it
+
+        Waiting deferred tasks do not count against `max_pending`, so a
+        worker never blocks on its own retry.
+        """
+
+        with self._cond:
+            due_at = time.monotonic() + delay
+            heapq.heappush(self._delayed, (due_at, next(self._seq), task))
+            self._size += 1
+            self._cond.notify_all()
+            self._wake()
+
+    def close(self):
+        """Signals that no more tasks will be added"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            self._wake(len(self._waiters))
+
+    # ------------------- Consumer -------------------
+
+    def get(self):
+        """Returns the next task or None once all tasks are processed"""
+
+        with self._cond:
+            while True:
+                if self._finished():
+                    return None
+                task, wait = self._poll(time.monotonic())
+                if task is not None:
+                    return task
+                self._cond.wait(wait)
+
+    async def aget(self):
+        """Coroutine version of get() for the asyncio engine
+
+        Idle coroutines wait on futures which are resolved one at a time
+        when tasks are added or finished. Only the coroutine which would
+        wake up first also waits for the next ready time of a domain, and
+        whoever takes a task wakes the next waiter, which checks for further
+        ready tasks. The event loop therefore does not poll.
+        """
+
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._cond:
+                if self._finished():
+                    self._wake(len(self._waiters))
+                    return None
+                now = time.monotonic()
+                task, wait = self._poll(now)
+                if task is not None:
+                    self._wake()
+                    return task
+
+                waiter = loop.create_future()
+                self._waiters.append(waiter)
+                deadline = now + wait if wait is not None else math.inf
+                timed = deadline < self._timer_at
+                if timed:
+                    self._timer_at = deadline
+
+            try:
+                await asyncio.wait_for(waiter, wait if timed else None)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                with self._cond:
+                    if timed:
+                        if self._timer_at == deadline:
+                            self._timer_at = math.inf
+                        # A timed out waiter was never woken, so it is still queued
+                        try:
+                            self._waiters.remove(waiter)
+                        except ValueError:
+                            pass
+
+    def report(self, task, failure: str = None):
+        """Passes the outcome of a request to the circuit breaker
+
+        `failure` is None on success, otherwise a short reason (e.g. the
+        HTTP status code or CircuitBreaker.BLOCKED).
+        """
+
+        if self.breaker is None:
+            return
+
+        domain = self.domain(task)
+        with self._cond:
+            self.breaker.record(domain, failure, time.monotonic())
+
+            # Drop the tasks of domains which keep blocking
+            if self.breaker.exhausted(domain) and domain in self._pending:
+                count = len(self._pending.pop(domain))
+                self._size -= count
+                self.breaker.skipped(domain, count)
+                self._cond.notify_all()
+
+    def done(self, task):
+        """Marks a task as processed and frees its domain slot"""
+
+        domain = self.domain(task)
+        with self._cond:
+            self._active[domain] -= 1
+            if not self._active[domain]:
+                del self._active[domain]
+            self._running -= 1
+
+            # Ends a probe whose outcome was not reported (e.g. an error)
+            if id(task) in self._probes:
+                self._probes.discard(id(task))
+                self.breaker.finished(domain)
+            self._schedule(domain, time.monotonic())
+            self._cond.notify_all()
+            self._wake()
+
+    # ------------------- Internals -------------------
+
+    def _wake(self, count: int = 1):
+        """Wakes up to `count` waiting coroutines (from any thread)"""
+
+        while count > 0 and self._waiters:
+            waiter = self._waiters.popleft()
+            if waiter.done():
+                continue
+            waiter.get_loop().call_soon_threadsafe(_resolve, waiter)
+            count -= 1
+
+    def _finished(self) -> bool:
+        return self._closed and self._size == 0 and self._running == 0
+
+    def _bucket(self, domain: str) -> TokenBucket:
+        bucket = self._buckets.get(domain)
+        if bucket is None:
+            bucket = TokenBucket(self.rate, self.burst)
+            self._buckets[domain] = bucket
+        return bucket
+
+    def _schedule(self, domain: str, now: float):
+        """Puts a domain on the heap if it has tasks and a free slot"""
+
+        if domain in self._scheduled or not self._pending.get(domain):
+            return
+        if self._active.get(domain, 0) >= self.host_concurrency:
+            return
+
+        delay = self._bucket(domain).delay(now)
+        if self.breaker is not None:
+            hold = self.breaker.delay(domain, now)
+            if hold is None:
+                return  # rescheduled once the probe is done
+            delay = max(delay, hold)
+
+        ready_at = now + delay
+        heapq.heappush(self._ready, (ready_at, next(self._seq), domain))
+        self._scheduled.add(domain)
+
+    def _release(self, now: float):
+        """Moves deferred tasks which are due to their domain queue"""
+
+        while self._delayed and self._delayed[0][0] <= now:
+            _, _, task = heapq.heappop(self._delayed)
+            domain = self.domain(task)
+            if self.breaker is not None and self.breaker.exhausted(domain):
+                self._size -= 1
+                self.breaker.skipped(domain, 1)
+                continue
+            self._pending.setdefault(domain, deque()).append(task)
+            self._schedule(domain, now)
+
+    def _poll(self, now: float):
+        """Returns (task, None) or (None, seconds to wait or None)"""
+
+        self._release(now)
+        task, wait = self._take(now)
+
+        # Wake up in time for the next deferred task
+        if task is None and self._delayed:
+            due_in = self._delayed[0][0] - now
+            wait = due_in if wait is None else min(wait, due_in)
+        return task, wait
+
+    def _take(self, now: float):
+        """Returns the next task of a ready domain or the time to wait"""
+
+        while self._ready:
+            ready_at, _, domain = self._ready[0]
+            if ready_at > now:
+                return None, ready_at - now
+
+            heapq.heappop(self._ready)
+            self._scheduled.discard(domain)
+
+            # The domain may have no tasks left or may have tripped
+            if not self._pending.get(domain):
+                continue
+            bucket = self._bucket(domain)
+            hold = self.breaker.delay(domain, now) if self.breaker else 0.0
+            if bucket.delay(now) > 0 or hold != 0.0:
+                self._schedule(domain, now)
+                continue
+            # Take the oldest task of the domain
+            bucket.consume(now)
+            queue = self._pending[domain]
+            task = queue.popleft()
+            if self.breaker is not None and self.breaker.started(domain):
+                self._probes.add(id(task))
+            if not queue:
+                del self._pending[domain]
+            self._size -= 1
+            self._active[domain] = self._active.get(domain, 0) + 1
+            self._running += 1
+
+            self._schedule(domain, now)
+            self._cond.notify_all()
+            return task, None
+
+        return None, None
+
+
+def _resolve(waiter):
+    # Runs in the event loop; the waiter may have timed out in between
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+# ---------------------------------------------------------------------------
+#                            FEEDER
+# ---------------------------------------------------------------------------
+
+
+def feedScheduler(scheduler: DomainScheduler, tasks, logger):
+    """Puts all tasks of an iterable into the scheduler and closes it"""
+    try:
+        for task in tasks:
+            scheduler.put(task)
+    except Exception as e:
+        logger.error(f"Feeder:  {repr(e)}")
+    finally:
+        scheduler.close()
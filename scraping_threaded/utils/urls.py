@@ -0,0 +1,14 @@
+# ===========================================================================
+#                            URL Helpers
+# ===========================================================================
+
+from urllib.parse import urlsplit
+
+
+def getDomain(url: str) -> str:
+    """Returns the lowercase host of an URL without a leading 'www.'"""
+    try:
+        host = urlsplit(url).hostname or ""
+    except ValueError:
+        host = ""
+    return host[4:] if host.startswith("www.") else host